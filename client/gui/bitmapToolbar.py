@@ -1,4 +1,4 @@
-from PyQt5.QtWidgets import QWidget, QGridLayout, QSlider
+from PyQt5.QtWidgets import QWidget, QGridLayout, QSlider, QSpinBox, QCheckBox, QLabel
 from PyQt5.QtGui import QColor
 from PyQt5.QtCore import pyqtSlot
 from client.src.signals import Signals
@@ -15,6 +15,9 @@ from client.gui.toolSelector import ToolSelector
 # - self.colorPreview - ColorPreview, индикатор текущего выбранного цвета с кнопкой выбора другого цвета (не из палитры)
 # - self.widthSlider - QSlider - ползунок выбора толщины (ширины) кисти/карандаша/ручки, принимает значения от 1 до 32
 # - self.toolSelector - ToolSelector, выбор текущего инструмента для работы со слоем
+# - self.toleranceSpinBox - QSpinBox, поле выбора допуска заливки, принимает значения от 0 до 255
+# - self.contiguousCheckBox - QCheckBox, переключатель режима заливки: только связная область или замена цвета на всём
+# - - слое
 # Атрибуты:
 # - self.color - QColor, цвет заливки, кисти, карандаша, ручки, прямоугольника, прямой, эллипса
 # - self.width - int, толщина кисти, карандаша, ручки, прямоугольника, эллипса, прямой
@@ -24,6 +27,9 @@ from client.gui.toolSelector import ToolSelector
 # - - - 'brsh' - кисть. След кисти идёт по траектории движения мыши с опущенной ЛКМ. Форма следа округлая (Qt.RoundCap)
 # - - - 'pen' - ручка. То же, что и кисть, но с более угловатой формой следа (Qt.SquareCap)
 # - - - 'penc' - карандаш. То же, что и кисть, но с более отрывистой формой следа (Qt.FlatCap)
+# - - - 'soft' - мягкая кисть. След из отпечатков, плавно исчезающих к краю (см. client.src.brushEngine.py)
+# - - - 'airb' - аэрограф. След из частых полупрозрачных отпечатков
+# - - - 'txtr' - текстурная кисть. След из отпечатков с зернистой прозрачностью
 # - - - 'ersr'
 # - - - 'line' - отрезок. Соединяет отрезком точку нажания и точку отпускания ЛКМ.
 # - - - 'rect' - прямоугольник. Строит прямоугольник по диагонали, заданной пользователем как отрезок, соединяющий
@@ -31,6 +37,8 @@ from client.gui.toolSelector import ToolSelector
 # - - - 'oval' - эллипс. Строит эллипс, вписанный в прямоугольник, построенный описанным выше способом
 # - - - 'fill' - заливка. Меняет цвет области точек цвета точки, в которой была нажата ЛКМ. Область ограничена
 # - - - - точками другого цвета
+# - self.tolerance - int, допуск заливки: на сколько может отличаться каждый канал цвета заливаемых точек
+# - self.contiguous - bool, True - заливается только связная область, False - заменяется цвет на всём слое
 class BitmapToolbar(QWidget):
     # Инициализация интерфейса, подключение сигналов к слотам, объявление атрибутов класса
     def __init__(self) -> None:
@@ -54,23 +62,40 @@ class BitmapToolbar(QWidget):
         self.widthSlider.valueChanged.connect(self.updateValues)
 
         self.tool = 'none'
-        self.toolSelector = ToolSelector('Кисть', 'Ручка', 'Карандаш', 'Ластик', 'Отрезок', 'Прямоугольник', 'Эллипс', 'Заливка')
+        self.toolSelector = ToolSelector('Кисть', 'Ручка', 'Карандаш', 'Мягкая кисть', 'Аэрограф', 'Текстура',
+                                         'Ластик', 'Отрезок', 'Прямоугольник', 'Эллипс', 'Заливка')
         self.toolSelector.setIcons('../static/brush2.png', '../static/pen2.png', '../static/pencil2.png',
+                                   '../static/softBrush.png', '../static/airbrush.png', '../static/textureBrush.png',
                                    '../static/eraser.png', '../static/drawLine.png', '../static/drawRect.png',
                                    '../static/drawOval.png', '../static/bucket.png')
-        self.toolSelector.setStates('brsh', 'pen', 'penc', 'ersr', 'line', 'rect', 'oval', 'fill')
+        self.toolSelector.setStates('brsh', 'pen', 'penc', 'soft', 'airb', 'txtr', 'ersr', 'line', 'rect', 'oval',
+                                    'fill')
         self.toolSelector.signals.valueChanged.connect(self.updateValues)
 
-        self.layout.addWidget(self.colorPicker, 0, 0)
-        self.layout.addWidget(self.colorPreview, 0, 1)
-        self.layout.addWidget(self.widthSlider, 0, 2)
-        self.layout.addWidget(WidthPictogram(), 0, 3)
-        self.layout.addWidget(self.toolSelector, 0, 4)
+        self.tolerance = 0
+        self.toleranceSpinBox = QSpinBox()
+        self.toleranceSpinBox.setMinimum(0)
+        self.toleranceSpinBox.setMaximum(255)
+        self.toleranceSpinBox.valueChanged.connect(self.updateValues)
+
+        self.contiguous = True
+        self.contiguousCheckBox = QCheckBox('Только смежные')
+        self.contiguousCheckBox.setChecked(True)
+        self.contiguousCheckBox.stateChanged.connect(self.updateValues)
+
+        self.layout.addWidget(self.colorPicker, 0, 0, 3, 1)
+        self.layout.addWidget(self.colorPreview, 0, 1, 3, 1)
+        self.layout.addWidget(self.widthSlider, 0, 2, 3, 1)
+        self.layout.addWidget(WidthPictogram(), 0, 3, 3, 1)
+        self.layout.addWidget(self.toolSelector, 0, 4, 3, 1)
+        self.layout.addWidget(QLabel('Допуск заливки'), 0, 5)
+        self.layout.addWidget(self.toleranceSpinBox, 1, 5)
+        self.layout.addWidget(self.contiguousCheckBox, 2, 5)
 
     # Обновление состояния класса. Слот для сигналов valueChanged элементов графического интерфейса.
     # Если цвета self.colorPreview, self.colorPicker и self.color не совпадают, значит, цвет был изменен.
     # Цвет всех эл-ов меняется на самый новый, т.е. на тот, который имеет лишь 1 из 3 эл-ов.
-    # Также обновляется толщина и инструмент. Сообщается сигнал valueChanged
+    # Также обновляется толщина, инструмент и параметры заливки. Сообщается сигнал valueChanged
     @pyqtSlot()
     def updateValues(self) -> None:
         if self.colorPreview.color != self.color:
@@ -82,4 +107,6 @@ class BitmapToolbar(QWidget):
 
         self.width = self.widthSlider.value()
         self.tool = self.toolSelector.state
+        self.tolerance = self.toleranceSpinBox.value()
+        self.contiguous = self.contiguousCheckBox.isChecked()
         self.signals.valueChanged.emit()
@@ -12,8 +12,8 @@ from PyQt5.QtCore import QSize, Qt
 # - self.cloudSaveButton - QToolButton, кнопка сохранения проекта на сервере. Пока бездействует
 # - self.openButton - QToolButton, кнопка открытия проекта из локального хранилища. Нажатие вызывает parent.openFile()
 # - self.cloudOpenButton - QToolButton, кнопка открытия проекта с сервера. Пока бездействует
-# - self.undoButton - QToolButton, кнопка отмены последнего действия. Пока бездействует
-# - self.redoButton - QToolButton, кнопка возврата отмененного действия. Пока бездействует
+# - self.undoButton - QToolButton, кнопка отмены последнего действия. Нажатие вызывает parent.undo()
+# - self.redoButton - QToolButton, кнопка возврата отмененного действия. Нажатие вызывает parent.redo()
 # - self.resizeButton - QToolButton, кнопка изменения разрешения проекта. Нажатие вызывает parent.resizeFile()
 # где parent - это виджет главного окна, а не буквально родитель этого виджета
 class FileToolbar(QWidget):
@@ -67,14 +67,14 @@ class FileToolbar(QWidget):
         self.cloudOpenButton.setIcon(QIcon('../static/cloudOpenFile.png'))
 
         self.undoButton = QToolButton()
-        self.undoButton.setText('Убрать линию')
+        self.undoButton.setText('Отменить')
         self.undoButton.setToolButtonStyle(Qt.ToolButtonTextBesideIcon)
         self.undoButton.setAutoRaise(True)
         self.undoButton.setIconSize(QSize(64, 64))
         self.undoButton.setIcon(QIcon('../static/undo.png'))
 
         self.redoButton = QToolButton()
-        self.redoButton.setText('Вернуть линию')
+        self.redoButton.setText('Вернуть')
         self.redoButton.setToolButtonStyle(Qt.ToolButtonTextBesideIcon)
         self.redoButton.setAutoRaise(True)
         self.redoButton.setIconSize(QSize(64, 64))
@@ -4,6 +4,13 @@ from PyQt5.QtCore import Qt, pyqtSlot
 from client.src.signals import GridSignals
 
 
+# Наибольшее число колонок (строк), на которые можно разбить холст за раз
+MAX_DIVISIONS = 256
+
+# Наибольший промежуток между колонками (строками) в пикселях
+MAX_GUTTER = 4096
+
+
 # Виджет панели инструментов для манипуляции с сеткой. Набор сигналов - GridSignals.
 # Графические элементы:
 # - self.layout - QGridLayout, сетка выравнивания элементов панели
@@ -14,6 +21,10 @@ from client.src.signals import GridSignals
 # - self.vAddButton - QPushButton, кнопка добавления вертикальной линии сетки
 # - self.vDeleteButton - QPushButton, кнопка удаления выделенной в self.vList линии сетки
 # - self.vButtons - QButtonGroup, группа, объединяющая self.vPercentButton и vPixelButton
+# - self.vCountSpinBox - QSpinBox, поле выбора числа колонок, на которые разбивается холст вертикальными линиями
+# - self.vGutterSpinBox - QSpinBox, поле выбора промежутка между колонками в пикселях
+# - self.vDivideButton - QPushButton, кнопка разбиения холста на колонки (заменяет все вертикальные линии)
+# - self.vClearButton - QPushButton, кнопка удаления всех вертикальных линий
 # - self.hList - QListWidget, список горизонтальных линий сетки
 # - self.hSpinBox - QSpinBox, поле выбора отступа добавляемой горизонтальной линии от верхнего края в процентах/пикселях
 # - self.hPercentButton - QRadioButton, кнопка выбора процентов для задания отступа добавляемой горизонтальной линии
@@ -21,6 +32,10 @@ from client.src.signals import GridSignals
 # - self.hAddButton - QPushButton, кнопка добавления горизонтальной линии сетки
 # - self.hDeleteButton - QPushButton, кнопка удаления выделенной в self.hList линии сетки
 # - self.hButtons - QButtonGroup, группа, объединяющая self.hPercentButton и hPixelButton
+# - self.hCountSpinBox - QSpinBox, поле выбора числа строк, на которые разбивается холст горизонтальными линиями
+# - self.hGutterSpinBox - QSpinBox, поле выбора промежутка между строками в пикселях
+# - self.hDivideButton - QPushButton, кнопка разбиения холста на строки (заменяет все горизонтальные линии)
+# - self.hClearButton - QPushButton, кнопка удаления всех горизонтальных линий
 # Атрибуты:
 # - self.resolution - tuple(int, int), разрешение текущего проекта
 # - self.currentVIndentType - int, задает тип задания отступа добавляемой вертикальной линии сетки, принимает значения:
@@ -71,6 +86,27 @@ class GridToolbar(QWidget):
         self.layout.addWidget(self.vAddButton, 4, 1)
         self.layout.addWidget(self.vDeleteButton, 5, 1)
 
+        self.vCountSpinBox = QSpinBox()
+        self.vCountSpinBox.setRange(1, MAX_DIVISIONS)
+        self.vCountSpinBox.setValue(12)
+        self.vCountSpinBox.setPrefix('Колонок: ')
+
+        self.vGutterSpinBox = QSpinBox()
+        self.vGutterSpinBox.setRange(0, MAX_GUTTER)
+        self.vGutterSpinBox.setPrefix('Промежуток: ')
+        self.vGutterSpinBox.setSuffix(' px')
+
+        self.vDivideButton = QPushButton('Разбить')
+        self.vDivideButton.clicked.connect(self.divideV)
+
+        self.vClearButton = QPushButton('Удалить все')
+        self.vClearButton.clicked.connect(self.clearV)
+
+        self.layout.addWidget(self.vCountSpinBox, 6, 0)
+        self.layout.addWidget(self.vDivideButton, 6, 1)
+        self.layout.addWidget(self.vGutterSpinBox, 7, 0)
+        self.layout.addWidget(self.vClearButton, 7, 1)
+
         self.hList = QListWidget()
 
         self.hSpinBox = QSpinBox()
@@ -99,6 +135,27 @@ class GridToolbar(QWidget):
         self.layout.addWidget(self.hAddButton, 4, 3)
         self.layout.addWidget(self.hDeleteButton, 5, 3)
 
+        self.hCountSpinBox = QSpinBox()
+        self.hCountSpinBox.setRange(1, MAX_DIVISIONS)
+        self.hCountSpinBox.setValue(12)
+        self.hCountSpinBox.setPrefix('Строк: ')
+
+        self.hGutterSpinBox = QSpinBox()
+        self.hGutterSpinBox.setRange(0, MAX_GUTTER)
+        self.hGutterSpinBox.setPrefix('Промежуток: ')
+        self.hGutterSpinBox.setSuffix(' px')
+
+        self.hDivideButton = QPushButton('Разбить')
+        self.hDivideButton.clicked.connect(self.divideH)
+
+        self.hClearButton = QPushButton('Удалить все')
+        self.hClearButton.clicked.connect(self.clearH)
+
+        self.layout.addWidget(self.hCountSpinBox, 6, 2)
+        self.layout.addWidget(self.hDivideButton, 6, 3)
+        self.layout.addWidget(self.hGutterSpinBox, 7, 2)
+        self.layout.addWidget(self.hClearButton, 7, 3)
+
     # Обновление типа отступа добавляемой вертикальной линии сетки. Слот сигнала self.vButtons.buttonClicked
     @pyqtSlot(QAbstractButton)
     def updateVIndentType(self, button: QRadioButton) -> None:
@@ -163,6 +220,23 @@ class GridToolbar(QWidget):
         for i in lines:
             self.hList.addItem(i)
 
+    # Задание списков линий сетки извне. Вызывается родительским классом, когда линии сетки изменились не через панель
+    # инструментов (например, при отмене действия). Формат линий - как в client.src.gridLayer.py. Линии по краям
+    # изображения ((1, 0) и (1, 100)) есть у сетки всегда и в списки панели не попадают
+    def setLines(self, hLines: list, vLines: list) -> None:
+        hLines = [tuple(line) for line in hLines if tuple(line) not in {(1, 0), (1, 100)}]
+        vLines = [tuple(line) for line in vLines if tuple(line) not in {(1, 0), (1, 100)}]
+
+        self.hList.clear()
+        for indentType, indent in hLines:
+            self.hList.addItem(f"{indent} %" if indentType == 1 else f"{indent} px")
+        self.vList.clear()
+        for indentType, indent in vLines:
+            self.vList.addItem(f"{indent} %" if indentType == 1 else f"{indent} px")
+
+        self.sortV()
+        self.sortH()
+
     # Удаление вертикальной линии сетки. Слот сигнала self.vDeleteButton.clicked. Сообщает сигнал signals.deleted
     @pyqtSlot()
     def deleteVLine(self) -> None:
@@ -182,3 +256,28 @@ class GridToolbar(QWidget):
         selectedItemText = self.hList.currentItem().text()
         self.hList.takeItem(self.hList.currentRow())
         self.signals.deleted.emit(0, 0 if selectedItemText[-1] == 'x' else 1, int(selectedItemText.split()[0]))
+
+    # Разбиение холста на равные колонки. Слот сигнала self.vDivideButton.clicked. Сообщает сигнал signals.divided;
+    # список вертикальных линий панели обновляет родительский класс после изменения сетки (см. self.setLines)
+    @pyqtSlot()
+    def divideV(self) -> None:
+        self.signals.divided.emit(1, self.vCountSpinBox.value(), self.vGutterSpinBox.value())
+
+    # Разбиение холста на равные строки. Слот сигнала self.hDivideButton.clicked. Сообщает сигнал signals.divided
+    @pyqtSlot()
+    def divideH(self) -> None:
+        self.signals.divided.emit(0, self.hCountSpinBox.value(), self.hGutterSpinBox.value())
+
+    # Удаление всех вертикальных линий сетки. Слот сигнала self.vClearButton.clicked. Сообщает сигнал
+    # signals.rangeDeleted с диапазоном во всю ширину холста
+    @pyqtSlot()
+    def clearV(self) -> None:
+        self.vList.clear()
+        self.signals.rangeDeleted.emit(1, 0, self.resolution[0])
+
+    # Удаление всех горизонтальных линий сетки. Слот сигнала self.hClearButton.clicked. Сообщает сигнал
+    # signals.rangeDeleted с диапазоном во всю высоту холста
+    @pyqtSlot()
+    def clearH(self) -> None:
+        self.hList.clear()
+        self.signals.rangeDeleted.emit(0, 0, self.resolution[1])
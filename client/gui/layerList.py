@@ -7,7 +7,8 @@ from client.gui.layerListItem import LayerListItem
 
 # Виджет списка слоёв для удобной манипуляции (скрытия, перемещения по высоте, ...) пользователем.
 # Набор сигналов - LayerSignals. Поддерживает те же переменные для контроля к-ва и положения слоёв,
-# что и Window, для удобства обращения к ним.
+# что и Window, для удобства обращения к ним. Слои в списке и в сигналах обозначаются их идентификаторами в реестре
+# слоёв Window.registry (см. client.src.layerRegistry.py), которые не меняются при удалении других слоёв
 # Графические элементы:
 # - self.outerLayout - QGridLayout, выравнивает объекты LayerListItem по сетке. В него входят:
 # - - self.newBitmapButton
@@ -32,6 +33,7 @@ from client.gui.layerListItem import LayerListItem
 # - - класс, поддерживающий самое высокое значение self.z у любого из слоёв за все время
 # - - (т.е. удаленные слои тоже считаются). Это нужно для нахождения "безопасного" значения self.z для нового слоя
 # - self.layerCount - int, текущее к-во слоев
+# - self.items - dict(int, LayerListItem), элементы списка по идентификатору слоя
 class LayerList(QWidget):
     # Инициализация графических элементов и атрибутов
     def __init__(self, parent: QWidget) -> None:
@@ -80,6 +82,7 @@ class LayerList(QWidget):
 
         self.highestZ = 0
         self.layerCount = 0
+        self.items = dict()
 
         self.setAutoFillBackground(True)
         palette = self.palette()
@@ -88,81 +91,78 @@ class LayerList(QWidget):
 
     # Функция добавления нового растрового слоя ("холста"). При загрузке из файла (заполнены опциональные параметры)
     # восстанавливает все атрибуты из него, иначе добавляет слой выше остальных (на передний план).
-    # Обновляет переменные состояния, подключает сигналы к слотам. Вызывается родительским классом
-    def newBitmapLayer(self, z=-1, index=-1, name='') -> None:
-        if index == -1:
-            self.layout.addWidget(LayerListItem(
-                f'Холст ' + str(self.highestZ - 1), 'bmp', self.highestZ, self.layerCount))
+    # index - идентификатор слоя в реестре слоёв. Обновляет переменные состояния, подключает сигналы к слотам.
+    # Вызывается родительским классом
+    def newBitmapLayer(self, index: int, z=-1, name='') -> None:
+        if z == -1:
+            self.addItem(LayerListItem(f'Холст ' + str(self.highestZ - 1), 'bmp', self.highestZ, index))
         else:
-            self.layout.addWidget(LayerListItem(name if name != '' else f'Холст ' + str(self.highestZ - 1),
-                                                'bmp', z, index))
-        self.layerCount += 1
+            self.addItem(LayerListItem(name if name != '' else f'Холст ' + str(self.highestZ - 1), 'bmp', z, index))
         self.highestZ += 1
         self.connectNewItem()
 
     # Функция добавления нового слоя-картинки. При загрузке из файла (заполнены опциональные параметры)
     # восстанавливает все атрибуты из него, иначе добавляет слой выше остальных (на передний план).
-    # Обновляет переменные состояния, подключает сигналы к слотам. Вызывается родительским классом
-    def newImageLayer(self, z=-1, index=-1, name='') -> None:
-        if index == -1:
-            self.layout.addWidget(LayerListItem(
-                f'Картинка ' + str(self.highestZ - 1), 'img', self.highestZ, self.layerCount))
+    # index - идентификатор слоя в реестре слоёв. Обновляет переменные состояния, подключает сигналы к слотам.
+    # Вызывается родительским классом
+    def newImageLayer(self, index: int, z=-1, name='') -> None:
+        if z == -1:
+            self.addItem(LayerListItem(f'Картинка ' + str(self.highestZ - 1), 'img', self.highestZ, index))
         else:
-            self.layout.addWidget(LayerListItem(name if name != '' else f'Картинка ' + str(self.highestZ - 1),
-                                                'img', z, index))
-        self.layerCount += 1
+            self.addItem(LayerListItem(name if name != '' else f'Картинка ' + str(self.highestZ - 1), 'img', z, index))
         self.highestZ += 1
         self.connectNewItem()
 
     # Функция добавления нового фигурного слоя. При загрузке из файла (заполнены опциональные параметры)
     # восстанавливает все атрибуты из него, иначе добавляет слой выше остальных (на передний план).
-    # Обновляет переменные состояния, подключает сигналы к слотам. Вызывается родительским классом
-    def newShapeLayer(self, z=-1, index=-1, name='') -> None:
-        if index == -1:
-            self.layout.addWidget(LayerListItem(
-                f'Фигура ' + str(self.highestZ - 1), 'shp', self.highestZ, self.layerCount))
+    # index - идентификатор слоя в реестре слоёв. Обновляет переменные состояния, подключает сигналы к слотам.
+    # Вызывается родительским классом
+    def newShapeLayer(self, index: int, z=-1, name='') -> None:
+        if z == -1:
+            self.addItem(LayerListItem(f'Фигура ' + str(self.highestZ - 1), 'shp', self.highestZ, index))
         else:
-            self.layout.addWidget(LayerListItem(name if name != '' else f'Фигура ' + str(self.highestZ - 1),
-                                                'shp', z, index))
-        self.layerCount += 1
+            self.addItem(LayerListItem(name if name != '' else f'Фигура ' + str(self.highestZ - 1), 'shp', z, index))
         self.highestZ += 1
         self.connectNewItem()
 
     # Функция добавления нового текстового слоя. При загрузке из файла (заполнены опциональные параметры)
     # восстанавливает все атрибуты из него, иначе добавляет слой выше остальных (на передний план).
-    # Обновляет переменные состояния, подключает сигналы к слотам. Вызывается родительским классом
-    def newTextLayer(self, z=-1, index=-1, name='') -> None:
-        if index == -1:
-            self.layout.addWidget(LayerListItem(
-                f'Надпись ' + str(self.highestZ - 1), 'txt', self.highestZ, self.layerCount))
+    # index - идентификатор слоя в реестре слоёв. Обновляет переменные состояния, подключает сигналы к слотам.
+    # Вызывается родительским классом
+    def newTextLayer(self, index: int, z=-1, name='') -> None:
+        if z == -1:
+            self.addItem(LayerListItem(f'Надпись ' + str(self.highestZ - 1), 'txt', self.highestZ, index))
         else:
-            self.layout.addWidget(LayerListItem(name if name != '' else f'Надпись ' + str(self.highestZ - 1),
-                                                'txt', z, index))
-        self.layerCount += 1
+            self.addItem(LayerListItem(name if name != '' else f'Надпись ' + str(self.highestZ - 1), 'txt', z, index))
         self.highestZ += 1
         self.connectNewItem()
 
     # Функция подключения графических элементов нового LayerListItem к соответствующим слотам. Вызывается при добавлении
     # любого динамического слоя (холста, картинки, фигуры, текстового). Вызывается самим классом LayerList
     def connectNewItem(self) -> None:
-        self.layout.itemAt(self.layerCount - 1).widget().signals.activated.connect(self.activateLayer)
-        self.layout.itemAt(self.layerCount - 1).widget().signals.deactivated.connect(self.deactivateLayer)
-        self.layout.itemAt(self.layerCount - 1).widget().signals.shown.connect(self.showLayer)
-        self.layout.itemAt(self.layerCount - 1).widget().signals.hidden.connect(self.hideLayer)
-        self.layout.itemAt(self.layerCount - 1).widget().signals.movedUp.connect(self.moveUpLayer)
-        self.layout.itemAt(self.layerCount - 1).widget().signals.movedDown.connect(self.moveDownLayer)
-        self.layout.itemAt(self.layerCount - 1).widget().signals.deleted.connect(self.deleteLayer)
-        self.activateLayer(self.layerCount - 1)
-        self.layout.itemAt(self.layerCount - 1).widget().active = True
-        self.layout.itemAt(self.layerCount - 1).widget().updatePalette()
+        item = self.layout.itemAt(self.layerCount - 1).widget()
+        item.signals.activated.connect(self.activateLayer)
+        item.signals.deactivated.connect(self.deactivateLayer)
+        item.signals.shown.connect(self.showLayer)
+        item.signals.hidden.connect(self.hideLayer)
+        item.signals.movedUp.connect(self.moveUpLayer)
+        item.signals.movedDown.connect(self.moveDownLayer)
+        item.signals.deleted.connect(self.deleteLayer)
+        self.activateLayer(item.index)
+        item.active = True
+        item.updatePalette()
+
+    # Добавление элемента item в конец (наверх) списка. Вызывается самим классом LayerList
+    def addItem(self, item: LayerListItem) -> None:
+        self.layout.addWidget(item)
+        self.items[item.index] = item
+        self.layerCount += 1
 
     # Функция создания и подключения нового статического слоя (фона, сетки). Таким слоям присвоены определенные
     # параметры, неизменные на протяжении всей работы с файлом (у фона z=0, у сетки z=1024), они передаются в функцию
-    # создания как аргументы. Вызывается родительским классом
-    def newStaticLayer(self, name: str, z: int) -> None:
-        self.layout.addWidget(LayerListItem(
-            name, 'stl', z, self.layerCount, static=True))
-        self.layerCount += 1
+    # создания как аргументы вместе с идентификатором слоя. Вызывается родительским классом
+    def newStaticLayer(self, name: str, z: int, index: int) -> None:
+        self.addItem(LayerListItem(name, 'stl', z, index, static=True))
         self.highestZ += 1
         self.layout.itemAt(self.layerCount - 1).widget().signals.shown.connect(self.showLayer)
         self.layout.itemAt(self.layerCount - 1).widget().signals.hidden.connect(self.hideLayer)
@@ -214,12 +214,7 @@ class LayerList(QWidget):
     # Функция перемещения слоя выше в списке. Слот сигнала LayerListItem.movedUp
     @pyqtSlot(int)
     def moveUpLayer(self, index: int) -> None:
-        # Слой с таким индексом на сцене ищется среди всех за линейное время
-        inListIndex = -1
-        for i in range(self.layerCount):
-            if self.layout.itemAt(i).widget().index == index:
-                inListIndex = i
-                break
+        inListIndex = self.layout.indexOf(self.items[index])
 
         # Если слой и так выше всех, то есть имеет наибольший возможный индекс в списке, нельзя переместить => выходим
         if inListIndex == self.layerCount - 1:
@@ -239,9 +234,11 @@ class LayerList(QWidget):
         self.layout.itemAt(inListIndex).widget().z, self.layout.itemAt(inListIndex + 1).widget().z = \
             self.layout.itemAt(inListIndex + 1).widget().z, self.layout.itemAt(inListIndex).widget().z
 
-        # Распаковкой кортежа меняются местами индексы слоев на сцене
+        # Распаковкой кортежа меняются местами идентификаторы слоев
         self.layout.itemAt(inListIndex).widget().index, self.layout.itemAt(inListIndex + 1).widget().index = \
             self.layout.itemAt(inListIndex + 1).widget().index, self.layout.itemAt(inListIndex).widget().index
+        self.items[self.layout.itemAt(inListIndex).widget().index] = self.layout.itemAt(inListIndex).widget()
+        self.items[self.layout.itemAt(inListIndex + 1).widget().index] = self.layout.itemAt(inListIndex + 1).widget()
 
         # Распаковкой кортежа меняются местами типы слоев
         self.layout.itemAt(inListIndex).widget().type, self.layout.itemAt(inListIndex + 1).widget().type = \
@@ -265,12 +262,7 @@ class LayerList(QWidget):
     # Функция перемещения слоя ниже в списке. Слот сигнала LayerListItem.movedDown
     @pyqtSlot(int)
     def moveDownLayer(self, index: int) -> None:
-        # Слой с таким индексом на сцене ищется среди всех за линейное время
-        inListIndex = -1
-        for i in range(self.layerCount):
-            if self.layout.itemAt(i).widget().index == index:
-                inListIndex = i
-                break
+        inListIndex = self.layout.indexOf(self.items[index])
 
         # Если слой и так ниже всех, то есть имеет наименьший возможный индекс в списке, нельзя переместить => выходим
         if inListIndex == 2:
@@ -290,9 +282,11 @@ class LayerList(QWidget):
         self.layout.itemAt(inListIndex).widget().z, self.layout.itemAt(inListIndex - 1).widget().z = \
             self.layout.itemAt(inListIndex - 1).widget().z, self.layout.itemAt(inListIndex).widget().z
 
-        # Распаковкой кортежа меняются местами индексы слоев на сцене
+        # Распаковкой кортежа меняются местами идентификаторы слоев
         self.layout.itemAt(inListIndex).widget().index, self.layout.itemAt(inListIndex - 1).widget().index = \
             self.layout.itemAt(inListIndex - 1).widget().index, self.layout.itemAt(inListIndex).widget().index
+        self.items[self.layout.itemAt(inListIndex).widget().index] = self.layout.itemAt(inListIndex).widget()
+        self.items[self.layout.itemAt(inListIndex - 1).widget().index] = self.layout.itemAt(inListIndex - 1).widget()
 
         # Распаковкой кортежа меняются местами типы слоев
         self.layout.itemAt(inListIndex).widget().type, self.layout.itemAt(inListIndex - 1).widget().type = \
@@ -313,25 +307,16 @@ class LayerList(QWidget):
         # Сигналом swappedLayers сообщается необходимость поменять 2 слоя местами на сцене
         self.signals.swappedLayers.emit(index, self.layout.itemAt(inListIndex).widget().index)
 
-    # Фунция удаления слоя. Обновляет номер текущего слоя, если удаляется он, ищет индекс в сетке, обновляет атрибуты
-    # класса. Слот сигнала LayerListItem.deleted, также вызывается для всех слоёв самим классом при работе self.clear.
-    # Сообщает сигнал self.deleted
+    # Фунция удаления слоя. Снимает выделение, если удаляется текущий слой, обновляет атрибуты класса. Идентификаторы
+    # остальных слоёв не меняются. Слот сигнала LayerListItem.deleted, также вызывается для всех слоёв самим классом
+    # при работе self.clear. Сообщает сигнал self.deleted
     @pyqtSlot(int)
     def deleteLayer(self, index: int) -> None:
         if self.parent.currentLayer == index:
             self.signals.deactivated.emit(index)
-        elif self.parent.currentLayer > index:
-            self.parent.currentLayer -= 1
-
-        inListIndex = -1
-        for i in range(self.layerCount):
-            if self.layout.itemAt(i).widget().index == index:
-                inListIndex = i
-            elif self.layout.itemAt(i).widget().index > index:
-                self.layout.itemAt(i).widget().index -= 1
 
         self.layerCount -= 1
-        deletedWidget = self.layout.itemAt(inListIndex).widget()
+        deletedWidget = self.items.pop(index)
         self.layout.removeWidget(deletedWidget)
 
         self.signals.deleted.emit(index)
@@ -339,14 +324,13 @@ class LayerList(QWidget):
     # Фунция очистки (удаления всех слоёв). Вызывается родительским классом при открытии проекта или создании нового
     def clear(self) -> None:
         self.deactivateLayer(0)
-        for i in range(self.layerCount - 1, -1, -1):
-            self.deleteLayer(i)
+        for index in list(self.items):
+            self.deleteLayer(index)
         self.highestZ = 0
 
     # Функция получения названия слоя. Вызывается родительским классом при сохранении проекта
     def getName(self, index: int) -> str:
-        for i in range(self.layerCount):
-            if self.layout.itemAt(i).widget().index == index:
-                return self.layout.itemAt(i).widget().nameField.text()
+        if index in self.items:
+            return self.items[index].nameField.text()
 
         return ''
@@ -20,8 +20,8 @@ from client.src.signals import LayerSignals
 # Атрибуты:
 # - self.z - int, высота слоя, т.е. положение по оси аппликат. Определяет отображение слоя над/под другими слоями.
 # - - Чем больше self.z, тем "ближе к экрану" слой
-# - self.index - int, индекс слоя в индексации Window.currentLayer, т.е. индекс слоя в self.index на 1 меньше
-# - - индекса в Window.scene
+# - self.index - int, идентификатор слоя в реестре слоёв Window.registry (в той же нумерации, что и
+# - - Window.currentLayer)
 # - self.type - str, тип слоя (растровый, фигурный, ...). Принимает значения:
 # - - 'bmp' - растровый ("холст")
 # - - 'img' - картинка
@@ -1,34 +1,55 @@
-from PyQt5.QtWidgets import QWidget
-from PyQt5.QtGui import QPixmap, QPainter, QPaintEvent
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QStyleOptionGraphicsItem
+from PyQt5.QtGui import QPixmap, QPainter, QColor, QBrush
+from PyQt5.QtCore import QPointF
+from layerItem import LayerItem
 
 
-# Класс фонового слоя. Сигналов не сообщает
+# Сторона клетки шахматного фона в точках экрана
+CHECKER_SIZE = 8
+
+# Цвета светлых и тёмных клеток шахматного фона
+CHECKER_LIGHT = QColor(255, 255, 255)
+CHECKER_DARK = QColor(204, 204, 204)
+
+
+# Класс фонового слоя. Сигналов не сообщает. Фон - шахматная доска, по которой прозрачные области отличимы, например,
+# от белой заливки. Доска рисуется в координатах экрана кистью из маленькой плитки (2 x 2 клетки), поэтому размер клеток
+# не зависит ни от масштаба отображения, ни от разрешения проекта, а сам слой не хранит картинку размером с холст
 # Атрибуты:
 # - self.active - bool, определяет, является ли слой выделенным (в случае с этим типом слоёв не играет никакой роли, ибо
 # - - слой статический)
-# - self.pixmap - QPixmap, фоновое изображение, необходимо, чтобы фон был отличим, например, от белой заливки
-class BackgroundLayer(QWidget):
-    # Инициализация атрибутов, задание разрешения, изменение фона на прозрачный
-    def __init__(self, width, height) -> None:
-        super().__init__()
+class BackgroundLayer(LayerItem):
+    # Плитка шахматной доски, общая для всех фоновых слоёв (создаётся при создании первого из них)
+    tile = None
 
-        self.setMinimumSize(width, height)
-        self.setMaximumSize(width, height)
+    # Инициализация атрибутов, задание разрешения
+    def __init__(self, width, height) -> None:
+        super().__init__(width, height)
 
         self.active = False
 
-        self.pixmap = QPixmap("../../checkerboard.png").scaled(width, height, aspectRatioMode=Qt.IgnoreAspectRatio)
+        if BackgroundLayer.tile is None:
+            BackgroundLayer.tile = QPixmap(2 * CHECKER_SIZE, 2 * CHECKER_SIZE)
+            BackgroundLayer.tile.fill(CHECKER_LIGHT)
+            qp = QPainter(BackgroundLayer.tile)
+            qp.fillRect(CHECKER_SIZE, 0, CHECKER_SIZE, CHECKER_SIZE, CHECKER_DARK)
+            qp.fillRect(0, CHECKER_SIZE, CHECKER_SIZE, CHECKER_SIZE, CHECKER_DARK)
+            qp.end()
+
+    # Отрисовка слоя. Перерисовываемая (видимая) часть холста переводится в координаты экрана и заливается кистью из
+    # плитки. Начало кисти - левый верхний угол холста на экране, поэтому при прокрутке доска движется вместе с холстом
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget=None) -> None:
+        transform = painter.worldTransform()
+        rect = transform.mapRect(option.exposedRect.intersected(self.boundingRect()))
 
-    # Отрисовка слоя
-    def paintEvent(self, event: QPaintEvent) -> None:
-        qp = QPainter(self)
-        qp.drawPixmap(0, 0, self.pixmap)
+        painter.save()
+        painter.resetTransform()
+        painter.setBrushOrigin(transform.map(QPointF(0, 0)))
+        painter.fillRect(rect, QBrush(self.tile))
+        painter.restore()
 
     # Задание нового разрешения. Вызывается родительским классом Window при изменении разрешения проекта
     # параметр stretch ничего не задаёт, ибо фоновое изображение всегда должно заполнять всю рабочую область
     def setResolution(self, width: int, height: int, stretch: bool) -> None:
-        self.setMinimumSize(width, height)
-        self.setMaximumSize(width, height)
-        self.pixmap = QPixmap("../../checkerboard.png").scaled(width, height, aspectRatioMode=Qt.IgnoreAspectRatio)
-        self.repaint()
+        self.resize(width, height)
+        self.update()
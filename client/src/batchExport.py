@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Окна не показываются: Qt работает с платформой offscreen (если платформа не задана явно)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication
+from projectFile import exportLayers, readProject
+from compositor import composite
+
+
+# В этом файле описан пакетный экспорт проектов .gri в изображения из командной строки, без окна программы. Каждый
+# проект открывается, сводится и сохраняется так же, как при экспорте из окна (см. Window.exportFile), отдельной
+# задачей в пуле процессов. Пример запуска:
+#     python batchExport.py -o out -f png -r report.json projects/*.gri
+# По завершении выводится (или записывается в файл) отчёт в формате JSON:
+# - files - int, число проектов
+# - succeeded - int, число успешно экспортированных проектов
+# - failed - int, число проектов, экспортировать которые не удалось
+# - jobs - int, число процессов
+# - threads - int, число потоков сведения в каждом процессе
+# - time - float, общее время работы в секундах
+# - results - list, отчёты по каждому проекту в порядке перечисления файлов (см. exportProject)
+
+
+# Форматы изображений, в которые экспортируются проекты
+EXPORT_FORMATS = ('png', 'jpg', 'bmp')
+
+# Число процессов по умолчанию
+BATCH_WORKERS = os.cpu_count() or 4
+
+
+# Подготовка процесса пула: элементам текстовых слоёв нужен созданный QApplication
+def initWorker() -> None:
+    global application
+    application = QApplication.instance() or QApplication(['batchExport'])
+
+
+# Экспорт проекта из файла path в изображение outputPath (формат определяется расширением). Слои сводятся в threads
+# потоках. Ошибки не выбрасываются, а записываются в отчёт. Возвращает отчёт - словарь с ключами:
+# - file - str, путь к файлу проекта
+# - output - str, путь к изображению
+# - status - str, 'ok' или 'error'
+# - error - str, описание ошибки (только если status = 'error')
+# - width, height - int, разрешение проекта
+# - layers - int, число сведённых слоёв
+# - timings - dict, время этапов в секундах: read - чтение и разбор описания проекта, build - восстановление слоёв
+# - - (у двоичного контейнера - вместе с чтением картинок), composite - сведение, save - кодирование и запись
+# - - изображения, total - всего
+def exportProject(path: str, outputPath: str, threads: int) -> dict:
+    report = {'file': path, 'output': outputPath, 'status': 'ok'}
+    timings = dict()
+    start = time.perf_counter()
+    stage = start
+
+    # Отметка окончания этапа name
+    def mark(name: str) -> None:
+        nonlocal stage
+        now = time.perf_counter()
+        timings[name] = now - stage
+        stage = now
+
+    try:
+        jsonObject, blob = readProject(path)
+        mark('read')
+
+        layers = exportLayers(jsonObject, blob=blob)
+        mark('build')
+
+        image = composite(layers, jsonObject['width'], jsonObject['height'], threads)
+        mark('composite')
+
+        if not image.save(outputPath):
+            raise OSError(f'не удалось записать изображение {outputPath}')
+        mark('save')
+
+        report['width'], report['height'] = jsonObject['width'], jsonObject['height']
+        report['layers'] = len(layers)
+    except Exception as error:
+        report['status'] = 'error'
+        report['error'] = f'{type(error).__name__}: {error}'
+
+    timings['total'] = time.perf_counter() - start
+    report['timings'] = timings
+    return report
+
+
+# Путь к изображению для проекта path: с тем же именем, в папке outputDir (None - рядом с проектом)
+def outputPath(path: str, outputDir, imageFormat: str) -> str:
+    name = os.path.splitext(os.path.basename(path))[0] + '.' + imageFormat
+    return os.path.join(outputDir if outputDir is not None else os.path.dirname(path), name)
+
+
+# Разбор аргументов командной строки, экспорт всех проектов и вывод отчёта. Возвращает код завершения: 0 - все
+# проекты экспортированы, 1 - хотя бы один не удалось
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Пакетный экспорт проектов GrImage (.gri) в изображения без окна')
+    parser.add_argument('files', nargs='+', help='файлы проектов')
+    parser.add_argument('-o', '--output-dir', default=None, help='папка для изображений (по умолчанию - рядом с '
+                                                                 'проектами)')
+    parser.add_argument('-f', '--format', choices=EXPORT_FORMATS, default='png', help='формат изображений')
+    parser.add_argument('-j', '--jobs', type=int, default=BATCH_WORKERS, help='число процессов')
+    parser.add_argument('-t', '--threads', type=int, default=None,
+                        help='число потоков сведения в каждом процессе (по умолчанию ядра делятся между процессами)')
+    parser.add_argument('-r', '--report', default='-', help='файл отчёта JSON ("-" - стандартный вывод)')
+    args = parser.parse_args(argv)
+
+    jobs = max(1, min(args.jobs, len(args.files)))
+    threads = args.threads if args.threads is not None else max(1, BATCH_WORKERS // jobs)
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    results = [None] * len(args.files)
+    # Процессы запускаются заново (spawn), а не копируются: Qt не поддерживает fork
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=initWorker) as executor:
+        futures = {executor.submit(exportProject, path, outputPath(path, args.output_dir, args.format), threads): i
+                   for i, path in enumerate(args.files)}
+        for future in as_completed(futures):
+            report = future.result()
+            results[futures[future]] = report
+            print(f"{report['status']:5} {report['timings']['total']:8.3f} с  {report['file']} -> {report['output']}"
+                  + (f"  ({report['error']})" if report['status'] == 'error' else ''), file=sys.stderr)
+
+    failed = sum(report['status'] != 'ok' for report in results)
+    summary = {'files': len(results), 'succeeded': len(results) - failed, 'failed': failed, 'jobs': jobs,
+               'threads': threads, 'time': time.perf_counter() - start, 'results': results}
+
+    if args.report == '-':
+        print(json.dumps(summary, indent=4, ensure_ascii=False))
+    else:
+        with open(args.report, 'w') as file:
+            json.dump(summary, file, indent=4, ensure_ascii=False)
+
+    return 1 if failed else 0
+
+
+# Запуск пакетного экспорта
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,10 @@
-from PyQt5.QtWidgets import QWidget
-from PyQt5.QtGui import QImage, QColor, QPainter, QPen, QPalette, QBrush, QPaintEvent, QMouseEvent
-from PyQt5.QtCore import Qt, QPoint
-from collections import deque
+from PyQt5.QtWidgets import QWidget, QStyleOptionGraphicsItem
+from PyQt5.QtGui import QColor, QPainter, QPen, QMouseEvent, qPremultiply
+from PyQt5.QtCore import Qt, QPoint, QRect, QRectF
+from tiledBitmap import TiledBitmap
+from strokeSession import StrokeSession
+from layerItem import LayerItem
+from mipmap import MipPyramid
 
 
 # Класс растрового слоя. Сигналов не сообщает.
@@ -9,21 +12,28 @@ from collections import deque
 # - self.parent - QWidget, ссылка на родительский виджет (Window).
 # - - Используется для передачи нажатий на активный слой, т.к. напрямую это делать затратно
 # - self.resolution - (int, int), разрешение слоя, а равно и всего проекта
-# - self.bitmap - QImage, содержимое слоя. Используется для рисования на слое инструментами QPainter
-# - self.fastBitmap - str, содержимое слоя. Используется для быстрого прямого доступа к точкам (инструментом заливки).
-# - - Обновляется по требованию, т.е. в начале процедуры заливки
+# - self.bitmap - TiledBitmap, содержимое слоя, хранящееся плитками (см. tiledBitmap.py). Плитки создаются только при
+# - - первом рисовании на них, поэтому пустой холст почти не занимает памяти. Рисование инструментами QPainter,
+# - - заливка и отрисовка слоя идут по отдельным плиткам
 # - self.tool - str (в будущем планируется заменить на Enum), текущий выбранный инструмент
 # - - Значения (названия имеют длину до 4 симв. включительно, чтобы ускорить сравнение строк):
 # - - - 'none' - инструмент не выбран
 # - - - 'brsh' - кисть. След кисти идёт по траектории движения мыши с опущенной ЛКМ. Форма следа округлая (Qt.RoundCap)
 # - - - 'pen' - ручка. То же, что и кисть, но с более угловатой формой следа (Qt.SquareCap)
 # - - - 'penc' - карандаш. То же, что и кисть, но с более отрывистой формой следа (Qt.FlatCap)
+# - - - 'soft' - мягкая кисть. След состоит из отпечатков, плавно исчезающих к краю (см. brushEngine.py)
+# - - - 'airb' - аэрограф. След состоит из частых полупрозрачных отпечатков, накапливающихся при повторном проходе
+# - - - 'txtr' - текстурная кисть. След состоит из отпечатков с зернистой прозрачностью
 # - - - 'line' - отрезок. Соединяет отрезком точку нажания и точку отпускания ЛКМ.
 # - - - 'rect' - прямоугольник. Строит прямоугольник по диагонали, заданной пользователем как отрезок, соединяющий
 # - - - - точку нажатия и точку отпускания ЛКМ, со сторонами, параллельными осям координат
 # - - - 'oval' - эллипс. Строит эллипс, вписанный в прямоугольник, построенный описанным выше способом
 # - - - 'fill' - заливка. Меняет цвет области точек цвета точки, в которой была нажата ЛКМ. Область ограничена
-# - - - - точками другого цвета
+# - - - - точками другого цвета (с учётом self.tolerance). Если self.contiguous ложно, перекрашиваются все точки
+# - - - - подходящего цвета на слое, а не только связная область
+# - self.tolerance - int, допуск заливки от 0 до 255: на сколько может отличаться каждый канал цвета точки от цвета
+# - - точки, в которой была нажата ЛКМ, чтобы точка была залита
+# - self.contiguous - bool, True - заливается только связная область, False - заменяется цвет по всему слою
 # - self.active - bool, True - слой активирован (доступен для изменения), False - слой деактивирован
 # - self.drawing - bool, True - ЛКМ нажата, пользователь рисует, False - ЛКМ отпущена.
 # - - Необходим для предотвращения рисования при перемещении мыши, когда пользователь не начал рисовать.
@@ -32,188 +42,181 @@ from collections import deque
 # - self.curMousePos - QPoint, используется при рисовании отрезка, прямоугольника, эллипса. Вторая точка, по которой
 # - - рисуется фигура
 # - self.pen - QPen, задает стиль рисования ("начертание пера"), цвет и толщину
-class BitmapLayer(QWidget):
-    # Инициализация атрибутов, задание разрешения, изменение фона на прозрачный
+# - self.dirtyRect - QRect, прямоугольник, охватывающий всё изменённое на слое с последней перерисовки (с запасом на
+# - - толщину пера). Перерисовывается только он, а не весь холст, поэтому задержка кисти не зависит от размера холста
+# - self.stroke - StrokeSession или None, сеанс рисования текущего мазка кистью, ручкой, карандашом или ластиком
+# - - (см. strokeSession.py). Существует от нажатия до отпускания ЛКМ
+# - self.lastStrokeTimings - dict, замеры времени последнего завершённого мазка (см. StrokeSession.timings)
+class BitmapLayer(LayerItem):
+    # Инициализация атрибутов, задание разрешения
     def __init__(self, width: int, height: int, parent: QWidget) -> None:
-        super().__init__()
+        super().__init__(width, height)
 
         self.parent = parent
 
-        self.setMinimumSize(width, height)
-        self.setMaximumSize(width, height)
-        self.resolution = width, height
-
-        self.bitmap = QImage(self.size(), QImage.Format_ARGB32_Premultiplied)
-        self.bitmap.fill(QColor(0, 0, 0, alpha=0))
-
-        self.fastBitmap = ''
+        self.bitmap = TiledBitmap(width, height)
+        self.mipmaps = MipPyramid(width, height, self.readRegion)
 
         self.tool = 'none'
+        self.tolerance = 0
+        self.contiguous = True
         self.active = False
         self.drawing = False
         self.lastMousePos = QPoint(0, 0)
         self.curMousePos = QPoint(0, 0)
 
         self.pen = QPen(QColor(0, 0, 0), 1, Qt.SolidLine, Qt.RoundCap, Qt.BevelJoin)
-
-        palette = self.palette()
-        palette.setBrush(QPalette.Window, QBrush(QColor(0, 0, 0, alpha=0), Qt.SolidPattern))
-        self.setPalette(palette)
+        self.dirtyRect = QRect()
+        self.stroke = None
+        self.lastStrokeTimings = dict()
 
     # Отрисовка виджета слоя. Помимо самого содержимого слоя, если пользователь не закончил рисовать
-    # отрезок, прямоугольник или эллипс, поверх слоя тонкой линией также будет отрисована рисуемая фигура
-    def paintEvent(self, event: QPaintEvent) -> None:
-        qp = QPainter(self)
-        qp.drawImage(0, 0, self.bitmap)
+    # отрезок, прямоугольник или эллипс, поверх слоя тонкой линией также будет отрисована рисуемая фигура.
+    # Из self.bitmap рисуются только плитки, пересекающиеся с перерисовываемой областью option.exposedRect, а не весь
+    # холст. При масштабе отображения не больше 1/2 вместо плиток рисуется уменьшенная копия слоя (см. mipmap.py)
+    def paint(self, qp: QPainter, option: QStyleOptionGraphicsItem, widget=None) -> None:
+        if not self.mipmaps.draw(qp, option.exposedRect):
+            self.bitmap.draw(qp, option.exposedRect.toAlignedRect())
+        self.dirtyRect = QRect()
 
         if self.drawing:
             qp.setPen(Qt.DashLine)
 
-            if self.tool == 'rect':
-                x1, y1 = self.lastMousePos.x(), self.lastMousePos.y()
-                x2, y2 = self.curMousePos.x(), self.curMousePos.y()
-                qp.drawRect(min(x1, x2), min(y1, y2), abs(x1 - x2), abs(y1 - y2))
-            elif self.tool == 'line':
-                qp.drawLine(self.lastMousePos, self.curMousePos)
-            elif self.tool == 'oval':
-                x1, y1 = self.lastMousePos.x(), self.lastMousePos.y()
-                x2, y2 = self.curMousePos.x(), self.curMousePos.y()
-                qp.drawEllipse(min(x1, x2), min(y1, y2), abs(x1 - x2), abs(y1 - y2))
+            if self.tool in {'rect', 'line', 'oval'}:
+                self.drawShape(qp)
             elif self.tool == 'ersr':
                 qp.drawEllipse(self.lastMousePos.x() - self.pen.width() // 2,
                                self.lastMousePos.y() - self.pen.width() // 2,
                                self.pen.width(), self.pen.width())
 
-    # Обработчик нажатия мыши. Если слой неактивен, но находится поверх остальных (имеет наибольший z),
-    # то event будет приходить ему. В таком случае слой через self.parent передает нажатие на нужный слой.
-    # В противном случае включается self.drawing и обновляется self.lastMousePos
+    # Обработчик нажатия мыши. События мыши слою доставляет Window.inputRouter, и только когда слой активен.
+    # Включается self.drawing, обновляется self.lastMousePos и начинается отслеживание изменённых
+    # плиток для истории изменений. Для кисти, ручки, карандаша и ластика начинается сеанс рисования мазка
     def mousePressEvent(self, event: QMouseEvent) -> None:
-        if not self.active:
-            if self.parent.currentLayer != -1:
-                self.parent.scene.items()[self.parent.currentLayer].widget().mousePressEvent(event)
-        else:
-            if event.button() == Qt.LeftButton and self.active and self.tool != 'none':
-                self.drawing = True
-                self.lastMousePos = event.pos()
-
-    # Обработчик движения мыши. Если слой неактивен, но находится поверх остальных (имеет наибольший z),
-    # то event будет приходить ему. В таком случае слой через self.parent передает нажатие на нужный слой.
-    # В противном случае проверяется, что мышь уже была нажата ранее и выбран инструмент.
-    # Если инструмент - кисть, ручка или карандаш, то результат рисования наносится на self.bitmap сразу.
+        if event.button() == Qt.LeftButton and self.active and self.tool != 'none':
+            self.drawing = True
+            self.lastMousePos = event.pos()
+            self.bitmap.beginChange()
+
+            if self.tool in {'brsh', 'pen', 'penc', 'ersr', 'soft', 'airb', 'txtr'}:
+                self.stroke = StrokeSession(self.bitmap, self.pen, self.tool == 'ersr', event.pos(), self.markDirty,
+                                            self.tool)
+
+    # Обработчик движения мыши. Проверяется, что мышь уже была нажата ранее и выбран инструмент.
+    # Если инструмент - кисть (в т.ч. штампуемая), ручка, карандаш или ластик, то точка передаётся сеансу рисования
+    # мазка, который рисует все точки, пришедшие за кадр, за одну отрисовку.
     # Если это отрезок, прямоугольник или эллипс, то обновляется только self.curMousePos для корректной отрисовки
     # предпросмотра рисуемой фигуры
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
-        if not self.active:
-            if self.parent.currentLayer != -1:
-                self.parent.scene.items()[self.parent.currentLayer].widget().mouseMoveEvent(event)
-        elif event.buttons() & Qt.LeftButton & self.drawing & (self.tool != 'none'):
-            if self.tool in {'brsh', 'pen', 'penc', 'ersr'}:
-                qp = QPainter(self.bitmap)
-                qp.setPen(self.pen)
-                if self.tool == 'ersr':
-                    qp.setCompositionMode(QPainter.CompositionMode_Clear)
-                qp.drawLine(self.lastMousePos, event.pos())
-
+        if self.active and event.buttons() & Qt.LeftButton & self.drawing & (self.tool != 'none'):
+            if self.stroke is not None:
+                self.stroke.addPoint(event.pos())
                 self.lastMousePos = event.pos()
             elif self.tool != 'fill':
+                # Предпросмотр фигуры рисуется пунктиром толщиной 1, поэтому перерисовываются только его старые и
+                # новые границы
+                self.markDirty(self.spanRect(self.lastMousePos, self.curMousePos, 2))
                 self.curMousePos = event.pos()
+                self.markDirty(self.spanRect(self.lastMousePos, self.curMousePos, 2))
 
-            self.update()
-
-    # Обработчик отпускания кнопки мыши. Если слой неактивен, но находится поверх остальных (имеет наибольший z),
-    # то event будет приходить ему. В таком случае слой через self.parent передает нажатие на нужный слой.
-    # В противном случае проверяется, идет ли сейчас рисование. Если да, то оно заканчивается, => надо нарисовать
-    # отрезок, прямоугольник или эллипс. Если инструмент - заливка, то обходом в ширину закрашиваются точки того же
-    # цвета, что и точка заливки, находящиеся в одной области с ней. Для ускорения процесса используется быстрый доступ
-    # к точкам слоя при помощи предварительно обновленного self.fastBitmap. Заливка работает за O(W*H),
-    # где (W,H) - разрешение
+    # Обработчик отпускания кнопки мыши. Проверяется, идет ли сейчас рисование. Если да, то оно заканчивается, => надо
+    # нарисовать отрезок, прямоугольник или эллипс, или завершить сеанс рисования мазка (его замеры времени сохраняются
+    # в self.lastStrokeTimings). Если инструмент - заливка, то вызывается self.fill. Затронутые за всё рисование плитки
+    # добавляются в историю изменений окна одним действием
     def mouseReleaseEvent(self, event: QMouseEvent) -> None:
         if self.active:
             if self.drawing:
                 self.drawing = False
 
-                if self.tool in {'rect', 'line', 'oval'}:
-                    qp = QPainter(self.bitmap)
-                    qp.setPen(self.pen)
-
-                    if self.tool == 'line':
-                        qp.drawLine(self.lastMousePos, self.curMousePos)
-                    elif self.tool == 'rect':
-                        x1, y1 = self.lastMousePos.x(), self.lastMousePos.y()
-                        x2, y2 = self.curMousePos.x(), self.curMousePos.y()
-                        qp.drawRect(min(x1, x2), min(y1, y2), abs(x1 - x2), abs(y1 - y2))
-                    else:
-                        x1, y1 = self.lastMousePos.x(), self.lastMousePos.y()
-                        x2, y2 = self.curMousePos.x(), self.curMousePos.y()
-                        qp.drawEllipse(min(x1, x2), min(y1, y2), abs(x1 - x2), abs(y1 - y2))
+                if self.stroke is not None:
+                    self.lastStrokeTimings = self.stroke.end()
+                    self.stroke = None
+                elif self.tool in {'rect', 'line', 'oval'}:
+                    def drawFinalShape(qp: QPainter) -> None:
+                        qp.setPen(self.pen)
+                        self.drawShape(qp)
+
+                    rect = self.spanRect(self.lastMousePos, self.curMousePos, self.pen.width() + 1)
+                    self.bitmap.paint(rect, drawFinalShape)
+                    self.markDirty(rect)
                 elif self.tool == 'fill':
-                    self.updateFastBitmap()
-                    old_color = self.fastGetPixel(self.lastMousePos.x(), self.lastMousePos.y())
-                    new_color = self.pen.color()
-                    used = [[False for j in range(self.resolution[0])] for i in range(self.resolution[1])]
-
-                    queue = deque()
-                    queue.append((self.lastMousePos.x(), self.lastMousePos.y()))
-
-                    while len(queue) != 0:
-                        x, y = queue.popleft()
-                        self.bitmap.setPixelColor(x, y, new_color)
-
-                        if x != 0 and self.fastGetPixel(x - 1, y) == old_color and not used[y][x - 1]:
-                            queue.append((x - 1, y))
-                            used[y][x - 1] = True
-                        if y != 0 and self.fastGetPixel(x, y - 1) == old_color and not used[y - 1][x]:
-                            queue.append((x, y - 1))
-                            used[y - 1][x] = True
-                        if x != self.resolution[0] - 1 and self.fastGetPixel(x + 1, y) == old_color and not used[y][x + 1]:
-                            queue.append((x + 1, y))
-                            used[y][x + 1] = True
-                        if y != self.resolution[1] - 1 and self.fastGetPixel(x, y + 1) == old_color and not used[y + 1][x]:
-                            queue.append((x, y + 1))
-                            used[y + 1][x] = True
+                    self.fill(self.lastMousePos.x(), self.lastMousePos.y())
 
+                self.parent.history.pushTiles(self, self.bitmap.endChange())
                 self.lastMousePos = QPoint(0, 0)
                 self.curMousePos = QPoint(0, 0)
 
-                self.update()
-        elif self.parent.currentLayer != -1:
-            self.parent.scene.items()[self.parent.currentLayer].widget().mouseReleaseEvent(event)
-
-    # Обновление инструмента, цвета и толщины рисования на слое
-    def updateState(self, color: QColor, width: int, tool: str) -> None:
+    # Обновление инструмента, цвета, толщины рисования и параметров заливки на слое
+    def updateState(self, color: QColor, width: int, tool: str, tolerance: int, contiguous: bool) -> None:
         self.pen.setColor(color)
         self.pen.setWidth(width)
         self.tool = tool
+        self.tolerance = tolerance
+        self.contiguous = contiguous
 
+        # Мазок рисуется ломаной, поэтому вместе с формой концов задаётся и форма изломов, близкая к ней
         if self.tool == 'penc':
             self.pen.setCapStyle(Qt.FlatCap)
+            self.pen.setJoinStyle(Qt.BevelJoin)
         elif self.tool == 'pen':
             self.pen.setCapStyle(Qt.SquareCap)
+            self.pen.setJoinStyle(Qt.MiterJoin)
         else:
             self.pen.setCapStyle(Qt.RoundCap)
+            self.pen.setJoinStyle(Qt.RoundJoin)
+
+    # Рисование отрезка, прямоугольника или эллипса (в зависимости от self.tool) по точкам self.lastMousePos и
+    # self.curMousePos текущим пером painter. Используется и для предпросмотра фигуры, и для её рисования на слое
+    def drawShape(self, qp: QPainter) -> None:
+        x1, y1 = self.lastMousePos.x(), self.lastMousePos.y()
+        x2, y2 = self.curMousePos.x(), self.curMousePos.y()
+
+        if self.tool == 'line':
+            qp.drawLine(self.lastMousePos, self.curMousePos)
+        elif self.tool == 'rect':
+            qp.drawRect(min(x1, x2), min(y1, y2), abs(x1 - x2), abs(y1 - y2))
+        elif self.tool == 'oval':
+            qp.drawEllipse(min(x1, x2), min(y1, y2), abs(x1 - x2), abs(y1 - y2))
+
+    # Заливка области, содержащей точку (x, y), текущим цветом self.pen. Выполняется по плиткам self.bitmap над их
+    # NumPy-представлениями без копирования: в связном режиме - построчными отрезками (TiledBitmap.fill),
+    # иначе - заменой цвета по всему слою (TiledBitmap.replaceColor). Цвет переводится в формат с предумноженной
+    # альфой, как и сами плитки
+    def fill(self, x: int, y: int) -> None:
+        color = qPremultiply(self.pen.color().rgba())
+        if self.contiguous:
+            bounds = self.bitmap.fill(x, y, color, self.tolerance)
+        else:
+            bounds = self.bitmap.replaceColor(x, y, color, self.tolerance)
 
-    # Обновление self.fastBitmap
-    def updateFastBitmap(self) -> None:
-        self.fastBitmap = self.bitmap.bits().asstring(self.resolution[0] * self.resolution[1] * 4)
+        if bounds is not None:
+            self.markDirty(QRect(QPoint(bounds[0], bounds[1]), QPoint(bounds[2], bounds[3])))
 
-    # Быстрый доступ к пикселю при помощи self.fastBitmap
-    def fastGetPixel(self, x: int, y: int) -> str:
-        i = (x + (y * self.resolution[0])) * 4
-        return self.fastBitmap[i:i + 4]
+    # Точки области (x, y, width, height) слоя - исходный уровень уменьшенных копий (см. mipmap.MipPyramid). Если в
+    # области нет ни одной созданной плитки, она прозрачна и не читается (возвращается None)
+    def readRegion(self, x: int, y: int, width: int, height: int):
+        if not any(key in self.bitmap.tiles for key in self.bitmap.tileKeys(QRect(x, y, width, height))):
+            return None
+        return self.bitmap.readRegion(x, y, width, height)
 
-    # Задание нового разрешения. Вызывается родительским классом Window при изменении разрешения проектаю
-    # Аргумент stretch определяет, растягивается ли уже имеющееся содержимое виджета (True) или кадрируется (False)
-    def setResolution(self, width: int, height: int, stretch: bool) -> None:
-        self.setMinimumSize(width, height)
-        self.setMaximumSize(width, height)
-        self.resolution = width, height
-
-        if stretch:
-            self.bitmap = self.bitmap.scaled(width, height, aspectRatioMode=Qt.IgnoreAspectRatio)
-        else:
-            bitmap = QImage(self.size(), QImage.Format_ARGB32_Premultiplied)
-            qp = QPainter(bitmap)
-            qp.drawImage(0, 0, self.bitmap)
-            self.bitmap = bitmap
+    # Прямоугольник, охватывающий отрезок между точками a и b, расширенный на padding точек с каждой стороны.
+    # Используется для вычисления изменённой области при рисовании кистью и фигурами
+    def spanRect(self, a: QPoint, b: QPoint, padding: int) -> QRect:
+        return QRect(a, b).normalized().adjusted(-padding, -padding, padding, padding)
+
+    # Пометка области слоя как изменённой: она добавляется к self.dirtyRect, и перерисовка запрашивается только для неё
+    def markDirty(self, rect: QRect) -> None:
+        rect = rect.intersected(QRect(0, 0, *self.resolution))
+        self.dirtyRect = self.dirtyRect.united(rect)
+        self.update(QRectF(rect))
 
-        self.repaint()
+    # Задание нового разрешения. Вызывается родительским классом Window при изменении разрешения проектаю
+    # Аргумент stretch определяет, растягивается ли уже имеющееся содержимое виджета (True) или кадрируется (False).
+    # При кадрировании уже созданные плитки переиспользуются, а не копируются (см. TiledBitmap.resizeTasks).
+    # bitmap - уже построенное в фоне хранилище нового размера (см. resampling.ResizeJob); если не задано, хранилище
+    # строится сразу
+    def setResolution(self, width: int, height: int, stretch: bool, bitmap=None) -> None:
+        self.resize(width, height)
+        self.bitmap = bitmap if bitmap is not None else self.bitmap.resized(width, height, stretch)
+
+        self.update()
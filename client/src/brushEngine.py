@@ -0,0 +1,112 @@
+import math
+from collections import OrderedDict
+import numpy as np
+from PyQt5.QtGui import QImage, QColor
+from PyQt5.QtCore import QPointF
+
+
+# В этом файле описан движок штампуемых кистей растрового слоя. Мазок такой кистью - это последовательность
+# отпечатков ("дабов") - небольших заранее отрисованных картинок, - поставленных вдоль траектории мыши с равным шагом.
+# Отпечаток для каждого сочетания кисти, размера и цвета рисуется один раз и хранится в кэше (см. DabCache)
+
+
+# Штампуемые кисти и доля диаметра отпечатка, через которую ставится следующий отпечаток:
+# - 'soft' - мягкая кисть, непрозрачная в центре и плавно исчезающая к краю
+# - 'airb' - аэрограф, очень мягкий полупрозрачный отпечаток, который ставится часто и накапливается
+# - 'txtr' - текстурная кисть, отпечаток с зернистой (шумовой) прозрачностью
+BRUSH_SPACING = {'soft': 0.2, 'airb': 0.1, 'txtr': 0.35}
+
+# Максимальное число отпечатков в кэше. При превышении забывается отпечаток, который дольше всех не использовался
+DAB_CACHE_SIZE = 64
+
+# Непрозрачность одного отпечатка аэрографа
+AIRBRUSH_FLOW = 0.12
+
+
+# Отрисовка отпечатка кисти brush диаметра size цвета color. Прозрачность каждой точки вычисляется векторизованно
+# по расстоянию от центра, затем точки переводятся в формат ARGB32 с предумноженной альфой
+def renderDab(brush: str, size: int, color: QColor) -> QImage:
+    size = max(1, size)
+    coordinates = (np.arange(size, dtype=np.float32) + 0.5) / size * 2 - 1
+    radius = np.hypot(*np.meshgrid(coordinates, coordinates))
+    inside = np.clip(1 - radius * radius, 0, 1)
+
+    if brush == 'soft':
+        alpha = inside * inside
+    elif brush == 'airb':
+        alpha = inside * inside * inside * AIRBRUSH_FLOW
+    else:
+        # Шум зависит только от размера, поэтому зерно текстуры не меняется от мазка к мазку
+        grain = np.random.default_rng(size).uniform(0.25, 1.0, (size, size)).astype(np.float32)
+        alpha = np.clip(1 - radius ** 4, 0, 1) * grain
+
+    alpha = alpha * (color.alpha() / 255)
+    pixels = ((np.rint(alpha * 255).astype(np.uint32) << 24) |
+              (np.rint(alpha * color.red()).astype(np.uint32) << 16) |
+              (np.rint(alpha * color.green()).astype(np.uint32) << 8) |
+              np.rint(alpha * color.blue()).astype(np.uint32))
+
+    return QImage(pixels.tobytes(), size, size, QImage.Format_ARGB32_Premultiplied).copy()
+
+
+# Кэш отпечатков кистей с вытеснением давно не использованных (LRU)
+# Атрибуты:
+# - self.capacity - int, максимальное число отпечатков в кэше
+# - self.dabs - OrderedDict(tuple(str, int, int), QImage), отпечатки по ключу (кисть, диаметр, цвет в формате ARGB).
+# - - Последний использованный отпечаток - в конце
+# - self.hits - int, число запросов, для которых отпечаток уже был в кэше
+# - self.misses - int, число запросов, для которых отпечаток пришлось рисовать
+class DabCache:
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.dabs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Отпечаток кисти brush диаметра size цвета color: из кэша, если он там есть, иначе рисуется и кладётся в кэш
+    def dab(self, brush: str, size: int, color: QColor) -> QImage:
+        key = (brush, size, color.rgba())
+        if key in self.dabs:
+            self.hits += 1
+            self.dabs.move_to_end(key)
+            return self.dabs[key]
+
+        self.misses += 1
+        self.dabs[key] = renderDab(brush, size, color)
+        if len(self.dabs) > self.capacity:
+            self.dabs.popitem(last=False)
+
+        return self.dabs[key]
+
+
+# Общий для всех растровых слоёв кэш отпечатков
+dabCache = DabCache(DAB_CACHE_SIZE)
+
+
+# Класс расстановки отпечатков вдоль мазка. Ломаные мазка приходят частями (по кадру, см. StrokeSession), поэтому
+# между частями запоминается расстояние, оставшееся до следующего отпечатка, и шаг не сбивается на стыках
+# Атрибуты:
+# - self.spacing - float, расстояние между соседними отпечатками в точках
+# - self.distance - float, расстояние от начала следующего отрезка до следующего отпечатка
+# - self.count - int, число уже расставленных отпечатков
+class DabStamper:
+    def __init__(self, brush: str, size: int) -> None:
+        self.spacing = max(1.0, BRUSH_SPACING[brush] * size)
+        self.distance = 0.0
+        self.count = 0
+
+    # Центры отпечатков на ломаной points (list(QPoint)), первая точка которой - конец предыдущей части мазка
+    def positions(self, points: list) -> list:
+        result = []
+        for start, end in zip(points, points[1:]):
+            dx, dy = end.x() - start.x(), end.y() - start.y()
+            length = math.hypot(dx, dy)
+
+            while self.distance <= length:
+                t = self.distance / length if length else 0.0
+                result.append(QPointF(start.x() + dx * t, start.y() + dy * t))
+                self.distance += self.spacing
+            self.distance -= length
+
+        self.count += len(result)
+        return result
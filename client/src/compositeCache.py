@@ -0,0 +1,143 @@
+from PyQt5.QtWidgets import QGraphicsScene, QStyleOptionGraphicsItem
+from PyQt5.QtGui import QPainter
+from PyQt5.QtCore import Qt
+from layerItem import LayerItem
+from layerRegistry import LayerRegistry, BACKGROUND_LAYER
+from compositor import composite
+from imageBuffer import imageArray
+from mipmap import MipPyramid
+
+
+# В этом файле описан кэш слепков слоёв. Пока выделен какой-либо слой, все остальные слои сведены в два слепка (под
+# выделенным и над ним), и сцена при каждой перерисовке рисует три картинки: нижний слепок, выделенный слой и верхний
+# слепок, - сколько бы слоёв ни было в проекте
+
+
+# Класс слепка - элемента сцены, заменяющего на сцене несколько слоёв одной заранее сведённой картинкой. Сами слои,
+# входящие в слепок, на время скрываются со сцены. Картинка сводится заново при первой отрисовке после того, как
+# устарела: когда любой из входящих в неё слоёв запросил перерисовку (см. LayerItem.update) или был показан/скрыт
+# Атрибуты (помимо унаследованных от LayerItem):
+# - self.layers - list(LayerItem), слои, входящие в слепок, снизу вверх
+# - self.visible - dict(LayerItem, bool), видимость каждого слоя, заданная пользователем (на сцене слой скрыт, пока
+# - - входит в слепок)
+# - self.image - QImage или None, сведённая картинка (ARGB32 с предумноженной альфой). None - картинка устарела
+class CompositeItem(LayerItem):
+    def __init__(self, width: int, height: int) -> None:
+        super().__init__(width, height)
+
+        self.layers = []
+        self.visible = dict()
+        self.image = None
+        self.mipmaps = MipPyramid(width, height, self.readImage)
+
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.hide()
+
+    # Отрисовка слепка: копируется только перерисовываемая область сведённой картинки, а при масштабе отображения не
+    # больше 1/2 - её уменьшенной копии (см. mipmap.py)
+    def paint(self, qp: QPainter, option: QStyleOptionGraphicsItem, widget=None) -> None:
+        if self.image is None:
+            self.rebuild()
+
+        if not self.mipmaps.draw(qp, option.exposedRect):
+            rect = option.exposedRect.toAlignedRect()
+            qp.drawImage(rect, self.image, rect)
+
+    # Точки области (x, y, width, height) сведённой картинки - исходный уровень уменьшенных копий
+    def readImage(self, x: int, y: int, width: int, height: int):
+        return imageArray(self.image, writable=False)[y:y + height, x:x + width]
+
+    # Сведение видимых слоёв в одну картинку (см. compositor.py)
+    def rebuild(self) -> None:
+        self.image = composite([layer for layer in self.layers if self.visible[layer]], *self.resolution)
+
+    # Пометка картинки устаревшей. layer - изменившийся слой; если изменилось его разрешение, меняется и размер слепка
+    def invalidate(self, layer=None) -> None:
+        if layer is not None and layer.resolution != self.resolution:
+            self.resize(*layer.resolution)
+        self.image = None
+        self.update()
+
+    # Замена набора слоёв слепка на layers (снизу вверх) и задание высоты слепка на сцене. Прежние слои возвращаются на
+    # сцену с заданной пользователем видимостью, новые - скрываются. Слепок без слоёв скрывается сам
+    def setLayers(self, layers: list, z=0.0) -> None:
+        for layer in self.layers:
+            layer.composite = None
+            layer.setVisible(self.visible.pop(layer))
+
+        self.layers = layers
+        for layer in layers:
+            self.visible[layer] = layer.isVisible()
+            layer.composite = self
+            layer.setVisible(False)
+
+        self.setZValue(z)
+        if layers:
+            self.invalidate(layers[0])
+        else:
+            self.image = None
+        self.setVisible(bool(layers))
+
+    # Показ или скрытие входящего в слепок слоя
+    def setLayerVisible(self, layer: LayerItem, visible: bool) -> None:
+        self.visible[layer] = visible
+        self.invalidate()
+
+
+# Класс кэша слепков. Делит слои сцены на лежащие под выделенным слоем и над ним (по высоте на сцене, поэтому
+# поднятый на время редактирования текстовый слой оказывается над всеми слоями, кроме сетки) и сводит каждую часть
+# в свой слепок. Окно сообщает кэшу о выделении слоя, снятии выделения, перемещении и удалении слоёв; об изменении
+# содержимого слоя слепку сообщает сам слой
+# Атрибуты:
+# - self.registry - LayerRegistry, реестр слоёв проекта
+# - self.below - CompositeItem, слепок слоёв под выделенным слоем
+# - self.above - CompositeItem, слепок слоёв над выделенным слоем
+# - self.activeId - int, идентификатор выделенного слоя, -1 - слои не сведены
+class CompositeCache:
+    def __init__(self, scene: QGraphicsScene, registry: LayerRegistry) -> None:
+        self.registry = registry
+        self.activeId = -1
+
+        self.below = CompositeItem(0, 0)
+        self.above = CompositeItem(0, 0)
+        scene.addItem(self.below)
+        scene.addItem(self.above)
+
+    # Сведение всех слоёв, кроме слоя layerId, в слепки под ним и над ним
+    def activate(self, layerId: int) -> None:
+        # Сначала все слои возвращаются на сцену: иначе видимость слоя, переходящего из одного слепка в другой,
+        # считалась бы с уже скрытого слоя
+        self.release()
+
+        z = self.registry.layer(layerId).zValue()
+        below, above = [], []
+        for otherId in self.registry.ordered():
+            # Фон рисуется в координатах экрана (см. BackgroundLayer) и в слепок не сводится
+            if otherId != layerId and otherId != BACKGROUND_LAYER:
+                layer = self.registry.layer(otherId)
+                (below if layer.zValue() < z else above).append(layer)
+
+        self.below.setLayers(below, z - 0.5)
+        self.above.setLayers(above, z + 0.5)
+        self.activeId = layerId
+
+    # Возврат всех слоёв на сцену (при снятии выделения)
+    def release(self) -> None:
+        self.below.setLayers([])
+        self.above.setLayers([])
+        self.activeId = -1
+
+    # Повторное деление слоёв после изменения их порядка или состава (перемещения, удаления)
+    def restack(self) -> None:
+        if self.activeId in self.registry:
+            self.activate(self.activeId)
+        else:
+            self.release()
+
+    # Показ или скрытие слоя layerId. Слой, входящий в слепок, на сцене остаётся скрытым, а слепок сводится заново
+    def setLayerVisible(self, layerId: int, visible: bool) -> None:
+        layer = self.registry.layer(layerId)
+        if layer.composite is not None:
+            layer.composite.setLayerVisible(layer, visible)
+        else:
+            layer.setVisible(visible)
@@ -0,0 +1,122 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtCore import QRect
+from imageBuffer import imageArray
+from tiledBitmap import TILE_SIZE
+from bitmapLayer import BitmapLayer
+
+
+# В этом файле описано сведение нескольких слоёв в одну картинку (при экспорте проекта и для слепков слоёв, см.
+# compositeCache.py). Картинка делится на плитки TILE_SIZE x TILE_SIZE (те же, что у растровых слоёв), и каждая плитка
+# сводится отдельной задачей в пуле потоков: слои накладываются на неё снизу вверх векторизованными операциями NumPy,
+# которые на время вычислений отпускают GIL, поэтому плитки действительно сводятся параллельно
+
+
+# Число потоков, в которых сводятся плитки
+COMPOSITE_WORKERS = os.cpu_count() or 4
+
+
+# Наложение точек src поверх точек dst (режим "поверх", SourceOver) на месте. Оба массива - (h, w, 4) с типом
+# np.uint8, каналы B, G, R, A с предумноженной альфой, поэтому каждый канал результата - src + dst * (255 - A) / 255.
+# Деление на 255 с округлением заменено сдвигами: (x + (x >> 8)) >> 8 при x = dst * (255 - A) + 128
+def blendOver(dst: np.ndarray, src: np.ndarray) -> None:
+    product = dst * (255 - src[..., 3:4].astype(np.uint16))
+    product += 128
+    product += product >> 8
+    product >>= 8
+    np.add(src, product, out=dst, casting='unsafe')
+
+
+# Источник точек одного слоя по плиткам. Растровый слой отдаёт свои плитки напрямую (несозданные плитки прозрачны и
+# пропускаются). Остальные слои отрисовываются в картинку, покрывающую только плитки, которые задевает область их
+# содержимого (LayerItem.contentRect), поэтому память под источник зависит от размера содержимого, а не холста, а
+# плитки вне этой области пропускаются так же, как несозданные плитки растрового слоя. Отрисовка слоя возможна только
+# в основном потоке, поэтому источник создаётся до запуска задач
+# Атрибуты:
+# - self.tiles - dict(tuple(int, int), np.ndarray) или None, точки плиток растрового слоя (TILE_SIZE, TILE_SIZE, 4)
+# - self.rect - QRect, область холста, покрытая self.image (границы - по границам плиток или по краю холста). Пустая -
+# - - слой ничего не рисует
+# - self.image - QImage или None, отрисованная область self.rect слоя (у растрового слоя - None). Хранится, пока
+# - - используются его точки
+# - self.pixels - np.ndarray или None, точки self.image (height, width, 4)
+class LayerSource:
+    def __init__(self, layer, width: int, height: int) -> None:
+        self.tiles = None
+        self.rect = QRect()
+        self.image = None
+        self.pixels = None
+
+        if isinstance(layer, BitmapLayer):
+            self.tiles = {key: imageArray(tile, writable=False).view(np.uint8).reshape(TILE_SIZE, TILE_SIZE, 4)
+                          for key, tile in layer.bitmap.tiles.items()}
+            return
+
+        # Запас в точку - на сглаживание краёв
+        content = layer.contentRect().toAlignedRect()
+        content = content.adjusted(-1, -1, 1, 1).intersected(QRect(0, 0, width, height))
+        if layer.contentRect().isEmpty() or content.isEmpty():
+            return
+
+        left, top = content.left() // TILE_SIZE * TILE_SIZE, content.top() // TILE_SIZE * TILE_SIZE
+        right = min((content.right() // TILE_SIZE + 1) * TILE_SIZE, width)
+        bottom = min((content.bottom() // TILE_SIZE + 1) * TILE_SIZE, height)
+        self.rect = QRect(left, top, right - left, bottom - top)
+
+        self.image = QImage(self.rect.width(), self.rect.height(), QImage.Format_ARGB32_Premultiplied)
+        self.image.fill(0)
+        qp = QPainter(self.image)
+        qp.translate(-left, -top)
+        layer.render(qp, self.rect)
+        qp.end()
+        self.pixels = imageArray(self.image, writable=False).view(np.uint8) \
+            .reshape(self.rect.height(), self.rect.width(), 4)
+
+    # Точки плитки (tx, ty) размером width x height (у крайних плиток холста - меньше TILE_SIZE) или None, если плитка
+    # заведомо прозрачна
+    def tile(self, tx: int, ty: int, width: int, height: int):
+        if self.tiles is not None:
+            pixels = self.tiles.get((tx, ty))
+            return None if pixels is None else pixels[:height, :width]
+
+        x, y = tx * TILE_SIZE, ty * TILE_SIZE
+        if not self.rect.contains(x, y):
+            return None
+        x, y = x - self.rect.left(), y - self.rect.top()
+        return self.pixels[y:y + height, x:x + width]
+
+
+# Сведение слоёв layers (снизу вверх) в одну картинку width x height формата ARGB32 с предумноженной альфой.
+# Плитки результата пишутся задачами прямо в память возвращаемой картинки, каждая задача - в свою плитку
+def composite(layers: list, width: int, height: int, workers=COMPOSITE_WORKERS) -> QImage:
+    result = QImage(width, height, QImage.Format_ARGB32_Premultiplied)
+    result.fill(0)
+    if width == 0 or height == 0:
+        return result
+
+    sources = [LayerSource(layer, width, height) for layer in layers]
+    pixels = imageArray(result).view(np.uint8).reshape(height, width, 4)
+
+    # Сведение одной плитки. Первый непрозрачный источник копируется, а не накладывается на пустую плитку
+    def compositeTile(key: tuple) -> None:
+        tx, ty = key
+        x, y = tx * TILE_SIZE, ty * TILE_SIZE
+        dst = pixels[y:y + TILE_SIZE, x:x + TILE_SIZE]
+        empty = True
+        for source in sources:
+            src = source.tile(tx, ty, dst.shape[1], dst.shape[0])
+            if src is None:
+                continue
+            if empty:
+                dst[...] = src
+                empty = False
+            else:
+                blendOver(dst, src)
+
+    keys = [(tx, ty) for ty in range((height + TILE_SIZE - 1) // TILE_SIZE)
+            for tx in range((width + TILE_SIZE - 1) // TILE_SIZE)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(compositeTile, keys))
+
+    return result
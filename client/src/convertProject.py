@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import argparse
+from projectFile import readProject, writeProject, embedBlobs, extractBlobs
+
+
+# В этом файле описано преобразование файлов проектов .gri между двоичным контейнером и старым форматом JSON (оба
+# формата описаны в projectFile.py) из командной строки. Картинки слоёв не перекодируются, поэтому преобразование
+# обратимо без потерь. Пример запуска:
+#     python convertProject.py -o converted projects/*.gri
+# По умолчанию файлы преобразуются в двоичный контейнер и перезаписываются на месте
+
+
+# Форматы, в которые преобразуются проекты
+PROJECT_FORMATS = ('binary', 'json')
+
+
+# Преобразование проекта из файла path в формат projectFormat с записью в outputPath (может совпадать с path: файл
+# записывается сначала во временный, который затем заменяет исходный)
+def convertProject(path: str, outputPath: str, projectFormat: str) -> None:
+    manifest, blob = readProject(path)
+    temporaryPath = outputPath + '.tmp'
+
+    if projectFormat == 'binary':
+        writeProject(temporaryPath, *extractBlobs(manifest, blob))
+    else:
+        with open(temporaryPath, 'w') as file:
+            json.dump(embedBlobs(manifest, blob), file, indent=4)
+
+    os.replace(temporaryPath, outputPath)
+
+
+# Разбор аргументов командной строки и преобразование всех проектов. Возвращает код завершения: 0 - все проекты
+# преобразованы, 1 - хотя бы один не удалось
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Преобразование проектов GrImage (.gri) между двоичным форматом и '
+                                                 'JSON')
+    parser.add_argument('files', nargs='+', help='файлы проектов')
+    parser.add_argument('-o', '--output-dir', default=None, help='папка для преобразованных проектов (по умолчанию '
+                                                                 'проекты перезаписываются на месте)')
+    parser.add_argument('-f', '--format', choices=PROJECT_FORMATS, default='binary', help='формат проектов')
+    args = parser.parse_args(argv)
+
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    failed = 0
+    for path in args.files:
+        outputPath = path if args.output_dir is None else os.path.join(args.output_dir, os.path.basename(path))
+        try:
+            convertProject(path, outputPath, args.format)
+            print(f'ok     {path} -> {outputPath}', file=sys.stderr)
+        except Exception as error:
+            failed += 1
+            print(f'error  {path}  ({type(error).__name__}: {error})', file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+# Запуск преобразования
+if __name__ == '__main__':
+    sys.exit(main())
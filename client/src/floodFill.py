@@ -0,0 +1,110 @@
+import numpy as np
+
+
+# В этом файле описан движок заливки, используемый инструментом 'fill' растрового слоя (см. bitmapLayer.py).
+# Функции не зависят от виджетов и работают с точками изображения в формате ARGB32 как с массивами NumPy, поэтому их
+# можно вызывать и проверять отдельно от интерфейса программы
+
+
+# Векторизованная проверка близости цветов. Принимает массив точек произвольной формы и цвет-образец, возвращает
+# маску той же формы: True, если каждый из каналов A, R, G, B точки отличается от образца не более чем на tolerance.
+# Каналы выделяются сдвигами значений, а не просмотром байтов, поэтому результат не зависит ни от порядка байтов
+# массива, ни от того, лежат ли его точки в памяти подряд
+def similarColors(pixels: np.ndarray, color: int, tolerance: int) -> np.ndarray:
+    if tolerance == 0:
+        return pixels == color
+
+    mask = np.ones(pixels.shape, dtype=bool)
+    for shift in (0, 8, 16, 24):
+        channel = ((pixels >> shift) & 0xFF).astype(np.int16)
+        mask &= np.abs(channel - ((color >> shift) & 0xFF)) <= tolerance
+    return mask
+
+
+# Заливка связной (по сторонам) области с допуском по цвету методом построчных отрезков (scanline fill). В область
+# попадают точки, каждый канал которых отличается от цвета точки (x, y) не более чем на tolerance (0-255). Область
+# обходится горизонтальными отрезками: отрезок расширяется влево и вправо до границы области и записывается целиком,
+# а в соседних строках в стек кладётся по одной затравочной точке на каждый касающийся его отрезок подходящих точек.
+# Маска подходящих точек считается векторизованно и только для тех строк, до которых дошла заливка, а границы отрезков
+# ищутся по маске средствами NumPy, так что стоимость заливки пропорциональна затронутым строкам, а не числу итераций
+# интерпретатора. Залитые точки сразу снимаются с маски, поэтому отдельная маска посещённых точек не нужна. Маски строк
+# хранятся упакованными по биту на точку (np.packbits), и распаковываются из них только байты под обрабатываемым
+# отрезком, поэтому заливка всего холста держит в памяти width * height / 8 байт, а не по байту на точку.
+# Доступ к изображению идёт через две функции, поэтому заливка не зависит от того, как хранятся точки (см.
+# tiledBitmap.TiledBitmap.fill):
+# - readRow(y) - возвращает строку y в виде np.ndarray из np.uint32 длины width
+# - writeSpan(y, x1, x2, color) - записывает цвет color в точки строки y с x1 по x2 включительно
+# Возвращает ограничивающий прямоугольник (x1, y1, x2, y2) включительно или None
+def spanFill(readRow, writeSpan, width: int, height: int, x: int, y: int, color: int, tolerance: int):
+    if not (0 <= x < width and 0 <= y < height):
+        return None
+
+    oldColor = int(readRow(y)[x])
+    if tolerance == 0 and oldColor == color:
+        return None
+
+    # Упакованная маска ещё не залитых подходящих точек строки row. Считается при первом обращении к строке
+    def packedMask(row: int) -> np.ndarray:
+        if row not in rowMasks:
+            rowMasks[row] = np.packbits(similarColors(readRow(row), oldColor, tolerance))
+        return rowMasks[row]
+
+    rowMasks = dict()
+    x1, y1, x2, y2 = x, y, x, y
+
+    stack = [(x, y)]
+    while stack:
+        x, y = stack.pop()
+        packed = packedMask(y)
+        if not packed.item(x >> 3) & (0x80 >> (x & 7)):
+            continue
+
+        # Границы отрезка - ближайшие снятые биты слева и справа от x. Сначала они ищутся в байте точки x, затем
+        # среди целых байтов, а не среди точек; биты дополнения за концом строки в np.packbits нулевые
+        byte = x >> 3
+        before = ~packed.item(byte) & (0xFF << (8 - (x & 7))) & 0xFF
+        if not before:
+            borders = np.flatnonzero(packed[:byte] != 0xFF)
+            byte = int(borders[-1]) if borders.size else -1
+            before = ~packed.item(byte) & 0xFF if byte >= 0 else 0
+        left = byte * 8 + 8 - (before & -before).bit_length() + 1 if before else 0
+
+        byte = x >> 3
+        after = ~packed.item(byte) & (0xFF >> ((x & 7) + 1))
+        if not after:
+            borders = np.flatnonzero(packed[byte + 1:] != 0xFF)
+            byte = byte + 1 + int(borders[0]) if borders.size else -1
+            after = ~packed.item(byte) & 0xFF if byte >= 0 else 0
+        right = byte * 8 + 8 - after.bit_length() - 1 if after else width - 1
+
+        # Залитые точки снимаются с маски: в крайних байтах отрезка - по маске битов, средние байты обнуляются целиком
+        writeSpan(y, left, right, color)
+        keepBefore, keepAfter = (0xFF << (8 - (left & 7))) & 0xFF, 0xFF >> ((right & 7) + 1)
+        if left >> 3 == right >> 3:
+            packed[left >> 3] &= keepBefore | keepAfter
+        else:
+            packed[left >> 3] &= keepBefore
+            packed[(left >> 3) + 1:right >> 3] = 0
+            packed[right >> 3] &= keepAfter
+        x1, y1, x2, y2 = min(x1, left), min(y1, y), max(x2, right), max(y2, y)
+
+        # В соседних строках в стек кладутся начала всех отрезков подходящих точек, касающихся залитого отрезка.
+        # Распаковываются только байты маски под залитым отрезком, и только если в них есть хотя бы один бит
+        for neighbourY in (y - 1, y + 1):
+            if not 0 <= neighbourY < height:
+                continue
+
+            first = left & ~7
+            chunk = packedMask(neighbourY)[first >> 3:(right >> 3) + 1]
+            if not chunk.any():
+                continue
+
+            bits = np.unpackbits(chunk).view(bool)
+            span = bits[left - first:right - first + 1]
+            starts = np.flatnonzero(span[1:] & ~span[:-1]) + 1
+            if span[0]:
+                stack.append((left, neighbourY))
+            stack.extend((left + int(i), neighbourY) for i in starts)
+
+    return x1, y1, x2, y2
+
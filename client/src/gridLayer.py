@@ -1,6 +1,73 @@
-from PyQt5.QtWidgets import QWidget
-from PyQt5.QtGui import QColor, QPainter, QPalette, QBrush, QPaintEvent
-from PyQt5.QtCore import Qt
+from bisect import bisect_left, bisect_right
+import numpy as np
+from PyQt5.QtWidgets import QStyleOptionGraphicsItem
+from PyQt5.QtGui import QColor, QPainter
+from layerItem import LayerItem
+
+
+# Толщина линий сетки в точках
+GRID_LINE_WIDTH = 4
+
+# Линии по краям холста. Есть у сетки всегда, пакетными операциями не удаляются
+BORDER_LINES = ((1, 0), (1, 100))
+
+
+# Отступы линий сетки lines (list(tuple(indentType, indent)), см. GridLayer) в точках от края холста длины size,
+# вычисленные разом для всех линий. Относительный отступ переводится в точки так же, как int(size / 100 * indent).
+# Возвращает np.ndarray с типом np.int64 в порядке линий
+def lineOffsets(lines: list, size: int) -> np.ndarray:
+    lines = np.array(lines, dtype=np.float64).reshape(-1, 2)
+    return np.where(lines[:, 0] == 0, lines[:, 1], size / 100 * lines[:, 1]).astype(np.int64)
+
+
+# Линии сетки, задающие count равных колонок (или строк) на отрезке длины size точек, разделённых промежутками по
+# gutter точек: левый и правый (верхний и нижний) края каждой колонки, с абсолютными отступами. Совпадающие линии (при
+# нулевом промежутке) не повторяются, края самого холста не включаются - их задают BORDER_LINES. Если колонки при
+# таких промежутках не помещаются, линий нет
+def divisionLines(size: int, count: int, gutter: int) -> list:
+    if count < 1:
+        return []
+    width = (size - gutter * (count - 1)) / count
+    if width < 1:
+        return []
+
+    offsets = set()
+    for i in range(count):
+        left = i * (width + gutter)
+        offsets.update((round(left), round(left + width)))
+    return [(0, offset) for offset in sorted(offsets) if 0 < offset < size]
+
+
+# Класс индекса линий сетки - общего для всех слоёв, которые привязывают содержимое к сетке (слоёв-картинок,
+# фигурных и текстовых слоёв). Хранит линии обоих направлений, упорядоченные по отступу, и их отступы в точках, и
+# отвечает на запросы привязки двоичным поиском, без перебора линий и пересчёта их отступов. Индекс неизменяем: сетка
+# строит новый при каждом своём изменении (см. GridLayer.updateOffsets), поэтому слой может хранить полученный индекс,
+# пока пользователь ведёт мышью
+# Атрибуты:
+# - self.lines - list(list(tuple(int, int))), линии сетки (indentType, indent) по возрастанию отступа. Под индексом
+# - - 0 - горизонтальные, 1 - вертикальные (как направления линий в GridLayer)
+# - self.offsets - list(list(int)), отступы линий self.lines в точках, в том же порядке
+class GridIndex:
+    def __init__(self, hLines: list, vLines: list, hOffsets: np.ndarray, vOffsets: np.ndarray) -> None:
+        self.lines = [[tuple(line) for line in hLines], [tuple(line) for line in vLines]]
+        self.offsets = [hOffsets.tolist(), vOffsets.tolist()]
+
+    # Линия направления direction (0 - горизонтальная, 1 - вертикальная), ближайшая к отступу value. Из равноудалённых
+    # линий выбирается первая по порядку
+    def nearest(self, direction: int, value: int) -> tuple:
+        lines, offsets = self.lines[direction], self.offsets[direction]
+        i = bisect_left(offsets, value)
+        if i == len(offsets) or (i > 0 and value - offsets[i - 1] <= offsets[i] - value):
+            # Первая из линий с тем же отступом
+            i = bisect_left(offsets, offsets[i - 1])
+        return lines[i]
+
+    # Ячейка сетки, в которой лежит прямоугольник (x1, y1) - (x2, y2): индексы левой, правой, верхней и нижней линий в
+    # self.lines. Левая (верхняя) - последняя линия с отступом не больше x1 (y1), правая (нижняя) - первая линия с
+    # отступом не меньше x2 (y2)
+    def cell(self, x1: int, y1: int, x2: int, y2: int) -> tuple:
+        return (bisect_right(self.offsets[1], x1) - 1, bisect_left(self.offsets[1], x2),
+                bisect_right(self.offsets[0], y1) - 1, bisect_left(self.offsets[0], y2))
 
 
 # Класс слоя сетки. В проекте имеет z=1024, дабы отображаться выше всех слоёв (на практике их не может быть столько)
@@ -19,13 +86,16 @@ from PyQt5.QtCore import Qt
 # - - задаваемый как (indentType, indent), где indentType - тип отступа линии сетки от левого края, значения:
 # - - - 0 - абсолютный отступ (задаётся в пикселях переменной indent)
 # - - - 1 - относительный отступ (задаётся в процентах от ширины изображения переменной indent)
-class GridLayer(QWidget):
-    # Инициализация атрибутов, задание разрешения, изменение фона на прозрачный
+# - self.hOffsets - np.ndarray, отступы горизонтальных линий в точках (см. lineOffsets). Пересчитываются только при
+# - - изменении линий или разрешения (см. self.updateOffsets), а не при каждой отрисовке
+# - self.vOffsets - np.ndarray, отступы вертикальных линий в точках
+# - self.index - GridIndex, индекс линий для привязки к сетке других слоёв. Строится заново при изменении линий или
+# - - разрешения
+class GridLayer(LayerItem):
+    # Инициализация атрибутов, задание разрешения
     def __init__(self, width: int, height: int) -> None:
-        super().__init__()
+        super().__init__(width, height)
 
-        self.setMinimumSize(width, height)
-        self.setMaximumSize(width, height)
         self.width = width
         self.height = height
 
@@ -34,9 +104,7 @@ class GridLayer(QWidget):
         self.hLines = [(1, 0), (1, 100)]
         self.vLines = [(1, 0), (1, 100)]
 
-        palette = self.palette()
-        palette.setBrush(QPalette.Window, QBrush(QColor(0, 0, 0, alpha=0), Qt.SolidPattern))
-        self.setPalette(palette)
+        self.updateOffsets()
 
     # Добавление новой линии сетки. Вызывается родительским классом после добавления линии через панель инструментов.
     # В качестве аргументов передаются direction - направление линии сетки (0 - горизонтальное, 1 - вертикальное),
@@ -48,7 +116,7 @@ class GridLayer(QWidget):
             self.vLines.append((indentType, indent))
 
         self.sort()
-        self.repaint()
+        self.updateOffsets()
 
     # Добавление новой линии сетки. Вызывается родительским классом после удаления линии через панель инструментов.
     # В качестве аргументов передаются direction - направление линии сетки (0 - горизонтальное, 1 - вертикальное),
@@ -60,7 +128,41 @@ class GridLayer(QWidget):
         elif direction == 1:
             self.vLines.remove((indentType, indent))
 
-        self.repaint()
+        self.updateOffsets()
+
+    # Пакетное изменение линий направления direction (0 - горизонтальные, 1 - вертикальные): удаление линий removed и
+    # добавление линий added за один проход, с одной сортировкой и одной перерисовкой, вместо вызова self.deleteLine и
+    # self.addLine для каждой линии
+    def changeLines(self, direction: int, added=(), removed=()) -> None:
+        lines = self.hLines if direction == 0 else self.vLines
+        removed = {tuple(line) for line in removed}
+        lines[:] = [line for line in lines if tuple(line) not in removed] + [tuple(line) for line in added]
+
+        self.sort()
+        self.updateOffsets()
+
+    # Замена всех линий сетки на hLines и vLines за один проход. Линии по краям холста (BORDER_LINES) остаются
+    def replaceLines(self, hLines: list, vLines: list) -> None:
+        self.hLines = list(BORDER_LINES) + [tuple(line) for line in hLines if tuple(line) not in BORDER_LINES]
+        self.vLines = list(BORDER_LINES) + [tuple(line) for line in vLines if tuple(line) not in BORDER_LINES]
+
+        self.sort()
+        self.updateOffsets()
+
+    # Удаление всех линий направления direction с отступами от first до last точек включительно, кроме линий по краям
+    # холста. Линии диапазона находятся двоичным поиском по индексу
+    def deleteRange(self, direction: int, first: int, last: int) -> None:
+        offsets, lines = self.index.offsets[direction], self.index.lines[direction]
+        lines = lines[bisect_left(offsets, first):bisect_right(offsets, last)]
+        self.changeLines(direction, removed=[line for line in lines if line not in BORDER_LINES])
+
+    # Разбиение холста по направлению direction на count равных колонок (1 - вертикальными линиями) или строк
+    # (0 - горизонтальными) с промежутками по gutter точек: все линии этого направления заменяются краями колонок
+    # (см. divisionLines)
+    def divide(self, direction: int, count: int, gutter: int) -> None:
+        lines = self.hLines if direction == 0 else self.vLines
+        self.changeLines(direction, added=divisionLines(self.height if direction == 0 else self.width, count, gutter),
+                         removed=[line for line in lines if tuple(line) not in BORDER_LINES])
 
     # Сортировка списков линий сетки. Проводится при каждом добавлении новой линии. Это нужно для того, чтобы
     # слои-картинки, фигурные слои и текстовые слои, которым эти списки передаются для корректной отрисовки по линиям
@@ -70,29 +172,51 @@ class GridLayer(QWidget):
         self.hLines.sort(key=lambda x: x[1] if x[0] == 0 else self.height / 100 * x[1])
         self.vLines.sort(key=lambda x: x[1] if x[0] == 0 else self.width / 100 * x[1])
 
-    # Отрисовка линий сетки по одной. Каждая из них, в силу z=1024, рисуется выше содержимого любого другого слоя
-    # (!) Функция работает за линейное время от количества линий сетки
-    def paintEvent(self, event: QPaintEvent) -> None:
-        qp = QPainter(self)
+    # Состояние слоя, отслеживаемое историей изменений (см. history.py): копии списков линий сетки
+    def saveState(self) -> dict:
+        return {'hLines': list(self.hLines), 'vLines': list(self.vLines)}
+
+    # Восстановление части состояния слоя (при отмене и возврате действий), ключи - как в self.saveState
+    def restoreState(self, state: dict) -> None:
+        for key, value in state.items():
+            setattr(self, key, list(value))
+
+        self.sort()
+        self.updateOffsets()
+
+    # Пересчёт отступов линий в точках, построение индекса линий и перерисовка слоя. Вызывается при каждом изменении
+    # линий или разрешения
+    def updateOffsets(self) -> None:
+        self.hOffsets = lineOffsets(self.hLines, self.height)
+        self.vOffsets = lineOffsets(self.vLines, self.width)
+        self.index = GridIndex(self.hLines, self.vLines, self.hOffsets, self.vOffsets)
+        self.update()
+
+    # Отрисовка слоя. Каждая линия, в силу z=1024, рисуется выше содержимого любого другого слоя. Рисуются только линии,
+    # задевающие перерисовываемую (видимую) область: они находятся двоичным поиском по упорядоченным отступам индекса,
+    # поэтому время отрисовки зависит от числа видимых линий, а не от их общего числа, и слой не хранит картинок
+    def paint(self, qp: QPainter, option: QStyleOptionGraphicsItem, widget=None) -> None:
         pen = qp.pen()
-        pen.setWidth(4)
+        pen.setWidth(GRID_LINE_WIDTH)
         pen.setColor(QColor(0, 0, 255))
         qp.setPen(pen)
 
-        for indentType, indent in self.hLines:
-            if indentType == 0:
-                qp.drawLine(0, indent, self.width, indent)
-            elif indentType == 1:
-                qp.drawLine(0, int(self.height / 100 * indent), self.width, int(self.height / 100 * indent))
-        for indentType, indent in self.vLines:
-            if indentType == 0:
-                qp.drawLine(indent, 0, indent, self.height)
-            elif indentType == 1:
-                qp.drawLine(int(self.width / 100 * indent), 0, int(self.width / 100 * indent), self.height)
+        # Видимая область, расширенная на половину толщины линии
+        margin = GRID_LINE_WIDTH // 2
+        rect = option.exposedRect.toAlignedRect().adjusted(-margin, -margin, margin, margin)
+        left, right = max(rect.left(), 0), min(rect.right(), self.width)
+        top, bottom = max(rect.top(), 0), min(rect.bottom(), self.height)
+
+        hOffsets, vOffsets = self.index.offsets
+        for y in hOffsets[bisect_left(hOffsets, rect.top()):bisect_right(hOffsets, rect.bottom())]:
+            qp.drawLine(left, y, right, y)
+        for x in vOffsets[bisect_left(vOffsets, rect.left()):bisect_right(vOffsets, rect.right())]:
+            qp.drawLine(x, top, x, bottom)
 
     # Задание нового разрешения. Вызывается родительским классом Window при изменении разрешения проекта
     # параметр stretch ничего не задаёт, так как сетка в любом случае должна подгоняться под новое разрешение
     def setResolution(self, width: int, height: int, stretch: bool) -> None:
+        self.resize(width, height)
         self.width, self.height = width, height
         self.sort()
-        self.repaint()
+        self.updateOffsets()
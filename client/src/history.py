@@ -0,0 +1,164 @@
+import time
+from PyQt5.QtGui import QImage
+from PyQt5.QtCore import QRect
+from tiledBitmap import decompressTile
+
+
+# В этом файле описана история изменений проекта (отмена и возврат действий). История хранит не копии слоёв, а только
+# разницу между состояниями до и после каждого действия:
+# - для растрового слоя - сжатое содержимое только тех плиток, которые действие затронуло (см. TileChange)
+# - для остальных слоёв - значения только тех атрибутов, которые действие изменило (см. PropertyChange)
+# Поэтому отмена мазка кистью на большом холсте занимает в памяти примерно столько, сколько занимает сам мазок
+
+
+# Примерный объём памяти, занимаемый значением атрибута слоя в истории. Картинки и строки (HTML текстового слоя)
+# учитываются по размеру, всё остальное (числа, цвета, кортежи линий сетки) считается небольшим постоянным объёмом
+def valueSize(value) -> int:
+    if isinstance(value, QImage):
+        return value.sizeInBytes()
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, list):
+        return 64 * len(value)
+    return 64
+
+
+# Действие над растровым слоем: изменение содержимого нескольких плиток
+# Атрибуты:
+# - self.layer - BitmapLayer, слой, к которому относится действие
+# - self.before - dict(tuple(int, int), bytes), сжатые плитки до действия (None - плитки не было)
+# - self.after - dict(tuple(int, int), bytes), сжатые плитки после действия (None - плитки нет)
+# - self.size - int, объём памяти, занимаемый действием, в байтах
+class TileChange:
+    def __init__(self, layer, before: dict, after: dict) -> None:
+        self.layer = layer
+        self.before = before
+        self.after = after
+        self.size = sum(len(data) for data in list(before.values()) + list(after.values()) if data is not None)
+
+    def undo(self) -> None:
+        self.apply(self.before)
+
+    def redo(self) -> None:
+        self.apply(self.after)
+
+    # Запись плиток tiles в хранилище слоя и перерисовка только изменённых плиток
+    def apply(self, tiles: dict) -> None:
+        rect = QRect()
+        for key, data in tiles.items():
+            if data is None:
+                self.layer.bitmap.tiles.pop(key, None)
+            else:
+                self.layer.bitmap.tiles[key] = decompressTile(data)
+            rect = rect.united(self.layer.bitmap.tileRect(*key))
+
+        self.layer.markDirty(rect)
+
+
+# Действие над слоем любого другого типа: изменение нескольких атрибутов. Слой должен иметь методы saveState
+# (словарь атрибутов, которые отслеживаются историей) и restoreState (задание части этих атрибутов и перерисовка)
+# Атрибуты:
+# - self.layer - LayerItem, слой, к которому относится действие
+# - self.before - dict(str, object), значения изменённых атрибутов до действия
+# - self.after - dict(str, object), значения изменённых атрибутов после действия
+# - self.size - int, примерный объём памяти, занимаемый действием, в байтах (см. valueSize)
+# - self.time - float, время последнего изменения действия (для объединения действий, см. History.pushState)
+class PropertyChange:
+    def __init__(self, layer, before: dict, after: dict) -> None:
+        self.layer = layer
+        self.before = before
+        self.after = after
+        self.size = sum(valueSize(value) for value in list(before.values()) + list(after.values()))
+        self.time = time.monotonic()
+
+    def undo(self) -> None:
+        self.layer.restoreState(self.before)
+
+    def redo(self) -> None:
+        self.layer.restoreState(self.after)
+
+
+# Класс истории изменений. Хранит два стека действий: отменяемые и возвращаемые. Любое новое действие очищает стек
+# возвращаемых. Если суммарный объём действий превышает self.memoryLimit, самые старые действия забываются
+# Атрибуты:
+# - self.memoryLimit - int, максимальный объём памяти, занимаемый историей, в байтах
+# - self.mergeInterval - float, время в секундах, в течение которого подряд идущие изменения одних и тех же атрибутов
+# - - одного слоя объединяются в одно действие (например, движение ползунка толщины)
+# - self.undoStack - list(TileChange | PropertyChange), действия, которые можно отменить (последнее - в конце)
+# - self.redoStack - list(TileChange | PropertyChange), отменённые действия, которые можно вернуть
+# - self.memoryUsed - int, суммарный объём памяти всех действий в обоих стеках, в байтах
+class History:
+    def __init__(self, memoryLimit: int, mergeInterval=1.0) -> None:
+        self.memoryLimit = memoryLimit
+        self.mergeInterval = mergeInterval
+        self.undoStack = []
+        self.redoStack = []
+        self.memoryUsed = 0
+
+    # Добавление изменения содержимого растрового слоя. changes - результат TiledBitmap.endChange
+    def pushTiles(self, layer, changes) -> None:
+        if changes:
+            self.push(TileChange(layer, *changes))
+
+    # Добавление изменения атрибутов слоя. before - результат layer.saveState() до изменения. В действие попадают
+    # только атрибуты, значение которых изменилось; если таких нет, действие не добавляется. Если merge истинно, то
+    # изменение объединяется с предыдущим действием, изменившим те же атрибуты того же слоя не раньше, чем
+    # self.mergeInterval секунд назад (так серия изменений с панели инструментов отменяется за один раз)
+    def pushState(self, layer, before: dict, merge=False) -> None:
+        after = layer.saveState()
+        keys = [key for key in after if before.get(key) != after[key]]
+        if not keys:
+            return
+
+        last = self.undoStack[-1] if merge and self.undoStack and not self.redoStack else None
+        if isinstance(last, PropertyChange) and last.layer is layer and set(last.after) == set(keys) and \
+                time.monotonic() - last.time < self.mergeInterval:
+            self.memoryUsed -= last.size
+            self.undoStack.pop()
+            before = last.before
+
+        self.push(PropertyChange(layer, {key: before[key] for key in keys}, {key: after[key] for key in keys}))
+
+    # Добавление действия в историю с очисткой стека возвращаемых действий и соблюдением ограничения памяти
+    def push(self, change) -> None:
+        for redone in self.redoStack:
+            self.memoryUsed -= redone.size
+        self.redoStack.clear()
+
+        self.undoStack.append(change)
+        self.memoryUsed += change.size
+        while self.memoryUsed > self.memoryLimit and len(self.undoStack) > 1:
+            self.memoryUsed -= self.undoStack.pop(0).size
+
+    # Отмена последнего действия. Возвращает слой, которого оно касалось, или None, если отменять нечего
+    def undo(self):
+        if not self.undoStack:
+            return None
+
+        change = self.undoStack.pop()
+        change.undo()
+        self.redoStack.append(change)
+        return change.layer
+
+    # Возврат последнего отменённого действия. Возвращает слой, которого оно касалось, или None
+    def redo(self):
+        if not self.redoStack:
+            return None
+
+        change = self.redoStack.pop()
+        change.redo()
+        self.undoStack.append(change)
+        return change.layer
+
+    # Удаление из истории всех действий, касающихся слоя layer (вызывается при удалении слоя)
+    def forget(self, layer) -> None:
+        for stack in (self.undoStack, self.redoStack):
+            for change in [change for change in stack if change.layer is layer]:
+                self.memoryUsed -= change.size
+                stack.remove(change)
+
+    # Полная очистка истории (при создании, открытии проекта и изменении его разрешения)
+    def clear(self) -> None:
+        self.undoStack.clear()
+        self.redoStack.clear()
+        self.memoryUsed = 0
@@ -0,0 +1,19 @@
+import numpy as np
+from PyQt5.QtGui import QImage
+
+
+# В этом файле описан прямой доступ к точкам QImage из NumPy. Им пользуются все модули, которые обрабатывают точки
+# изображений массивами (плиточное хранилище, сведение слоёв, mip-уровни, ...)
+
+
+# Получение NumPy-представления точек QImage без копирования.
+# Возвращает np.ndarray формы (height, width) с типом np.uint32; изменения массива сразу видны в самом изображении.
+# Представление действительно, пока изображение не удалено и не пересоздано (например, в setResolution).
+# Если writable ложно, массив доступен только для чтения и строится через constBits, поэтому изображение не
+# копируется, даже если его данные разделены с другим QImage (так из одного изображения можно читать в нескольких
+# потоках одновременно)
+def imageArray(image: QImage, writable=True) -> np.ndarray:
+    pointer = image.bits() if writable else image.constBits()
+    pointer.setsize(image.sizeInBytes())
+    pixels = np.frombuffer(pointer, dtype=np.uint32)
+    return pixels.reshape(image.height(), image.bytesPerLine() // 4)[:, :image.width()]
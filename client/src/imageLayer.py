@@ -1,6 +1,7 @@
-from PyQt5.QtWidgets import QWidget
-from PyQt5.QtGui import QImage, QPainter, QPalette, QBrush, QColor, QPaintEvent, QMouseEvent
-from PyQt5.QtCore import Qt, QRect, QPoint
+from PyQt5.QtWidgets import QWidget, QStyleOptionGraphicsItem
+from PyQt5.QtGui import QImage, QPainter, QBrush, QColor, QMouseEvent
+from PyQt5.QtCore import Qt, QRect, QRectF, QPoint
+from layerItem import LayerItem
 
 
 # Класс слоя-картинки. Сигналов не сообщает
@@ -19,8 +20,8 @@ from PyQt5.QtCore import Qt, QRect, QPoint
 # - - в котором картинка лежит), False - ЛКМ отпущена.
 # - self.curMousePos - QPoint, первая точка, задающая прямоугольник, в котором будет лежать картинка, "рисуемый" сейчас
 # - self.lastMousePos - QPoint, вторяя точка, задающая прямоугольник, в котором будет лежать картинка, "рисуемый" сейчас
-# - self.gridLines - list(list(tuple(int, int))) - список линий сетки. Под индеком 0 - горизонтальные, 1 - вертикальные.
-# - - В каждом подсписке линия сетки задаётся как tuple(indentType, indent), где indentType - тип отступа линии
+# - self.gridIndex - GridIndex или None, индекс линий сетки (см. gridLayer.GridIndex), взятый у сетки при нажатии ЛКМ.
+# - - Линия сетки задаётся как tuple(indentType, indent), где indentType - тип отступа линии
 # - - от верхнего (для горизонтальных) или левого (для вертикальных) края, значения:
 # - - - 0 - абсолютный отступ (задаётся в пикселях переменной indent)
 # - - - 1 - относительный отступ (задаётся в процентах от высоты (для горизонтальных) или ширины (для вертикальных)
@@ -43,18 +44,16 @@ from PyQt5.QtCore import Qt, QRect, QPoint
 # - self.xOffset - int, отступ по горизонтали в пикселях от точки, где картинка должна лежать идеально по сетке
 # - self.yOffset - int, отступ по вертикали в пикселях от точки, где картинка должна лежать идеально по сетке
 # - self.size - int, масштаб, в котором картинка отображается (в процентах от фактического размера)
-class ImageLayer(QWidget):
+# - self.stateBeforeDrawing - dict, состояние слоя (см. self.saveState) на момент нажатия ЛКМ. По нему при отпускании
+# - - ЛКМ в историю изменений окна добавляется изменение прямоугольника и оффсета картинки
+class ImageLayer(LayerItem):
     def __init__(self, imagePath: str, width: int, height: int, parent: QWidget) -> None:
-        super().__init__()
+        super().__init__(width, height)
         self.parent = parent
 
         self.image = QImage(imagePath)
         self.imagePath = imagePath
 
-        self.setMinimumSize(width, height)
-        self.setMaximumSize(width, height)
-        self.resolution = width, height
-
         self.tool = 'none'
         self.active = False
         self.drawing = False
@@ -62,7 +61,7 @@ class ImageLayer(QWidget):
         self.curMousePos = QPoint(0, 0)
         self.lastMousePos = QPoint(0, 0)
 
-        self.gridLines = []
+        self.gridIndex = None
 
         self.alignment = 'none'
         self.leftBorder = (1, 0)
@@ -74,9 +73,7 @@ class ImageLayer(QWidget):
         self.yOffset = 0
         self.size = 100
 
-        palette = self.palette()
-        palette.setBrush(QPalette.Window, QBrush(QColor(0, 0, 0, alpha=0), Qt.SolidPattern))
-        self.setPalette(palette)
+        self.stateBeforeDrawing = dict()
 
     # Функция задания картинки из потока байтов. Вызывается родительским классом при открытии проекта
     def setBits(self, bits: bytes) -> None:
@@ -88,33 +85,6 @@ class ImageLayer(QWidget):
         self.image = self.image.scaled(self.image.width() * self.size / 100, self.image.height() * self.size / 100,
                                        aspectRatioMode=Qt.IgnoreAspectRatio)
 
-    # Функция нахождения ограничивающих линий прямоугольника, в котором картинка лежит. Возвращает индексы линий в
-    # соответствующих подсписках в списке self.gridLines. Используется самим классом при отрисовке
-    def findBoundaryGridLines(self, x1: int, y1: int, x2: int, y2: int) -> tuple:
-        leftGridLine = 0
-        while leftGridLine < len(self.gridLines[1]) and \
-                self.gridLineToOffset(1, *self.gridLines[1][leftGridLine]) <= x1:
-            leftGridLine += 1
-        leftGridLine -= 1
-
-        topGridLine = 0
-        while topGridLine < len(self.gridLines[0]) and \
-                self.gridLineToOffset(0, *self.gridLines[0][topGridLine]) <= y1:
-            topGridLine += 1
-        topGridLine -= 1
-
-        rightGridLine = len(self.gridLines[1]) - 1
-        while rightGridLine > -1 and self.gridLineToOffset(1, *self.gridLines[1][rightGridLine]) >= x2:
-            rightGridLine -= 1
-        rightGridLine += 1
-
-        bottomGridLine = len(self.gridLines[0]) - 1
-        while bottomGridLine > -1 and self.gridLineToOffset(0, *self.gridLines[0][bottomGridLine]) >= y2:
-            bottomGridLine -= 1
-        bottomGridLine += 1
-
-        return leftGridLine, rightGridLine, topGridLine, bottomGridLine
-
     # Функция отрисовки прямоугольника из линий сетки, в котором картинка лежит. Рисуется только когда пользователь
     # рисует (для удобства предпросмотра). Фактически является вынесенной частью функции self.paintEvent
     def drawGridRect(self, painter: QPainter) -> None:
@@ -131,35 +101,27 @@ class ImageLayer(QWidget):
         x1, y1, x2, y2 = max(x1, 1), max(y1, 1), min(x2, self.resolution[0] - 1), min(y2, self.resolution[1] - 1)
         qp.drawRect(x1, y1, x2 - x1, y2 - y1)
 
-        leftGridLine, rightGridLine, topGridLine, bottomGridLine = self.findBoundaryGridLines(x1, y1, x2, y2)
-        qp.fillRect(QRect(QPoint(self.gridLineToOffset(1, *self.gridLines[1][leftGridLine]),
-                                 self.gridLineToOffset(0, *self.gridLines[0][topGridLine])),
-                          QPoint(self.gridLineToOffset(1, *self.gridLines[1][rightGridLine]),
-                                 self.gridLineToOffset(0, *self.gridLines[0][bottomGridLine]))),
+        leftGridLine, rightGridLine, topGridLine, bottomGridLine = self.gridIndex.cell(x1, y1, x2, y2)
+        offsets = self.gridIndex.offsets
+        qp.fillRect(QRect(QPoint(offsets[1][leftGridLine], offsets[0][topGridLine]),
+                          QPoint(offsets[1][rightGridLine], offsets[0][bottomGridLine])),
                     QBrush(QColor(0, 0, 255, alpha=64)))
 
-    # Функция отрисовки содержимого слоя. Преобразует ограничивающие линии сетки в заданные абсолютно, далее, в
-    # зависимости от типа выравнивания, вычисляет левую верхнюю точку картинки и рисует саму картинку
-    def paintEvent(self, event: QPaintEvent) -> None:
-        qp = QPainter(self)
-        qp.setRenderHint(QPainter.Antialiasing)
-
+    # Прямоугольник, в котором рисуется картинка. Преобразует ограничивающие линии сетки в заданные абсолютно, далее,
+    # в зависимости от типа выравнивания, вычисляет левую верхнюю точку картинки (или, при заполнении, растягивает
+    # картинку на весь прямоугольник сетки)
+    def imageRect(self) -> QRect:
         leftBorder = self.gridLineToOffset(1, *self.leftBorder)
         rightBorder = self.gridLineToOffset(1, *self.rightBorder)
         topBorder = self.gridLineToOffset(0, *self.topBorder)
         bottomBorder = self.gridLineToOffset(0, *self.bottomBorder)
 
         if self.alignment == 'fill':
-            qp.drawImage(QRect(QPoint(leftBorder + self.xOffset, topBorder + self.yOffset),
-                               QPoint(rightBorder + self.xOffset, bottomBorder + self.yOffset)),
-                         self.image)
-            self.drawGridRect(qp)
-            return
+            return QRect(QPoint(leftBorder + self.xOffset, topBorder + self.yOffset),
+                         QPoint(rightBorder + self.xOffset, bottomBorder + self.yOffset))
 
         if self.alignment == 'none':
-            qp.drawImage(self.xOffset, self.yOffset, self.image)
-            self.drawGridRect(qp)
-            return
+            return QRect(self.xOffset, self.yOffset, self.image.width(), self.image.height())
 
         if self.alignment in {'lt', 'left', 'lb'}:
             x = leftBorder
@@ -175,7 +137,25 @@ class ImageLayer(QWidget):
         else:
             y = bottomBorder - self.image.height()
 
-        qp.drawImage(x + self.xOffset, y + self.yOffset, self.image)
+        return QRect(x + self.xOffset, y + self.yOffset, self.image.width(), self.image.height())
+
+    # Содержимое слоя - прямоугольник картинки
+    def contentRect(self) -> QRectF:
+        return QRectF(self.imageRect())
+
+    # Функция отрисовки содержимого слоя. Рисуется только видимая часть картинки: из картинки вырезается
+    # соответствующая ей область (при заполнении - с учётом растяжения). Если картинка целиком вне окна просмотра,
+    # она не рисуется вовсе
+    def paint(self, qp: QPainter, option: QStyleOptionGraphicsItem, widget=None) -> None:
+        qp.setRenderHint(QPainter.Antialiasing)
+
+        target = QRectF(self.imageRect())
+        visible = self.visibleRect(option)
+        if not visible.isEmpty() and not self.image.isNull():
+            xScale, yScale = self.image.width() / target.width(), self.image.height() / target.height()
+            source = QRectF((visible.x() - target.x()) * xScale, (visible.y() - target.y()) * yScale,
+                            visible.width() * xScale, visible.height() * yScale)
+            qp.drawImage(visible, self.image, source)
 
         self.drawGridRect(qp)
 
@@ -185,6 +165,20 @@ class ImageLayer(QWidget):
     def gridLineToOffset(self, direction: int, indentType: int, indent: int) -> int:
         return int(self.resolution[direction ^ 1] / 100 * indent) if indentType == 1 else indent
 
+    # Состояние слоя, отслеживаемое историей изменений (см. history.py). Картинка хранится ссылкой (QImage не копирует
+    # данные, пока их не изменяют), поэтому отмена смены картинки не требует её повторной загрузки с диска
+    def saveState(self) -> dict:
+        return {'image': self.image, 'imagePath': self.imagePath, 'size': self.size, 'alignment': self.alignment,
+                'leftBorder': self.leftBorder, 'rightBorder': self.rightBorder, 'topBorder': self.topBorder,
+                'bottomBorder': self.bottomBorder, 'xOffset': self.xOffset, 'yOffset': self.yOffset}
+
+    # Восстановление части состояния слоя (при отмене и возврате действий), ключи - как в self.saveState
+    def restoreState(self, state: dict) -> None:
+        for key, value in state.items():
+            setattr(self, key, value)
+
+        self.update()
+
     # Обновление слоя извне при изменении состояния панели инструментов пользователем
     def updateState(self, size: int, alignment: str, tool: str) -> None:
         self.tool = tool
@@ -192,18 +186,17 @@ class ImageLayer(QWidget):
         self.size = size
 
         self.setImage(self.imagePath)
-        self.repaint()
+        self.update()
 
     # Обновления картинки слоя извне при выборе новой картинки пользователем на панели инструментов
     def updateImage(self, imagePath: str) -> None:
         self.setImage(imagePath)
         self.imagePath = imagePath
 
-        self.repaint()
+        self.update()
 
-    # Обработчик нажатия кнопки мыши. Если слой неактивен, но находится поверх остальных (имеет наибольший z),
-    # то event будет приходить ему. В таком случае слой через self.parent передает нажатие на нужный слой.
-    # В противном случае включается self.drawing и обновляется self.lastMousePos (при задании и оффсета, и
+    # Обработчик нажатия кнопки мыши. События мыши слою доставляет Window.inputRouter, и только когда слой активен.
+    # Включается self.drawing и обновляется self.lastMousePos (при задании и оффсета, и
     # прямоугольника он используется)
     def mousePressEvent(self, event: QMouseEvent) -> None:
         if self.active:
@@ -213,16 +206,12 @@ class ImageLayer(QWidget):
             self.drawing = True
             self.lastMousePos = event.pos()
             self.curMousePos = event.pos()
+            self.stateBeforeDrawing = self.saveState()
 
             if self.tool == 'grid':
-                self.gridLines = [self.parent.scene.items()[1].widget().hLines,
-                                  self.parent.scene.items()[1].widget().vLines]
-        elif self.parent.currentLayer != -1:
-            self.parent.scene.items()[self.parent.currentLayer].widget().mousePressEvent(event)
-
-    # Обработчик движения мыши. Если слой неактивен, но находится поверх остальных (имеет наибольший z),
-    # то event будет приходить ему. В таком случае слой через self.parent передает нажатие на нужный слой.
-    # В противном случае проверяется, что мышь уже была нажата ранее и выбран инструмент.
+                self.gridIndex = self.parent.registry.grid().index
+
+    # Обработчик движения мыши. Проверяется, что мышь уже была нажата ранее и выбран инструмент.
     # Если инструмент - задание оффсета, то оффсет сразу обновляется для корректной перерисовки слоя, если
     # задаётся прямоугольник линий сетки, то меняется лишь его вторая задающая точка
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
@@ -234,14 +223,11 @@ class ImageLayer(QWidget):
             elif self.tool == 'grid':
                 self.curMousePos = event.pos()
 
-            self.repaint()
-        elif not self.active and self.parent.currentLayer != -1:
-            self.parent.scene.items()[self.parent.currentLayer].widget().mouseMoveEvent(event)
+            self.update()
 
-    # Обработчик отпускания кнопки мыши. Если слой неактивен, но находится поверх остальных (имеет наибольший z),
-    # то event будет приходить ему. В таком случае слой через self.parent передает нажатие на нужный слой.
-    # В противном случае проверяется, идет ли сейчас рисование. Если да, то оно заканчивается, => надо переопределить
-    # прямоугольник сетки, если пользователь хотел это сделать, тогда он находится заново, и слой отрисовывается
+    # Обработчик отпускания кнопки мыши. Проверяется, идет ли сейчас рисование. Если да, то оно заканчивается, => надо
+    # переопределить прямоугольник сетки, если пользователь хотел это сделать, тогда он находится заново, и слой
+    # отрисовывается. Изменения прямоугольника и оффсета картинки добавляются в историю изменений окна
     def mouseReleaseEvent(self, event: QMouseEvent) -> None:
         if self.active and self.drawing:
             self.drawing = False
@@ -254,21 +240,19 @@ class ImageLayer(QWidget):
                 x1, y1, x2, y2 = max(x1, 1), max(y1, 1), \
                                  min(x2, self.resolution[0] - 1), min(y2, self.resolution[1] - 1)
 
-                leftGridLine, rightGridLine, topGridLine, bottomGridLine = self.findBoundaryGridLines(x1, y1, x2, y2)
+                leftGridLine, rightGridLine, topGridLine, bottomGridLine = self.gridIndex.cell(x1, y1, x2, y2)
+
+                self.leftBorder = self.gridIndex.lines[1][leftGridLine]
+                self.rightBorder = self.gridIndex.lines[1][rightGridLine]
+                self.topBorder = self.gridIndex.lines[0][topGridLine]
+                self.bottomBorder = self.gridIndex.lines[0][bottomGridLine]
 
-                self.leftBorder = self.gridLines[1][leftGridLine]
-                self.rightBorder = self.gridLines[1][rightGridLine]
-                self.topBorder = self.gridLines[0][topGridLine]
-                self.bottomBorder = self.gridLines[0][bottomGridLine]
+                self.update()
 
-                self.repaint()
-        elif not self.active and self.parent.currentLayer != -1:
-            self.parent.scene.items()[self.parent.currentLayer].widget().mouseMoveEvent(event)
+            self.parent.history.pushState(self, self.stateBeforeDrawing)
 
     # Задание нового разрешения. Вызывается родительским классом Window при изменении разрешения проекта
     # параметр stretch ничего не задаёт, так как картинка в любом случае должна подгоняться под обновлённую сетку
     def setResolution(self, width: int, height: int, stretch: bool):
-        self.setMinimumSize(width, height)
-        self.setMaximumSize(width, height)
-        self.resolution = width, height
-        self.repaint()
+        self.resize(width, height)
+        self.update()
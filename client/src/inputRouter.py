@@ -0,0 +1,116 @@
+from PyQt5.QtGui import QMouseEvent
+from PyQt5.QtCore import QObject, QEvent, QTimer, pyqtSlot
+from bitmapLayer import BitmapLayer
+from textLayer import TextLayer
+
+
+# Класс маршрутизатора событий мыши. Устанавливается фильтром событий на сцену окна (Window.scene) и перехватывает
+# все события мыши сцены до того, как сцена начнёт искать элемент под курсором. Каждое событие сразу передаётся
+# обработчику активного слоя (в координатах слоя), поэтому неактивные слои в обработке событий не участвуют вовсе, а
+# слои не пересылают события друг другу.
+# События движения мыши объединяются: если до обработки накопленного движения пришло новое, старое отбрасывается, и
+# слой получает только последнее положение мыши. Исключение - мазок растрового слоя: для него важна каждая точка, а
+# их объединение по кадрам уже делает сеанс рисования (см. strokeSession.py).
+# Нажатие внутри поля ввода активного текстового слоя не перехватывается: его, как и все события до отпускания
+# кнопки, обрабатывает само поле ввода (установка курсора, выделение текста)
+# Атрибуты:
+# - self.parent - Window, окно, активному слою которого доставляются события
+# - self.pendingMove - tuple(LayerItem, QMouseEvent) или None, ещё не доставленное движение мыши и слой, которому оно
+# - - предназначено
+# - self.flushTimer - QTimer, однократный таймер с нулевым интервалом: доставляет накопленное движение, как только
+# - - обработаны все уже пришедшие события
+# - self.passThrough - bool, True - идёт нажатие внутри поля ввода текстового слоя, события не перехватываются
+# - self.dispatched - int, число событий, доставленных слоям
+# - self.dropped - int, число отброшенных движений мыши: накопленных движений, заменённых более новым
+class InputRouter(QObject):
+    def __init__(self, parent) -> None:
+        super().__init__(parent)
+
+        self.parent = parent
+        self.pendingMove = None
+        self.passThrough = False
+        self.dispatched = 0
+        self.dropped = 0
+
+        self.flushTimer = QTimer(self)
+        self.flushTimer.setSingleShot(True)
+        self.flushTimer.setInterval(0)
+        self.flushTimer.timeout.connect(self.flush)
+
+    # Фильтр событий сцены. Возвращает True, если событие обработано маршрутизатором и сцене передаваться не должно
+    def eventFilter(self, watched: QObject, event: QEvent) -> bool:
+        if event.type() not in (QEvent.GraphicsSceneMousePress, QEvent.GraphicsSceneMouseDoubleClick,
+                                QEvent.GraphicsSceneMouseMove, QEvent.GraphicsSceneMouseRelease):
+            return False
+
+        if self.passThrough:
+            if event.type() == QEvent.GraphicsSceneMouseRelease:
+                self.passThrough = False
+            return False
+
+        layer = self.parent.activeLayer()
+        if layer is None:
+            return True
+
+        layerPos = layer.mapFromScene(event.scenePos())
+        pos = layerPos.toPoint()
+        if event.type() in (QEvent.GraphicsSceneMousePress, QEvent.GraphicsSceneMouseDoubleClick) and \
+                isinstance(layer, TextLayer) and layer.textProxy.geometry().contains(layerPos):
+            self.flush()
+            self.passThrough = True
+            return False
+
+        if event.type() == QEvent.GraphicsSceneMouseMove:
+            mouseEvent = QMouseEvent(QEvent.MouseMove, pos, event.button(), event.buttons(), event.modifiers())
+            if isinstance(layer, BitmapLayer) and layer.stroke is not None:
+                self.flush()
+                self.dispatch(layer, mouseEvent)
+            else:
+                if self.pendingMove is not None:
+                    self.dropped += 1
+                self.pendingMove = (layer, mouseEvent)
+                self.flushTimer.start()
+            return True
+
+        # Перед нажатием и отпусканием доставляется накопленное движение, чтобы слой получил события в их порядке
+        self.flush()
+        if event.type() == QEvent.GraphicsSceneMouseRelease:
+            self.dispatch(layer, QMouseEvent(QEvent.MouseButtonRelease, pos, event.button(), event.buttons(),
+                                             event.modifiers()))
+        else:
+            self.dispatch(layer, QMouseEvent(QEvent.MouseButtonPress, pos, event.button(), event.buttons(),
+                                             event.modifiers()))
+        return True
+
+    # Доставка накопленного движения мыши. Слот сигнала self.flushTimer.timeout
+    @pyqtSlot()
+    def flush(self) -> None:
+        self.flushTimer.stop()
+        if self.pendingMove is not None:
+            layer, event = self.pendingMove
+            self.pendingMove = None
+            self.dispatch(layer, event)
+
+    # Передача события event обработчику слоя layer
+    def dispatch(self, layer, event: QMouseEvent) -> None:
+        self.dispatched += 1
+        if event.type() == QEvent.MouseButtonPress:
+            layer.mousePressEvent(event)
+        elif event.type() == QEvent.MouseMove:
+            layer.mouseMoveEvent(event)
+        else:
+            layer.mouseReleaseEvent(event)
+
+    # Отмена накопленного движения и обнуление счётчиков событий (при смене или удалении активного слоя)
+    def reset(self) -> None:
+        self.flushTimer.stop()
+        self.pendingMove = None
+        self.passThrough = False
+        self.dispatched = 0
+        self.dropped = 0
+
+    # Счётчики событий. Словарь с ключами:
+    # - dispatched - int, число событий, доставленных слоям
+    # - dropped - int, число отброшенных движений мыши, заменённых более новыми до доставки
+    def counters(self) -> dict:
+        return {'dispatched': self.dispatched, 'dropped': self.dropped}
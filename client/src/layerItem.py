@@ -0,0 +1,68 @@
+from PyQt5.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+from PyQt5.QtGui import QPainter
+from PyQt5.QtCore import QRectF
+
+
+# Базовый класс слоя. Каждый слой - обычный элемент сцены (QGraphicsItem), а не виджет во вставке
+# QGraphicsProxyWidget: у него нет собственного окна, палитры, стиля и буфера, сцена рисует его напрямую, вызывая
+# self.paint, и знает его границы (self.boundingRect), поэтому перерисовывает только изменившиеся области.
+# Наследники переопределяют self.paint; перерисовка слоя запрашивается методом self.update (QGraphicsItem.update),
+# сама отрисовка происходит при ближайшем обновлении сцены
+# Атрибуты:
+# - self.resolution - tuple(int, int), ширина и высота слоя, а равно и всего проекта
+# - self.composite - CompositeItem или None, слепок, в который сейчас сведён слой (см. compositeCache.py)
+# - self.mipmaps - MipPyramid или None, уменьшенные копии содержимого слоя для мелкого масштаба (см. mipmap.py). Есть
+# - - только у слоёв, которые при мелком масштабе рисуются уменьшенными копиями
+class LayerItem(QGraphicsItem):
+    def __init__(self, width: int, height: int) -> None:
+        super().__init__()
+
+        self.resolution = width, height
+        self.composite = None
+        self.mipmaps = None
+
+        # Иначе в self.paint не передаётся перерисовываемая область (option.exposedRect)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    # Границы слоя в его координатах - весь холст
+    def boundingRect(self) -> QRectF:
+        return QRectF(0, 0, *self.resolution)
+
+    # Область, в которой лежит содержимое слоя (QRectF в координатах слоя). По умолчанию - весь холст. Наследники
+    # сужают её, чтобы не рисоваться, когда их содержимое не попадает в видимую часть сцены
+    def contentRect(self) -> QRectF:
+        return self.boundingRect()
+
+    # Видимая часть содержимого слоя при отрисовке: пересечение перерисовываемой области option.exposedRect (сцена
+    # передаёт в неё только часть слоя, попадающую в окно просмотра) с self.contentRect. Пустая - рисовать нечего
+    def visibleRect(self, option: QStyleOptionGraphicsItem) -> QRectF:
+        return option.exposedRect.intersected(self.contentRect())
+
+    # Отрисовка слоя. option.exposedRect - перерисовываемая область в координатах слоя
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget=None) -> None:
+        pass
+
+    # Запрос перерисовки слоя (всего или области QRectF). Если слой сведён в слепок, устаревает слепок; у уменьшенных
+    # копий устаревает перерисовываемая область
+    def update(self, *args) -> None:
+        if self.composite is not None:
+            self.composite.invalidate(self)
+        if self.mipmaps is not None:
+            self.mipmaps.invalidate(QRectF(*args).toAlignedRect() if args else None)
+        super().update(*args)
+
+    # Изменение размера слоя. Сцена должна узнать о смене границ элемента до неё, иначе старая область не перерисуется
+    def resize(self, width: int, height: int) -> None:
+        self.prepareGeometryChange()
+        self.resolution = width, height
+        if self.mipmaps is not None:
+            self.mipmaps.reset(width, height)
+
+    # Отрисовка слоя на painter вне сцены (при экспорте проекта в изображение). rect - отрисовываемая область (QRectF,
+    # None - весь слой)
+    def render(self, painter: QPainter, rect=None) -> None:
+        option = QStyleOptionGraphicsItem()
+        option.exposedRect = self.boundingRect() if rect is None else QRectF(rect)
+        painter.save()
+        self.paint(painter, option)
+        painter.restore()
@@ -0,0 +1,106 @@
+from bisect import insort
+from PyQt5.QtWidgets import QGraphicsScene
+from PyQt5.QtCore import Qt
+from layerItem import LayerItem
+
+
+# Идентификаторы статических слоёв: фон и сетка добавляются в реестр первыми при создании любого проекта
+BACKGROUND_LAYER = 0
+GRID_LAYER = 1
+
+
+# Класс реестра слоёв проекта. Все слои добавляются на сцену и удаляются с неё только через реестр. Каждый слой при
+# добавлении получает идентификатор, который не меняется до его удаления (в т.ч. при удалении других слоёв и
+# перемещении слоя выше/ниже), поэтому именно идентификаторы передаются в сигналах списка слоёв и хранятся в
+# Window.currentLayer. Слой по идентификатору находится за O(1), без построения списка элементов сцены
+# (QGraphicsScene.items() на каждый вызов создаёт новый список всех элементов).
+# Порядок слоёв по высоте поддерживается отдельно от сцены: высота текстового слоя на сцене на время редактирования
+# временно поднимается (см. Window.activateLayer), а в реестре остаётся его настоящая высота
+# Атрибуты:
+# - self.scene - QGraphicsScene, сцена, на которой находятся слои
+# - self.items - dict(int, LayerItem), слои (они же элементы сцены) по идентификатору в порядке добавления
+# - self.layerIds - dict(LayerItem, int), идентификаторы слоёв по самим слоям (обратный поиск)
+# - self.zValues - dict(int, float), высоты слоёв по идентификатору
+# - self.zOrder - list(tuple(float, int)), пары (высота, идентификатор), упорядоченные по возрастанию высоты
+# - self.nextId - int, идентификатор, который получит следующий добавленный слой
+class LayerRegistry:
+    def __init__(self, scene: QGraphicsScene) -> None:
+        self.scene = scene
+        self.items = dict()
+        self.layerIds = dict()
+        self.zValues = dict()
+        self.zOrder = []
+        self.nextId = 0
+
+    def __contains__(self, layerId: int) -> bool:
+        return layerId in self.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    # Добавление слоя layer на сцену на высоту z. Возвращает идентификатор слоя. Слой добавляется прозрачным для
+    # мыши: события мыши получает только активный слой (см. Window.activateLayer и inputRouter.py)
+    def add(self, layer: LayerItem, z: float) -> int:
+        layerId = self.nextId
+        self.nextId += 1
+
+        self.scene.addItem(layer)
+        layer.setZValue(z)
+        layer.setAcceptedMouseButtons(Qt.NoButton)
+        self.items[layerId] = layer
+        self.layerIds[layer] = layerId
+        self.zValues[layerId] = z
+        insort(self.zOrder, (z, layerId))
+        return layerId
+
+    # Удаление слоя со сцены. Возвращает удалённый слой
+    def remove(self, layerId: int) -> LayerItem:
+        layer = self.items.pop(layerId)
+        self.zOrder.remove((self.zValues.pop(layerId), layerId))
+        del self.layerIds[layer]
+        self.scene.removeItem(layer)
+        return layer
+
+    # Удаление всех слоёв. Нумерация идентификаторов начинается заново
+    def clear(self) -> None:
+        for layerId in list(self.items):
+            self.remove(layerId)
+        self.nextId = 0
+
+    # Слой по идентификатору
+    def layer(self, layerId: int) -> LayerItem:
+        return self.items[layerId]
+
+    # Идентификатор слоя layer (None, если слоя нет в реестре)
+    def layerId(self, layer: LayerItem):
+        return self.layerIds.get(layer)
+
+    # Фон и сетка
+    def background(self) -> LayerItem:
+        return self.items[BACKGROUND_LAYER]
+
+    def grid(self) -> LayerItem:
+        return self.items[GRID_LAYER]
+
+    # Высота слоя (настоящая, без временного подъёма редактируемого текстового слоя)
+    def zValue(self, layerId: int) -> float:
+        return self.zValues[layerId]
+
+    # Идентификаторы всех слоёв в порядке добавления
+    def ids(self) -> list:
+        return list(self.items)
+
+    # Идентификаторы слоёв снизу вверх. Если static ложно, фон и сетка не включаются
+    def ordered(self, static=True) -> list:
+        return [layerId for _, layerId in self.zOrder if static or layerId not in (BACKGROUND_LAYER, GRID_LAYER)]
+
+    # Обмен слоёв высотами (один перемещается под другой)
+    def swap(self, layerA: int, layerB: int) -> None:
+        zA, zB = self.zValues[layerA], self.zValues[layerB]
+        self.zOrder.remove((zA, layerA))
+        self.zOrder.remove((zB, layerB))
+
+        for layerId, z in ((layerA, zB), (layerB, zA)):
+            self.zValues[layerId] = z
+            self.items[layerId].setZValue(z)
+            insort(self.zOrder, (z, layerId))
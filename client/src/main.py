@@ -1,16 +1,26 @@
 import sys
-import json
+from functools import partial
 import requests
 from PyQt5.QtWidgets import (QApplication, QGraphicsScene, QGraphicsView, QTabWidget,
-                             QWidget, QGridLayout, QShortcut, QFileDialog, QInputDialog, QMessageBox)
-from PyQt5.QtGui import QFont, QKeySequence, QColor, QImage, QPainter, QIcon
-from PyQt5.QtCore import Qt, pyqtSlot, QByteArray, QBuffer, QIODevice, QSize
+                             QWidget, QGridLayout, QShortcut, QFileDialog, QInputDialog, QMessageBox,
+                             QProgressDialog)
+from PyQt5.QtGui import QFont, QKeySequence, QImage, QIcon
+from PyQt5.QtCore import Qt, pyqtSlot, QSize, QTimer
 from bitmapLayer import BitmapLayer
 from gridLayer import GridLayer
 from imageLayer import ImageLayer
 from shapeLayer import ShapeLayer
 from textLayer import TextLayer
 from backgroundLayer import BackgroundLayer
+from tiledBitmap import TILE_SIZE
+from history import History
+from layerRegistry import LayerRegistry, BACKGROUND_LAYER, GRID_LAYER
+from compositeCache import CompositeCache
+from compositor import composite
+from projectFile import (LAYER_TYPES, BlobCache, LayerLoader, buildLayer, imageEntries, readProject, writeProject,
+                         embedBlobs)
+from inputRouter import InputRouter
+from resampling import ResizeJob, RESIZE_QUALITIES
 from client.gui.bitmapToolbar import BitmapToolbar
 from client.gui.imageToolbar import ImageToolbar
 from client.gui.gridToolbar import GridToolbar
@@ -33,6 +43,14 @@ from client.src.forms import LoginForm, ChangePasswordForm, ProjectOpenForm
 # (!) Оканчивается на прямой слеш ('/')
 SERVER_ADDRESS = 'http://127.0.0.1:5000/'
 
+# Максимальный объём памяти (в байтах), который может занимать история изменений. При превышении самые старые действия
+# забываются
+HISTORY_MEMORY_LIMIT = 256 * 1024 * 1024
+
+# Интервал (в секундах), с которым обновляется индикатор хода выполнения фоновых заданий (изменения разрешения,
+# сохранения и открытия проекта)
+JOB_PROGRESS_INTERVAL = 0.05
+
 
 # Класс Window - класс главного окна программы.
 # Выровнен по QGridLayout, содержит в себе (вложенно) все виджеты программы
@@ -43,8 +61,12 @@ SERVER_ADDRESS = 'http://127.0.0.1:5000/'
 # - self.layers - LayerList (см. client.gui.layerList.py), меню управления слоями (скрытие, выделение, удаление, ...)
 # - self.scene - QGraphicsScene, сцена со всеми слоями
 # Атрибуты:
-# - self.currentLayer - int, индекс слоя, с которым пользователь может взаимодействовать. Нумеруются с нуля (-1 - ни
-# - - один слой не выделен). Слои с индексами 0 и 1 - всегда фон и сетка соответственно
+# - self.registry - LayerRegistry, реестр слоёв: все слои сцены по их идентификаторам и в порядке высоты (см.
+# - - layerRegistry.py)
+# - self.inputRouter - InputRouter, маршрутизатор событий мыши сцены: доставляет их только текущему слою (см.
+# - - inputRouter.py)
+# - self.currentLayer - int, идентификатор слоя в self.registry, с которым пользователь может взаимодействовать
+# - - (-1 - ни один слой не выделен). Слои с идентификаторами 0 и 1 - всегда фон и сетка соответственно
 # - self.highestZ - int, текущая "высота" самого высокого слоя. Поддерживается также в LayerList
 # - self.resolution - tuple(int, int), разрешение целевого изображения проекта
 # - self.username - str, имя пользователя на сервере. Задаётся через self.loginForm или self.changePasswordForm
@@ -53,6 +75,12 @@ SERVER_ADDRESS = 'http://127.0.0.1:5000/'
 # - - серверу при сохранении туда проекта. Подробности о формате см. в self.saveFile
 # - self.finalImage - QImage, картинка, на которой отрисовывается содержимое всех слоёв, кроме фона и сетки, перед
 # - - сохранением непосредственно на компьютер
+# - self.history - History, история изменений проекта для отмены и возврата действий (см. history.py)
+# - self.blobCache - BlobCache, PNG-изображения картинок слоёв с последнего сохранения или открытия проекта, чтобы при
+# - - сохранении кодировать только изменённые (см. projectFile.py)
+# - self.loader - LayerLoader или None, фоновая загрузка картинок слоёв открытого проекта (см. self.openFile). None -
+# - - все картинки загружены
+# - self.loadTimer - QTimer, таймер, по которому в слои записываются загруженные в фоне картинки
 class Window(QWidget):
     # Инициализация графических элементов и атрибутов, подключение сигналов к слотам
     def __init__(self) -> None:
@@ -71,12 +99,22 @@ class Window(QWidget):
         self.password = ''
         self.fileDump = dict()
         self.finalImage = QImage(QSize(*self.resolution), QImage.Format_ARGB32_Premultiplied)
+        self.history = History(HISTORY_MEMORY_LIMIT)
+        self.blobCache = BlobCache()
+        self.loader = None
+        self.loadTimer = QTimer(self)
+        self.loadTimer.setInterval(int(JOB_PROGRESS_INTERVAL * 1000))
+        self.loadTimer.timeout.connect(self.pollLoader)
 
         # Комбинации клавиш для быстрой работы в программе
         self.zoomInShortcut = QShortcut(QKeySequence("Ctrl+="), self)
         self.zoomInShortcut.activated.connect(self.zoomIn)
         self.zoomOutShortcut = QShortcut(QKeySequence("Ctrl+-"), self)
         self.zoomOutShortcut.activated.connect(self.zoomOut)
+        self.undoShortcut = QShortcut(QKeySequence("Ctrl+Z"), self)
+        self.undoShortcut.activated.connect(self.undo)
+        self.redoShortcut = QShortcut(QKeySequence("Ctrl+Y"), self)
+        self.redoShortcut.activated.connect(self.redo)
 
         self.loginForm = LoginForm(SERVER_ADDRESS)
         self.loginForm.signals.requestAccepted.connect(self.login)
@@ -102,10 +140,14 @@ class Window(QWidget):
         self.tab.widget(1).exportButton.clicked.connect(self.exportFile)
         self.tab.widget(1).cloudOpenButton.clicked.connect(self.openCloudForms)
         self.tab.widget(1).cloudSaveButton.clicked.connect(self.saveCloudFile)
+        self.tab.widget(1).undoButton.clicked.connect(self.undo)
+        self.tab.widget(1).redoButton.clicked.connect(self.redo)
 
         self.tab.addTab(GridToolbar(self.resolution), "Сетка")
         self.tab.widget(2).signals.added.connect(self.addGridLine)
         self.tab.widget(2).signals.deleted.connect(self.deleteGridLine)
+        self.tab.widget(2).signals.divided.connect(self.divideGrid)
+        self.tab.widget(2).signals.rangeDeleted.connect(self.deleteGridRange)
 
         self.tab.addTab(ImageToolbar(), "Картинка")
         self.tab.widget(3).signals.stateChanged.connect(self.updateImageLayerState)
@@ -133,13 +175,16 @@ class Window(QWidget):
 
         self.scene = QGraphicsScene(self)
         self.scene.setItemIndexMethod(-1)
-        self.scene.addWidget(BackgroundLayer(*self.resolution))
-        self.scene.addWidget(GridLayer(*self.resolution))
-        self.scene.items()[-1].setZValue(1024)
+        self.registry = LayerRegistry(self.scene)
+        self.registry.add(BackgroundLayer(*self.resolution), 0)
+        self.registry.add(GridLayer(*self.resolution), 1024)
+        self.compositeCache = CompositeCache(self.scene, self.registry)
+        self.inputRouter = InputRouter(self)
+        self.scene.installEventFilter(self.inputRouter)
         self.preview.setScene(self.scene)
 
-        self.layers.newStaticLayer('Фон', 0)
-        self.layers.newStaticLayer('Сетка', 1024)
+        self.layers.newStaticLayer('Фон', 0, BACKGROUND_LAYER)
+        self.layers.newStaticLayer('Сетка', 1024, GRID_LAYER)
 
         self.show()
 
@@ -161,215 +206,344 @@ class Window(QWidget):
     def zoomOut(self) -> None:
         self.preview.scale(0.8, 0.8)
 
+    # Отмена последнего действия. Слот сигналов self.undoShortcut.activated и FileToolbar.undoButton.clicked
+    @pyqtSlot()
+    def undo(self) -> None:
+        self.updateAfterHistoryChange(self.history.undo())
+
+    # Возврат последнего отменённого действия. Слот сигналов self.redoShortcut.activated и
+    # FileToolbar.redoButton.clicked
+    @pyqtSlot()
+    def redo(self) -> None:
+        self.updateAfterHistoryChange(self.history.redo())
+
+    # Обновление панелей инструментов после отмены или возврата действия над слоем layer: панель сетки всегда
+    # показывает текущие линии сетки, панель активного слоя - его текущее состояние
+    def updateAfterHistoryChange(self, layer) -> None:
+        if isinstance(layer, GridLayer):
+            self.tab.widget(2).setLines(layer.hLines, layer.vLines)
+        elif layer is not None and self.activeLayer() is layer:
+            if isinstance(layer, ImageLayer):
+                self.updateImageToolbarState()
+            elif isinstance(layer, ShapeLayer):
+                self.updateShapeToolbarState()
+
     # Добавление нового растрового слоя.
     # Слот сигнала self.layers.newBitmapButton.clicked, увеличивает макс. высоту слоя,
-    # добавляет слой на сцену (как и любой слой, в виде QProxyWidget) и в список слоёв.
+    # добавляет слой на сцену (как и любой слой, элементом сцены LayerItem, через реестр слоёв) и в список слоёв.
     @pyqtSlot()
     def addBitmapLayer(self) -> None:
         self.highestZ += 1
-        self.scene.addWidget(BitmapLayer(*self.resolution, self))
-        self.scene.items()[-1].setZValue(self.highestZ)
-        self.layers.newBitmapLayer()
+        self.layers.newBitmapLayer(self.registry.add(BitmapLayer(*self.resolution, self), self.highestZ))
 
     # Добавление нового слоя-картинки.
     # Слот сигнала self.layers.newImageButton.clicked, увеличивает макс. высоту слоя,
-    # добавляет слой на сцену (как и любой слой, в виде QProxyWidget) и в список слоёв.
+    # добавляет слой на сцену (как и любой слой, элементом сцены LayerItem, через реестр слоёв) и в список слоёв.
     @pyqtSlot()
     def addImageLayer(self) -> None:
         self.highestZ += 1
-        self.scene.addWidget(ImageLayer('tmp_icon.png', *self.resolution, self))
-        self.scene.items()[-1].setZValue(self.highestZ)
-        self.layers.newImageLayer()
+        self.layers.newImageLayer(self.registry.add(ImageLayer('tmp_icon.png', *self.resolution, self), self.highestZ))
 
     # Добавление нового фигурного слоя.
     # Слот сигнала self.layers.newShapeButton.clicked, увеличивает макс. высоту слоя,
-    # добавляет слой на сцену (как и любой слой, в виде QProxyWidget) и в список слоёв.
+    # добавляет слой на сцену (как и любой слой, элементом сцены LayerItem, через реестр слоёв) и в список слоёв.
     @pyqtSlot()
     def addShapeLayer(self) -> None:
         self.highestZ += 1
-        self.scene.addWidget(ShapeLayer(*self.resolution, self))
-        self.scene.items()[-1].setZValue(self.highestZ)
-        self.layers.newShapeLayer()
+        self.layers.newShapeLayer(self.registry.add(ShapeLayer(*self.resolution, self), self.highestZ))
 
     # Добавление нового текстового слоя.
     # Слот сигнала self.layers.newTextButton.clicked, увеличивает макс. высоту слоя,
-    # добавляет слой на сцену (как и любой слой, в виде QProxyWidget) и в список слоёв.
+    # добавляет слой на сцену (как и любой слой, элементом сцены LayerItem, через реестр слоёв) и в список слоёв.
     @pyqtSlot()
     def addTextLayer(self) -> None:
         self.highestZ += 1
-        self.scene.addWidget(TextLayer(*self.resolution, self))
-        self.scene.items()[-1].setZValue(self.highestZ)
-        self.layers.newTextLayer()
+        self.layers.newTextLayer(self.registry.add(TextLayer(*self.resolution, self), self.highestZ))
 
     # Обновление состояния выделенного растрового слоя при изменении состояния панели инструментов пользователем.
     # Слот сигнала self.tab.widget(0).valueChanged
     @pyqtSlot()
     def updateBitmapLayerState(self) -> None:
-        if self.currentLayer != -1 and isinstance(self.scene.items()[self.currentLayer].widget(), BitmapLayer):
-            self.scene.items()[self.currentLayer].widget().updateState(self.tab.widget(0).color,
-                                                                           self.tab.widget(0).width,
-                                                                           self.tab.widget(0).tool)
+        layer = self.activeLayer()
+        if isinstance(layer, BitmapLayer):
+            layer.updateState(self.tab.widget(0).color, self.tab.widget(0).width, self.tab.widget(0).tool,
+                              self.tab.widget(0).tolerance, self.tab.widget(0).contiguous)
 
     # Обновление состояния выделенного слоя-картинки при изменении состояния панели инструментов пользователем.
-    # Слот сигнала self.tab.widget(3).stateChanged
+    # Слот сигнала self.tab.widget(3).stateChanged. Изменение добавляется в историю изменений
     @pyqtSlot(int, str, str)
     def updateImageLayerState(self, size: int, alignment: str, tool: str) -> None:
-        if self.currentLayer != -1 and isinstance(self.scene.items()[self.currentLayer].widget(), ImageLayer):
-            self.scene.items()[self.currentLayer].widget().updateState(size, alignment, tool)
+        layer = self.activeLayer()
+        if isinstance(layer, ImageLayer):
+            before = layer.saveState()
+            layer.updateState(size, alignment, tool)
+            self.history.pushState(layer, before, merge=True)
 
     # Обновление картинки выделенного слоя-картинки при выборе пользователем новой картинки при помощи панели
-    # инструментов. Слот сигнала self.tab.widget(3).imageChanged
+    # инструментов. Слот сигнала self.tab.widget(3).imageChanged. Изменение добавляется в историю изменений
     @pyqtSlot(str)
     def updateImageLayerImage(self, imagePath):
-        if self.currentLayer != -1 and isinstance(self.scene.items()[self.currentLayer].widget(), ImageLayer):
-            self.scene.items()[self.currentLayer].widget().updateImage(imagePath)
+        layer = self.activeLayer()
+        if isinstance(layer, ImageLayer):
+            before = layer.saveState()
+            layer.updateImage(imagePath)
+            self.history.pushState(layer, before)
 
     # Обновление панели инструментов ImageToolbar до состояния текущего слоя-картинки. Вызывается при повторном
     # выделении слоя-картинки, чтобы на панели инструментов отображались данные именно о нём
     def updateImageToolbarState(self):
-        self.tab.widget(3).filePath = self.scene.items()[self.currentLayer].widget().imagePath
-        self.tab.widget(3).size = self.scene.items()[self.currentLayer].widget().size
-        self.tab.widget(3).alignmentSelector.setState(self.scene.items()[self.currentLayer].widget().alignment)
-        self.tab.widget(3).toolSelector.setState(self.scene.items()[self.currentLayer].widget().tool)
+        layer = self.activeLayer()
+        self.tab.widget(3).filePath = layer.imagePath
+        self.tab.widget(3).size = layer.size
+        self.tab.widget(3).alignmentSelector.setState(layer.alignment)
+        self.tab.widget(3).toolSelector.setState(layer.tool)
 
     # Обновление состояния выделенного фигурного слоя при изменении состояния панели инструментов пользователем.
-    # Слот сигнала self.tab.widget(4).valueChanged
+    # Слот сигнала self.tab.widget(4).valueChanged. Изменение добавляется в историю изменений (подряд идущие изменения,
+    # например, движение ползунка толщины, объединяются в одно действие)
     @pyqtSlot()
     def updateShapeLayerState(self):
-        if self.currentLayer != -1 and isinstance(self.scene.items()[self.currentLayer].widget(), ShapeLayer):
-            self.scene.items()[self.currentLayer].widget().updateState(self.tab.widget(4).lineColor,
-                                                                       self.tab.widget(4).fillColor,
-                                                                       self.tab.widget(4).width,
-                                                                       self.tab.widget(4).tool,
-                                                                       self.tab.widget(4).shape)
+        layer = self.activeLayer()
+        if isinstance(layer, ShapeLayer):
+            before = layer.saveState()
+            layer.updateState(self.tab.widget(4).lineColor, self.tab.widget(4).fillColor, self.tab.widget(4).width,
+                              self.tab.widget(4).tool, self.tab.widget(4).shape)
+            self.history.pushState(layer, before, merge=True)
 
     # Обновление панели инструментов ShapeToolbar до состояния текущего фигурного слоя. Вызывается при повторном
     # выделении фигурного слоя, чтобы на панели инструментов отображались данные именно о нём
     def updateShapeToolbarState(self):
-        self.tab.widget(4).setState(self.scene.items()[self.currentLayer].widget().lineColor,
-                                    self.scene.items()[self.currentLayer].widget().fillColor,
-                                    self.scene.items()[self.currentLayer].widget().width,
-                                    self.scene.items()[self.currentLayer].widget().tool,
-                                    self.scene.items()[self.currentLayer].widget().shape)
+        layer = self.activeLayer()
+        self.tab.widget(4).setState(layer.lineColor, layer.fillColor, layer.width, layer.tool, layer.shape)
 
     # Обновление состояния выделенного текстового слоя при изменении состояния панели инструментов пользователем.
     # Слот сигнала self.tab.widget(5).valueChanged
     @pyqtSlot()
     def updateTextLayerState(self):
-        if self.currentLayer != -1 and isinstance(self.scene.items()[self.currentLayer].widget(), TextLayer):
-            self.scene.items()[self.currentLayer].widget().updateState(self.tab.widget(5).color,
-                                                                       self.tab.widget(5).font,
-                                                                       self.tab.widget(5).size,
-                                                                       self.tab.widget(5).fontWeight,
-                                                                       self.tab.widget(5).italic,
-                                                                       self.tab.widget(5).underline,
-                                                                       self.tab.widget(5).alignment)
+        layer = self.activeLayer()
+        if isinstance(layer, TextLayer):
+            layer.updateState(self.tab.widget(5).color, self.tab.widget(5).font, self.tab.widget(5).size,
+                              self.tab.widget(5).fontWeight, self.tab.widget(5).italic, self.tab.widget(5).underline,
+                              self.tab.widget(5).alignment)
 
     # Обновление панели инструментов TextToolbar до состояния текущего текстового слоя. Вызывается при повторном
     # выделении текстового слоя, чтобы на панели инструментов отображались данные именно о нём
     def updateTextToolbarState(self):
-        self.tab.widget(5).setState(self.scene.items()[self.currentLayer].widget().color,
-                                    self.scene.items()[self.currentLayer].widget().font,
-                                    self.scene.items()[self.currentLayer].widget().size,
-                                    self.scene.items()[self.currentLayer].widget().fontWeight,
-                                    self.scene.items()[self.currentLayer].widget().italic,
-                                    self.scene.items()[self.currentLayer].widget().underline,
-                                    self.scene.items()[self.currentLayer].widget().alignment)
-
-    # Активация слоя по индексу. Слот для self.layers.signals.activated.
+        layer = self.activeLayer()
+        self.tab.widget(5).setState(layer.color, layer.font, layer.size, layer.fontWeight, layer.italic,
+                                    layer.underline, layer.alignment)
+
+    # Текущий (выделенный) слой или None, если ни один слой не выделен
+    def activeLayer(self):
+        return self.registry.layer(self.currentLayer) if self.currentLayer != -1 else None
+
+    # Возврат текущего текстового слоя с переднего плана на его настоящую высоту (на время редактирования текстовый
+    # слой поднимается над всеми слоями, кроме сетки, см. self.activateLayer)
+    def lowerTextLayer(self) -> None:
+        if isinstance(self.activeLayer(), TextLayer):
+            self.registry.layer(self.currentLayer).setZValue(self.registry.zValue(self.currentLayer))
+
+    # Активация слоя по идентификатору. Слот для self.layers.signals.activated.
     # Снимает выделение с ранее выделенного слоя (если таковой был), делает активным текущий выделенный слой,
     # передаёт состояние панели инструментов на случай, если её состояние поменяли, пока активным был другой слой,
     # обновляет переменную self.currentLayer. Обновляет состояние доступных вкладок
     @pyqtSlot(int)
     def activateLayer(self, index: int) -> None:
+        # Редактировать можно только слой, все картинки которого уже загружены
+        if self.loader is not None:
+            self.loader.require(self.registry.layer(index))
+
+        self.inputRouter.reset()
         if self.currentLayer != -1:
-            self.scene.items()[self.currentLayer].widget().active = False
-            if isinstance(self.scene.items()[self.currentLayer].widget(), TextLayer):
-                self.scene.items()[self.currentLayer].setZValue(self.scene.items()[self.currentLayer].widget()
-                                                                .previousZValue)
+            self.lowerTextLayer()
+            self.activeLayer().active = False
+            self.registry.layer(self.currentLayer).setAcceptedMouseButtons(Qt.NoButton)
 
-        self.scene.items()[index].widget().active = True
+        layer = self.registry.layer(index)
+        layer.active = True
+        self.registry.layer(index).setAcceptedMouseButtons(Qt.AllButtons)
         self.currentLayer = index
         self.setTabsInvisible()
 
-        if isinstance(self.scene.items()[self.currentLayer].widget(), BitmapLayer):
+        if isinstance(layer, BitmapLayer):
             self.tab.setTabVisible(0, True)
             self.tab.setCurrentIndex(0)
             self.updateBitmapLayerState()
-        elif isinstance(self.scene.items()[self.currentLayer].widget(), ImageLayer):
+        elif isinstance(layer, ImageLayer):
             self.tab.setTabVisible(3, True)
             self.tab.setCurrentIndex(3)
             self.updateImageToolbarState()
-        elif isinstance(self.scene.items()[self.currentLayer].widget(), ShapeLayer):
+        elif isinstance(layer, ShapeLayer):
             self.tab.setTabVisible(4, True)
             self.tab.setCurrentIndex(4)
             self.updateShapeToolbarState()
-        elif isinstance(self.scene.items()[self.currentLayer].widget(), TextLayer):
+        elif isinstance(layer, TextLayer):
             self.tab.setTabVisible(5, True)
             self.tab.setCurrentIndex(5)
-            self.scene.items()[self.currentLayer].widget().storeZValue(self.scene.items()[self.currentLayer].zValue())
-            self.scene.items()[self.currentLayer].setZValue(1023)
+            layer.storeZValue(self.registry.zValue(index))
+            self.registry.layer(index).setZValue(1023)
             self.updateTextToolbarState()
 
-    # Деактивация слоя по индексу. Слот для self.layers.signals.deactivated.
+        self.compositeCache.activate(index)
+
+    # Деактивация слоя по идентификатору. Слот для self.layers.signals.deactivated.
     # Снимает выделение с ранее выделенного слоя (который и послал сигнал),
     # сообщает в self.currentLayer, что никакой слой не выделен.
     @pyqtSlot(int)
     def deactivateLayer(self, index: int) -> None:
-        if isinstance(self.scene.items()[self.currentLayer].widget(), TextLayer):
-            self.scene.items()[self.currentLayer].setZValue(self.scene.items()[self.currentLayer].widget()
-                                                            .previousZValue)
+        self.inputRouter.reset()
+        if self.currentLayer != -1:
+            self.lowerTextLayer()
 
         self.tab.setCurrentIndex(1)
         self.setTabsInvisible()
-        self.scene.items()[index].widget().active = False
+        if index in self.registry:
+            self.registry.layer(index).active = False
+            self.registry.layer(index).setAcceptedMouseButtons(Qt.NoButton)
+        self.currentLayer = -1
+        self.compositeCache.release()
+
+    # Снятие выделения со всех слоёв в списке слоёв и на сцене (перед сохранением, экспортом и после открытия проекта):
+    # на слоях не рисуются вспомогательные элементы, а редактируемый текстовый слой возвращается на свою высоту
+    def deactivateAllLayers(self) -> None:
+        self.layers.deactivateAll()
+        if self.currentLayer != -1:
+            self.inputRouter.reset()
+            self.lowerTextLayer()
+            self.activeLayer().active = False
+            self.registry.layer(self.currentLayer).setAcceptedMouseButtons(Qt.NoButton)
         self.currentLayer = -1
+        self.compositeCache.release()
 
-    # Показывает слой по индексу. Слот для self.layers.signals.shown
+    # Показывает слой по идентификатору. Слот для self.layers.signals.shown. Если картинки слоя ещё загружаются, они
+    # загружаются раньше остальных
     @pyqtSlot(int)
     def showLayer(self, index: int) -> None:
-        self.scene.items()[index].widget().show()
+        if self.loader is not None:
+            self.loader.prioritize(self.registry.layer(index))
+        self.compositeCache.setLayerVisible(index, True)
 
-    # Скрытие слоя по индексу. Слот для self.layers.signals.hidden
+    # Скрытие слоя по идентификатору. Слот для self.layers.signals.hidden
     @pyqtSlot(int)
     def hideLayer(self, index: int) -> None:
-        self.scene.items()[index].widget().hide()
+        self.compositeCache.setLayerVisible(index, False)
 
-    # Удаление слоя по индексу. Слот для self.layers.signals.deleted
+    # Удаление слоя по идентификатору. Слот для self.layers.signals.deleted. Действия над удалённым слоем забываются
+    # историей
     @pyqtSlot(int)
     def deleteLayer(self, index):
         if self.currentLayer == index:
             self.tab.setCurrentIndex(1)
             self.setTabsInvisible()
 
-        deletedItem = self.scene.items()[index]
-        self.scene.removeItem(deletedItem)
+        self.history.forget(self.registry.remove(index))
+        self.compositeCache.restack()
 
     # Обменивает слои их высотами (один перемещается под другой). Слот для self.layers.signals.swappedLayers.
-    # Используется при перемещении слоя пользователем как выше, так и ниже.
+    # Используется при перемещении слоя пользователем как выше, так и ниже. Если один из слоёв - редактируемый
+    # текстовый, он остаётся на переднем плане, а его настоящая высота обновляется
     @pyqtSlot(int, int)
     def swapLayers(self, indexA: int, indexB: int) -> None:
-        aValue = self.scene.items()[indexA].zValue()
-        bValue = self.scene.items()[indexB].zValue()
-        self.scene.items()[indexA].setZValue(bValue)
-        self.scene.items()[indexB].setZValue(aValue)
+        self.registry.swap(indexA, indexB)
+        if self.currentLayer in (indexA, indexB) and isinstance(self.activeLayer(), TextLayer):
+            self.activeLayer().storeZValue(self.registry.zValue(self.currentLayer))
+            self.registry.layer(self.currentLayer).setZValue(1023)
+        self.compositeCache.restack()
 
     # Добавление линии сетки. Подробнее о формате direction, indentType, indent см. в client.gui.gridToolbar.py или
-    # client.src.gridLayer.py
+    # client.src.gridLayer.py. Изменение добавляется в историю изменений
     @pyqtSlot(int, int, int)
     def addGridLine(self, direction: int, indentType: int, indent: int) -> None:
-        self.scene.items()[1].widget().addLine(direction, indentType, indent)
+        before = self.registry.grid().saveState()
+        self.registry.grid().addLine(direction, indentType, indent)
+        self.history.pushState(self.registry.grid(), before)
 
     # Удаление линии сетки. Подробнее о формате direction, indentType, indent см. в client.gui.gridToolbar.py или
-    # client.src.gridLayer.py
+    # client.src.gridLayer.py. Изменение добавляется в историю изменений
     @pyqtSlot(int, int, int)
     def deleteGridLine(self, direction: int, indentType: int, indent: int) -> None:
-        self.scene.items()[1].widget().deleteLine(direction, indentType, indent)
+        before = self.registry.grid().saveState()
+        self.registry.grid().deleteLine(direction, indentType, indent)
+        self.history.pushState(self.registry.grid(), before)
+
+    # Разбиение холста на count равных колонок (direction = 1) или строк (direction = 0) с промежутками gutter пикселей
+    # (см. GridLayer.divide). Все линии направления заменяются одним пакетом, изменение добавляется в историю изменений
+    # одним действием. Слот сигнала GridToolbar.signals.divided
+    @pyqtSlot(int, int, int)
+    def divideGrid(self, direction: int, count: int, gutter: int) -> None:
+        before = self.registry.grid().saveState()
+        self.registry.grid().divide(direction, count, gutter)
+        self.history.pushState(self.registry.grid(), before)
+        self.tab.widget(2).setLines(self.registry.grid().hLines, self.registry.grid().vLines)
+
+    # Удаление одним пакетом всех линий сетки направления direction с отступами от first до last пикселей (см.
+    # GridLayer.deleteRange). Изменение добавляется в историю изменений одним действием. Слот сигнала
+    # GridToolbar.signals.rangeDeleted
+    @pyqtSlot(int, int, int)
+    def deleteGridRange(self, direction: int, first: int, last: int) -> None:
+        before = self.registry.grid().saveState()
+        self.registry.grid().deleteRange(direction, first, last)
+        self.history.pushState(self.registry.grid(), before)
+        self.tab.widget(2).setLines(self.registry.grid().hLines, self.registry.grid().vLines)
+
+    # Выполнение фонового задания job (resampling.ResizeJob, projectFile.CodecJob или projectFile.LayerLoader) с
+    # индикатором хода выполнения, подписанным text. Пока задачи выполняются в пуле потоков, окно обрабатывает события
+    # и остаётся отзывчивым. Возвращает False, если пользователь отменил задание или одна из задач завершилась ошибкой
+    # (задание при этом отменяется, а пользователь уведомляется об ошибке). Если cancel ложно, отмена прерывает только
+    # ожидание, а задание продолжает выполняться
+    def runJob(self, job, text: str, cancel=True) -> bool:
+        progress = QProgressDialog(text, 'Отмена', 0, job.total, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(500)
+        try:
+            while not job.wait(JOB_PROGRESS_INTERVAL):
+                progress.setValue(job.done)
+                QApplication.processEvents()
+                if progress.wasCanceled():
+                    if cancel:
+                        job.cancel()
+                    return False
+        except Exception as error:
+            job.cancel()
+            progress.close()
+            QMessageBox(QMessageBox.Critical, text.rstrip('.'), f'Не удалось выполнить задание: {error}',
+                        QMessageBox.Ok).exec()
+            return False
+        progress.setValue(job.total)
+        return True
+
+    # Запись в слои картинок, загруженных в фоне с прошлого вызова (см. self.openFile). По окончании загрузки таймер
+    # останавливается, а если часть картинок загрузить не удалось, пользователь об этом уведомляется.
+    # Слот сигнала self.loadTimer.timeout
+    @pyqtSlot()
+    def pollLoader(self) -> None:
+        if self.loader is None or not self.loader.wait(0):
+            return
 
-    # Сохранение проекта. Содержимое проекта записывается в output (протокол см. ниже).
-    # Если variableDump верно, то содержимое output копируется в self.fileDump для последующей
-    # передачи на сервер в JSON части запроса для сохранения проекта на сервере, иначе записывается в файл на
-    # компьютере пользователя (путь и имя файла спрашиваются у пользователся через диалог).
+        loader, self.loader = self.loader, None
+        self.loadTimer.stop()
+        if loader.failed:
+            QMessageBox(QMessageBox.Warning, 'Открытие проекта',
+                        f'Часть картинок слоёв не удалось загрузить ({loader.failed} из {loader.total}).',
+                        QMessageBox.Ok).exec()
+
+    # Ожидание окончания фоновой загрузки картинок слоёв с индикатором хода выполнения (перед действиями со всеми
+    # слоями сразу: сохранением, экспортом, изменением разрешения). Возвращает False, если пользователь прервал
+    # ожидание (загрузка при этом продолжается)
+    def finishLoading(self) -> bool:
+        if self.loader is not None and not self.runJob(self.loader, 'Загрузка слоёв...', cancel=False):
+            return False
+        self.pollLoader()
+        return True
+
+    # Сохранение проекта. Содержимое проекта записывается в output (протокол см. ниже), картинки слоёв кодируются в PNG
+    # в пуле потоков (см. projectFile.CodecJob) и складываются в blobs, а в output записываются их номера (поле blob).
+    # Заново кодируются только картинки, изменённые с прошлого сохранения или открытия проекта (см. self.blobCache).
+    # Если variableDump верно, то картинки в base64 вписываются в output вместо номеров (поле data), и результат
+    # копируется в self.fileDump для последующей передачи на сервер в JSON части запроса для сохранения проекта на
+    # сервере, иначе output и blobs записываются в двоичный контейнер (см. projectFile.py) в файл на компьютере
+    # пользователя (путь и имя файла спрашиваются у пользователся через диалог). Возвращает False, если проект не
+    # сохранён (пользователь отменил выбор файла или кодирование картинок).
     # Слот сигнала FileToolbar.saveButton.clicked
     # Протокол описания проекта (в нотации JSON):
     # - name - str, имя проекта
@@ -380,13 +554,19 @@ class Window(QWidget):
     # - - О BackgroundLayer информация не записывается
     # - - О BitmapLayer:
     # - - - type = 'bmp'
-    # - - - data - str, строковое utf-8 представление потока байтов, полученного из BitmapLayer.bitmap
+    # - - - tiles - list, созданные плитки BitmapLayer.bitmap (пустые плитки не сохраняются), каждая в виде словаря:
+    # - - - - x - int, отступ левого края плитки от левого края холста в пикселях
+    # - - - - y - int, отступ верхнего края плитки от верхнего края холста в пикселях
+    # - - - - blob - int, номер PNG-изображения плитки в двоичном контейнере (в проектах старого формата и на сервере
+    # - - - - - вместо него data - str, строковое utf-8 представление потока байтов PNG-изображения в base64)
+    # - - - (в файлах старых версий вместо tiles записано поле data - PNG-изображение всего холста, такие файлы также
+    # - - - - открываются)
     # - - - z - целочисленный float, высота слоя
-    # - - - index - int, индекс в self.scene
+    # - - - index - int, номер слоя в порядке добавления (порядок слоёв в файле)
     # - - - name - str, название слоя, данное пользователем в списке слоёв
     # - - Об ImageLayer:
     # - - - type = 'img'
-    # - - - data - str, строковое utf-8 представление потока байтов, полученного из ImageLayer.image
+    # - - - blob - int, номер PNG-изображения ImageLayer.image в двоичном контейнере (или data, как у плиток холста)
     # - - - xOffset - int, отступ по горизонтали в пикселях от точки, где картинка должна лежать идеально по сетке
     # - - - yOffset - int, отступ по вертикали в пикселях от точки, где картинка должна лежать идеально по сетке
     # - - - alignment - str, выравниваение текущего слоя-картинки по сетке. Подробнее см. в client.src.imageLayer.py
@@ -396,7 +576,7 @@ class Window(QWidget):
     # - - - bottomBorder - tuple(int, int), нижняя сторона прямоугольника, подробнее см. в imageLayer.py
     # - - - size - int, масштаб, в котором картинка отображается (в процентах от фактического размера)
     # - - - z - целочисленный float, высота слоя
-    # - - - index - int, индекс в self.scene
+    # - - - index - int, номер слоя в порядке добавления (порядок слоёв в файле)
     # - - - name - str, название слоя, данное пользователем в списке слоёв
     # - - О ShapeLayer:
     # - - - type = 'shp'
@@ -411,7 +591,7 @@ class Window(QWidget):
     # - - - secondVBorder - tuple(int, int), 2-я вертикальная ограничивающая линия, подробнее см. в imageLayer.py
     # - - - secondHBorder - tuple(int, int), 2-я горизонтальная ограничивающая линия, подробнее см. в imageLayer.py
     # - - - z - целочисленный float, высота слоя
-    # - - - index - int, индекс в self.scene
+    # - - - index - int, номер слоя в порядке добавления (порядок слоёв в файле)
     # - - - name - str, название слоя, данное пользователем в списке слоёв
     # - - О TextLayer:
     # - - - type = 'txt'
@@ -421,60 +601,54 @@ class Window(QWidget):
     # - - - topBorder - tuple(int, int), верхняя сторона прямоугольника, подробнее см. в imageLayer.py
     # - - - bottomBorder - tuple(int, int), нижняя сторона прямоугольника, подробнее см. в imageLayer.py
     # - - - z - целочисленный float, высота слоя
-    # - - - index - int, индекс в self.scene
+    # - - - index - int, номер слоя в порядке добавления (порядок слоёв в файле)
     # - - - name - str, название слоя, данное пользователем в списке слоёв
     # - - О GridLayer:
     # - - - type = 'grd'
     # - - - h - list(tuple(int, int)), список горизонтальных линий сетки, о формате см. client.src.gridLayer.py
     # - - - v - list(tuple(int, int)), список вертикальных линий сетки, о формате см. client.src.gridLayer.py
     # - - - z=1024.0
-    # - - - index - int, индекс в self.scene
+    # - - - index - int, номер слоя в порядке добавления (порядок слоёв в файле)
     # - - - name - str, название слоя в списке слоёв
     @pyqtSlot()
-    def saveFile(self, variableDump=False, projectName='') -> None:
+    def saveFile(self, variableDump=False, projectName='') -> bool:
         filePath = ''
         if projectName == '':
             filePath = QFileDialog.getSaveFileName(self, 'Сохранить проект', filter='Файл проекта GrImage (*.gri)')[0]
             if filePath == '':
-                return
-
-        self.layers.deactivateAll()
-        if self.currentLayer != -1:
-            if isinstance(self.scene.items()[self.currentLayer].widget(), TextLayer):
-                self.scene.items()[self.currentLayer].setZValue(self.scene.items()[self.currentLayer].widget()
-                                                                .previousZValue)
+                return False
 
-            self.scene.items()[self.currentLayer].widget().active = False
-            self.currentLayer = -1
+        if not self.finishLoading():
+            return False
+        self.deactivateAllLayers()
 
         output = {}
         output['name'] = '.'.join(filePath.split('/')[-1].split('.')[:-1]) if projectName == '' else projectName
         output['width'], output['height'] = self.resolution
         output['highestZ'] = self.highestZ
         output['layers'] = []
+        images = []
+
+        # Добавление картинки image в список сохраняемых. Возвращает номер её PNG-изображения в blobs
+        def storeImage(image: QImage) -> int:
+            images.append(image)
+            return len(images) - 1
 
-        for i in range(len(self.scene.items())):
-            curWidget = self.scene.items()[i].widget()
+        # Слои записываются в порядке добавления, index - номер слоя в этом порядке (а не его идентификатор, который
+        # после удаления других слоёв может быть больше числа слоёв)
+        for i, layerId in enumerate(self.registry.ids()):
+            curWidget = self.registry.layer(layerId)
 
             if isinstance(curWidget, BitmapLayer):
-                byteArray = QByteArray()
-                buffer = QBuffer(byteArray)
-                buffer.open(QIODevice.WriteOnly)
-                self.scene.items()[i].widget().bitmap.save(buffer, "PNG")
-                buffer.close()
                 output['layers'].append({
                     'type': 'bmp',
-                    'data': str(byteArray.toBase64(), 'utf_8')
+                    'tiles': [{'x': tx * TILE_SIZE, 'y': ty * TILE_SIZE, 'blob': storeImage(tile)}
+                              for (tx, ty), tile in curWidget.bitmap.tiles.items()]
                 })
-            elif isinstance(self.scene.items()[i].widget(), ImageLayer):
-                byteArray = QByteArray()
-                buffer = QBuffer(byteArray)
-                buffer.open(QIODevice.WriteOnly)
-                self.scene.items()[i].widget().image.save(buffer, "PNG")
-                buffer.close()
+            elif isinstance(curWidget, ImageLayer):
                 output['layers'].append({
                     'type': 'img',
-                    'data': str(byteArray.toBase64(), 'utf_8'),
+                    'blob': storeImage(curWidget.image),
                     'xOffset': curWidget.xOffset,
                     'yOffset': curWidget.yOffset,
                     'alignment': curWidget.alignment,
@@ -484,7 +658,7 @@ class Window(QWidget):
                     'bottomBorder': curWidget.bottomBorder,
                     'size': curWidget.size
                 })
-            elif isinstance(self.scene.items()[i].widget(), ShapeLayer):
+            elif isinstance(curWidget, ShapeLayer):
                 output['layers'].append({
                     'type': 'shp',
                     'shape': curWidget.shape,
@@ -500,7 +674,7 @@ class Window(QWidget):
                     'secondVBorder': curWidget.secondVBorder,
                     'secondHBorder': curWidget.secondHBorder,
                 })
-            elif isinstance(self.scene.items()[i].widget(), TextLayer):
+            elif isinstance(curWidget, TextLayer):
                 output['layers'].append({
                     'type': 'txt',
                     'text': curWidget.textEdit.toHtml(),
@@ -509,7 +683,7 @@ class Window(QWidget):
                     'topBorder': curWidget.topBorder,
                     'bottomBorder': curWidget.bottomBorder
                 })
-            elif isinstance(self.scene.items()[i].widget(), GridLayer):
+            elif isinstance(curWidget, GridLayer):
                 output['layers'].append({
                     'type': 'grd',
                     'h': curWidget.hLines,
@@ -517,37 +691,54 @@ class Window(QWidget):
                 })
 
             if not isinstance(curWidget, BackgroundLayer):
-                output['layers'][-1]['z'] = self.scene.items()[i].zValue()
-                output['layers'][-1]['name'] = self.layers.getName(i)
+                output['layers'][-1]['z'] = self.registry.zValue(layerId)
+                output['layers'][-1]['name'] = self.layers.getName(layerId)
                 output['layers'][-1]['index'] = i
 
+        blobs = self.blobCache.encode(images, partial(self.runJob, text='Сохранение проекта...'))
+        if blobs is None:
+            return False
+
         # Объект записывается в файл, если это требуется
         if not variableDump:
-            jsonObject = json.dumps(output, indent=4)
-            with open(filePath, 'w') as file:
-                file.write(jsonObject)
-            return
+            writeProject(filePath, output, blobs)
+            return True
 
-        self.fileDump = output
+        self.fileDump = embedBlobs(output, blobs.__getitem__)
+        return True
 
-    # Очистка проекта с заданием нового разрешения. Очищается в т.ч. список слоёв и сцена.
+    # Очистка проекта с заданием нового разрешения. Очищается в т.ч. список слоёв, сцена и история изменений.
     # Вызывается при открытии проекта или создании нового
     def clearFile(self, width=1280, height=720) -> None:
         self.layers.clear()
+        self.registry.clear()
+        self.history.clear()
+        self.blobCache.clear()
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader = None
+            self.loadTimer.stop()
         self.resolution = width, height
         self.currentLayer = -1
         self.highestZ = 0
 
-        self.scene.addWidget(BackgroundLayer(*self.resolution))
-        self.scene.addWidget(GridLayer(*self.resolution))
-        self.scene.items()[-1].setZValue(1024)
+        self.registry.add(BackgroundLayer(*self.resolution), 0)
+        self.registry.add(GridLayer(*self.resolution), 1024)
 
-        self.layers.newStaticLayer('Фон', 0)
-        self.layers.newStaticLayer('Сетка', 1024)
+        self.layers.newStaticLayer('Фон', 0, BACKGROUND_LAYER)
+        self.layers.newStaticLayer('Сетка', 1024, GRID_LAYER)
 
     # Открытие проекта. Если в fileData что-то передано (когда проект открывается с сервера),
-    # то открытие происходит оттуда, иначе пользователь выбирает файл на компьютере, который нужно открыть. Формат файла
-    # идентичен описанному в self.saveFile. Слот сигнала FileToolbar.openButton.clicked
+    # то открытие происходит оттуда, иначе пользователь выбирает файл на компьютере, который нужно открыть. Файл может
+    # быть как двоичным контейнером, так и старого формата (JSON), см. projectFile.py; протокол описания проекта описан
+    # в self.saveFile. Открытие двухэтапное: сначала по описанию создаются пустые слои и заполняется список слоёв, и с
+    # проектом уже можно работать, затем картинки слоёв читаются и декодируются в фоне (см. projectFile.LayerLoader и
+    # self.pollLoader). Картинки слоя, который выделяют, загружаются немедленно, а показанного - вне очереди; перед
+    # сохранением, экспортом и изменением разрешения загрузка дожидается окончания (см. self.finishLoading).
+    # Файл старого формата на первом этапе только разбирается до описаний слоёв: картинки в base64 пропускаются и
+    # читаются и декодируются тоже в фоне (см. projectFile.readLegacyProject). Сам разбор JSON остаётся синхронным и
+    # занимает примерно время чтения файла с диска (около 0,2 с на 200 МБ)
+    # Слот сигнала FileToolbar.openButton.clicked
     @pyqtSlot()
     def openFile(self, fileData=dict()) -> None:
         if fileData == dict():
@@ -555,95 +746,60 @@ class Window(QWidget):
             if filePath == '':
                 return
 
-            with open(filePath, 'r') as file:
-                jsonObject = json.load(file)
+            jsonObject, blob = readProject(filePath)
         else:
-            jsonObject = fileData
+            jsonObject, blob = fileData, None
 
         width, height = jsonObject['width'], jsonObject['height']
         self.clearFile(width=width, height=height)
 
         # Очередь, в которой слои будут добавлены в список слоёв
         listWidgetQueue = []
+        # Слои с картинками и их описания: tuple(z, LayerItem, dict)
+        loadQueue = []
 
-        # Слои восстанавливаются на сцене в порядке индексов
+        # Слои восстанавливаются на сцене в том порядке, в котором записаны в файле, и получают новые идентификаторы.
+        # Сетка у проекта одна, поэтому ей только задаются линии
         for layer in jsonObject['layers']:
             if layer['type'] == 'grd':
-                self.scene.items()[-1].widget().hLines = list(layer['h'])
-                self.scene.items()[-1].widget().vLines = list(layer['v'])
-            elif layer['type'] == 'bmp':
-                self.scene.addWidget(BitmapLayer(*self.resolution, self))
-                self.scene.items()[-1].setZValue(layer['z'])
-                byteArray = QByteArray.fromBase64(bytes(layer['data'], 'utf-8'))
-                self.scene.items()[-1].widget().bitmap.loadFromData(byteArray)
-                # self.layers.newBitmapLayer()
-                listWidgetQueue.append((layer['z'], layer['index'], layer['type'], layer['name']))
-            elif layer['type'] == 'img':
-                self.scene.addWidget(ImageLayer('tmp_icon.png', *self.resolution, self))
-                self.scene.items()[-1].setZValue(layer['z'])
-                byteArray = QByteArray.fromBase64(bytes(layer['data'], 'utf-8'))
-                self.scene.items()[-1].widget().image.loadFromData(byteArray)
-                self.scene.items()[-1].widget().xOffset = layer['xOffset']
-                self.scene.items()[-1].widget().yOffset = layer['yOffset']
-                self.scene.items()[-1].widget().alignment = layer['alignment']
-                self.scene.items()[-1].widget().leftBorder = tuple(layer['leftBorder'])
-                self.scene.items()[-1].widget().rightBorder = tuple(layer['rightBorder'])
-                self.scene.items()[-1].widget().topBorder = tuple(layer['topBorder'])
-                self.scene.items()[-1].widget().bottomBorder = tuple(layer['bottomBorder'])
-                self.scene.items()[-1].widget().size = layer['size']
-                # self.layers.newImageLayer()
-                listWidgetQueue.append((layer['z'], layer['index'], layer['type'], layer['name']))
-            elif layer['type'] == 'shp':
-                self.scene.addWidget(ShapeLayer(*self.resolution, self))
-                self.scene.items()[-1].setZValue(layer['z'])
-                self.scene.items()[-1].widget().shape = layer['shape']
-                self.scene.items()[-1].widget().xOffset = layer['xOffset']
-                self.scene.items()[-1].widget().yOffset = layer['yOffset']
-                self.scene.items()[-1].widget().width = layer['width']
-                self.scene.items()[-1].widget().lineColor = QColor(layer['lineColor'][0], layer['lineColor'][1],
-                                                                   layer['lineColor'][2], alpha=layer['lineColor'][3])
-                self.scene.items()[-1].widget().fillColor = QColor(layer['fillColor'][0], layer['fillColor'][1],
-                                                                   layer['fillColor'][2], alpha=layer['fillColor'][3])
-                self.scene.items()[-1].widget().firstVBorder = layer['firstVBorder']
-                self.scene.items()[-1].widget().firstHBorder = layer['firstHBorder']
-                self.scene.items()[-1].widget().secondVBorder = layer['secondVBorder']
-                self.scene.items()[-1].widget().secondHBorder = layer['secondHBorder']
-                # self.layers.newShapeLayer()
-                listWidgetQueue.append((layer['z'], layer['index'], layer['type'], layer['name']))
-            elif layer['type'] == 'txt':
-                self.scene.addWidget(TextLayer(*self.resolution, self))
-                self.scene.items()[-1].setZValue(layer['z'])
-                self.scene.items()[-1].widget().textEdit.setHtml(layer['text'])
-                self.scene.items()[-1].widget().leftBorder = tuple(layer['leftBorder'])
-                self.scene.items()[-1].widget().rightBorder = tuple(layer['rightBorder'])
-                self.scene.items()[-1].widget().topBorder = tuple(layer['topBorder'])
-                self.scene.items()[-1].widget().bottomBorder = tuple(layer['bottomBorder'])
-                self.scene.items()[-1].widget().updateTextEdit()
-                # self.layers.newTextLayer()
-                listWidgetQueue.append((layer['z'], layer['index'], layer['type'], layer['name']))
-
-        # В список слоёв слои добавляются в порядке высот, а не индексов
+                self.registry.grid().restoreState({'hLines': layer['h'], 'vLines': layer['v']})
+            elif layer['type'] in LAYER_TYPES:
+                widget = buildLayer(layer, *self.resolution, self, images=[])
+                layerId = self.registry.add(widget, layer['z'])
+                listWidgetQueue.append((layer['z'], layerId, layer['type'], layer['name']))
+                if imageEntries(layer):
+                    loadQueue.append((layer['z'], widget, layer))
+
+        # В список слоёв слои добавляются в порядке высот, а не идентификаторов
         listWidgetQueue.sort()
-        for (z, index, layerType, name) in listWidgetQueue:
+        for (z, layerId, layerType, name) in listWidgetQueue:
             if layerType == 'bmp':
-                self.layers.newBitmapLayer(z, index, name)
+                self.layers.newBitmapLayer(layerId, z, name)
             elif layerType == 'img':
-                self.layers.newImageLayer(z, index, name)
+                self.layers.newImageLayer(layerId, z, name)
             elif layerType == 'shp':
-                self.layers.newShapeLayer(z, index, name)
+                self.layers.newShapeLayer(layerId, z, name)
             elif layerType == 'txt':
-                self.layers.newTextLayer(z, index, name)
+                self.layers.newTextLayer(layerId, z, name)
 
         # Максимальная высота восстанавливается из файла
-        self.highestZ = max([i.zValue() for i in self.scene.items()[2:]] + [0])
-        self.layers.deactivateAll()
+        self.highestZ = max([self.registry.zValue(layerId) for layerId in self.registry.ordered(static=False)] + [0])
+        self.deactivateAllLayers()
 
-        if self.currentLayer != -1:
-            self.scene.items()[self.currentLayer].widget().active = False
-        self.currentLayer = -1
+        # Картинки загружаются в фоне сверху вниз: верхние слои перекрывают нижние и видны первыми. Прочитанные
+        # PNG-изображения запоминаются: неизменённые картинки при следующем сохранении не перекодируются
+        loadQueue.sort(key=lambda item: -item[0])
+        if loadQueue:
+            self.loader = LayerLoader([(widget, layer, entry) for _, widget, layer in loadQueue
+                                       for entry in imageEntries(layer)], blob, self.blobCache)
+            self.loadTimer.start()
 
     # Изменение разрешения проекта. Слот сигнала FileToolbar.resizeButton.clicked. Повторная сортировка нужна,
-    # чтобы правильно друг относительно друга располагались относительно и абсолютно заданные линии сетки
+    # чтобы правильно друг относительно друга располагались относительно и абсолютно заданные линии сетки.
+    # Плитки растровых слоёв пересчитываются в фоне в пуле потоков (см. resampling.ResizeJob), пока окно показывает ход
+    # выполнения и остаётся отзывчивым. Если пользователь отменяет изменение, проект остаётся прежним. Иначе все слои
+    # получают новое разрешение разом, после завершения всех задач.
+    # История изменений очищается, так как сохранённые в ней плитки холстов относятся к старому разрешению
     @pyqtSlot()
     def resizeFile(self) -> None:
         width = QInputDialog.getInt(self, 'Ширина изображения', 'Укажите желаемую ширину изображения.', 1280, min=1)
@@ -656,10 +812,30 @@ class Window(QWidget):
             QMessageBox.question(self, 'Масштабирование холстов',
                                  'Желаете ли вы, чтобы холсты растянулись/сжались после изменения размера?') == \
             QMessageBox.Yes else False
+        quality = 'smth'
+        if stretch:
+            qualities = ['Быстрое (по ближайшей точке)', 'Сглаженное', 'Чёткое (фильтр Ланцоша)']
+            quality = QInputDialog.getItem(self, 'Качество масштабирования', 'Выберите способ масштабирования холстов.',
+                                           qualities, 1, False)
+            if quality[1] is False:
+                return
+            quality = RESIZE_QUALITIES[qualities.index(quality[0])]
         width, height = width[0], height[0]
+
+        if not self.finishLoading():
+            return
+        bitmapLayers = [layer for layer in self.registry.items.values() if isinstance(layer, BitmapLayer)]
+        job = ResizeJob([layer.bitmap for layer in bitmapLayers], width, height, stretch, quality)
+        if not self.runJob(job, 'Изменение разрешения холстов...'):
+            return
+
         self.resolution = width, height
-        for item in self.scene.items():
-            item.widget().setResolution(width, height, stretch)
+        self.history.clear()
+        for layer, bitmap in zip(bitmapLayers, job.bitmaps):
+            layer.setResolution(width, height, stretch, bitmap)
+        for layerId in self.registry.ids():
+            if not isinstance(self.registry.layer(layerId), BitmapLayer):
+                self.registry.layer(layerId).setResolution(width, height, stretch)
         self.tab.widget(2).resolution = width, height
         self.tab.widget(2).sortV()
         self.tab.widget(2).sortH()
@@ -678,7 +854,8 @@ class Window(QWidget):
         self.clearFile(width=width, height=height)
 
     # Экспорт проекта в файл. Сначала все слои деактивируются, чтобы не отображались вспомогательные элементы.
-    # Затем содержимое слоёв отрисовывается на self.finalImage, потом self.finalImage сохраняется в файл нужного формата
+    # Затем слои сводятся в self.finalImage по плиткам в пуле потоков (см. compositor.py), потом self.finalImage
+    # сохраняется в файл нужного формата
     # Слот сигнала FileToolbar.exportButton.clicked
     @pyqtSlot()
     def exportFile(self):
@@ -689,16 +866,12 @@ class Window(QWidget):
         if filePath == '':
             return
 
-        self.layers.deactivateAll()
-        if self.currentLayer != -1:
-            self.scene.items()[self.currentLayer].widget().active = False
-        self.currentLayer = -1
+        if not self.finishLoading():
+            return
+        self.deactivateAllLayers()
 
-        self.finalImage = QImage(QSize(*self.resolution), QImage.Format_ARGB32_Premultiplied)
-        self.finalImage.fill(QColor(0, 0, 0, alpha=0))
-        qp = QPainter(self.finalImage)
-        for item in sorted(self.scene.items()[2:], key=lambda x: x.zValue()):
-            item.widget().render(qp)
+        self.finalImage = composite([self.registry.layer(layerId) for layerId in self.registry.ordered(static=False)],
+                                    *self.resolution)
         self.finalImage.save(filePath)
 
     # Слот сигнала self.projectOpenForm.signals.requestAccepted. Скрывает все формы, открывает проект
@@ -743,7 +916,8 @@ class Window(QWidget):
         projectName = QInputDialog.getText(self, 'Сохранение проекта в облаке', 'Укажите имя проекта')[0]
         if projectName == '':
             return
-        self.saveFile(variableDump=True, projectName=projectName)
+        if not self.saveFile(variableDump=True, projectName=projectName):
+            return
         self.fileDump['username'] = self.username
         self.fileDump['password'] = self.password
         response = requests.post(SERVER_ADDRESS + 'save_project', json=self.fileDump).json()
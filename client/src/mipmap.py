@@ -0,0 +1,158 @@
+import math
+import numpy as np
+from PyQt5.QtWidgets import QStyleOptionGraphicsItem
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtCore import QRect, QRectF
+from imageBuffer import imageArray
+
+
+# В этом файле описана пирамида уменьшенных копий (mip-уровней) содержимого слоя для отрисовки при мелком масштабе.
+# Уровень k - картинка, уменьшенная в 2^k раз: каждая её точка - среднее четырёх точек уровня k - 1 (каналы с
+# предумноженной альфой усредняются напрямую). При масштабе отображения не больше 1/2 слой рисуется ближайшим уровнем,
+# не меньшим экрана, поэтому сцена читает в 4^k раз меньше точек, чем при отрисовке исходной картинки, независимо от
+# размера холста
+
+
+# Сторона квадратных блоков исходной картинки, по которым строится уровень 1: блок, в котором исходная картинка
+# прозрачна (см. MipPyramid.read), не читается
+MIP_BLOCK = 512
+
+
+# Уменьшение вдвое массива точек pixels (np.uint32 формы (h, w), ARGB32 с предумноженной альфой) усреднением квадратов
+# 2 x 2. Нечётные строка и столбец на краю дополняются повтором крайних точек. Каналы не распаковываются: чётные и
+# нечётные байты точки складываются в 16-битных полях uint32 (сумма четырёх байтов не больше 1020 и в поле
+# умещается). Возвращает новый массив np.uint32
+def halve(pixels: np.ndarray) -> np.ndarray:
+    height, width = pixels.shape
+    if height % 2 or width % 2:
+        pixels = np.pad(pixels, ((0, height % 2), (0, width % 2)), mode='edge')
+
+    quads = (pixels[0::2, 0::2], pixels[0::2, 1::2], pixels[1::2, 0::2], pixels[1::2, 1::2])
+    low, high = quads[0] & 0x00FF00FF, (quads[0] >> 8) & 0x00FF00FF
+    for quad in quads[1:]:
+        low += quad & 0x00FF00FF
+        high += (quad >> 8) & 0x00FF00FF
+
+    # Деление на 4 с округлением в каждом поле
+    low += 0x00020002
+    high += 0x00020002
+    low >>= 2
+    high >>= 2
+    low &= 0x00FF00FF
+    high &= 0x00FF00FF
+    high <<= 8
+    low |= high
+    return low
+
+
+# Класс пирамиды уменьшенных копий. Уровни строятся лениво: только при первом запросе и только до запрошенного.
+# Изменения исходной картинки отмечаются прямоугольниками (self.invalidate), и при следующем запросе уровня
+# пересчитываются только точки, покрывающие изменённую область, - от уровня 1 вверх, каждый уровень из предыдущего
+# Атрибуты:
+# - self.width - int, ширина исходной картинки (уровня 0)
+# - self.height - int, высота исходной картинки
+# - self.read - функция (x, y, width, height) -> np.ndarray или None, возвращающая точки области исходной картинки
+# - - (np.uint32 формы (height, width), ARGB32 с предумноженной альфой). None - область целиком прозрачна
+# - self.levels - list(QImage), построенные уровни начиная с 1 (self.levels[0] - уровень 1)
+# - self.dirty - list(QRect), для каждого построенного уровня - изменённая с его последнего пересчёта область
+# - - исходной картинки (в координатах уровня 0)
+class MipPyramid:
+    def __init__(self, width: int, height: int, read) -> None:
+        self.read = read
+        self.reset(width, height)
+
+    # Сброс всех уровней и задание нового размера исходной картинки (при изменении разрешения слоя)
+    def reset(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        self.levels = []
+        self.dirty = []
+
+    # Прямоугольник исходной картинки
+    def rect(self) -> QRect:
+        return QRect(0, 0, self.width, self.height)
+
+    # Размер уровня level: исходный размер, уменьшенный в 2^level раз с округлением вверх
+    def levelSize(self, level: int) -> tuple:
+        return (self.width + (1 << level) - 1) >> level, (self.height + (1 << level) - 1) >> level
+
+    # Самый мелкий имеющий смысл уровень - тот, на котором картинка сжимается до одной точки по большей стороне
+    def maxLevel(self) -> int:
+        return max(self.width, self.height, 1).bit_length() - 1
+
+    # Уровень, которым нужно рисовать при преобразовании painter: самый мелкий, точки которого ещё не меньше точек
+    # экрана. 0 - масштаб больше 1/2, рисовать нужно исходную картинку
+    def levelFor(self, painter: QPainter) -> int:
+        detail = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        if detail <= 0 or detail > 0.5:
+            return 0
+        return min(int(math.floor(math.log2(1 / detail) + 1e-9)), self.maxLevel())
+
+    # Пометка области rect исходной картинки (QRect, None - вся картинка) изменённой
+    def invalidate(self, rect=None) -> None:
+        rect = self.rect() if rect is None else rect.intersected(self.rect())
+        if rect.isEmpty():
+            return
+        for i in range(len(self.levels)):
+            self.dirty[i] = self.dirty[i].united(rect)
+
+    # Уровень level (не меньше 1), актуальный на момент вызова. Недостающие уровни строятся, у построенных
+    # пересчитываются изменённые области
+    def level(self, level: int) -> QImage:
+        for current in range(1, level + 1):
+            if current > len(self.levels):
+                image = QImage(*self.levelSize(current), QImage.Format_ARGB32_Premultiplied)
+                self.levels.append(image)
+                self.dirty.append(self.rect())
+
+            if not self.dirty[current - 1].isEmpty():
+                self.downsample(current, self.dirty[current - 1])
+                self.dirty[current - 1] = QRect()
+
+        return self.levels[level - 1]
+
+    # Пересчёт точек уровня level, покрывающих область rect исходной картинки, из точек уровня level - 1
+    def downsample(self, level: int, rect: QRect) -> None:
+        x1, y1 = rect.left() >> level, rect.top() >> level
+        x2, y2 = rect.right() >> level, rect.bottom() >> level
+
+        # Область предыдущего уровня, из которой получаются точки [x1, x2] x [y1, y2]
+        sourceWidth, sourceHeight = self.levelSize(level - 1)
+        sx1, sy1 = 2 * x1, 2 * y1
+        sx2, sy2 = min(2 * x2 + 1, sourceWidth - 1), min(2 * y2 + 1, sourceHeight - 1)
+
+        target = imageArray(self.levels[level - 1])
+        if level > 1:
+            source = imageArray(self.levels[level - 2], writable=False)
+            target[y1:y2 + 1, x1:x2 + 1] = halve(source[sy1:sy2 + 1, sx1:sx2 + 1])
+            return
+
+        # Уровень 1 строится по блокам исходной картинки (границы блоков чётны, поэтому блоки дают целые точки)
+        for by in range(sy1 // MIP_BLOCK * MIP_BLOCK, sy2 + 1, MIP_BLOCK):
+            for bx in range(sx1 // MIP_BLOCK * MIP_BLOCK, sx2 + 1, MIP_BLOCK):
+                bx1, by1 = max(bx, sx1), max(by, sy1)
+                bx2, by2 = min(bx + MIP_BLOCK - 1, sx2), min(by + MIP_BLOCK - 1, sy2)
+                block = target[by1 // 2:by2 // 2 + 1, bx1 // 2:bx2 // 2 + 1]
+                source = self.read(bx1, by1, bx2 - bx1 + 1, by2 - by1 + 1)
+                if source is None:
+                    block[...] = 0
+                else:
+                    block[...] = halve(source)
+
+    # Отрисовка области rect (QRectF в координатах исходной картинки) на painter уровнем, подходящим к его масштабу.
+    # Возвращает False, если масштаб крупный и исходную картинку вызывающий должен нарисовать сам
+    def draw(self, painter: QPainter, rect: QRectF) -> bool:
+        level = self.levelFor(painter)
+        if level == 0:
+            return False
+
+        image = self.level(level)
+        scale = 1 << level
+        source = QRectF(rect.x() / scale, rect.y() / scale, rect.width() / scale, rect.height() / scale) \
+            .toAlignedRect().intersected(image.rect())
+
+        painter.save()
+        painter.scale(scale, scale)
+        painter.drawImage(source, image, source)
+        painter.restore()
+        return True
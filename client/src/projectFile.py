@@ -0,0 +1,653 @@
+import os
+import re
+import json
+import struct
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from PyQt5.QtGui import QImage, QColor
+from PyQt5.QtCore import QByteArray, QBuffer, QIODevice
+from bitmapLayer import BitmapLayer
+from gridLayer import GridLayer
+from imageLayer import ImageLayer
+from shapeLayer import ShapeLayer
+from textLayer import TextLayer
+from tiledBitmap import TiledBitmap
+
+
+# В этом файле описаны чтение и запись файлов проектов .gri и восстановление слоёв из описания проекта (само описание
+# - протокол JSON - приведено в комментарии к Window.saveFile). Используется и окном при открытии и сохранении проекта,
+# и пакетным экспортом без окна (см. batchExport.py), и преобразованием файлов между форматами (см. convertProject.py).
+# Файл проекта бывает двух форматов:
+# - двоичный контейнер (записывается программой): заголовок, описание проекта в JSON и следом данные картинок слоёв
+# - - (PNG) подряд, без base64. Заголовок - CONTAINER_HEADER: сигнатура CONTAINER_MAGIC, версия формата и длина
+# - - описания в байтах. Картинки в описании заданы полем blob - номером в таблице blobs описания, где каждому номеру
+# - - соответствует пара (отступ от начала данных, длина), поэтому любую картинку можно прочитать, не читая остальные
+# - старый формат: всё описание в JSON, картинки заданы полем data - PNG в base64 (так же проект передаётся серверу).
+# - - Такие файлы читаются по частям (см. readLegacyProject), не целиком
+
+
+# Типы слоёв, записываемых в файл проекта (фон в файл не записывается)
+LAYER_TYPES = ('bmp', 'img', 'shp', 'txt', 'grd')
+
+# Сигнатура двоичного контейнера - первые байты файла
+CONTAINER_MAGIC = b'GRIMAGE\x1a'
+
+# Версия формата двоичного контейнера
+CONTAINER_VERSION = 1
+
+# Заголовок двоичного контейнера: сигнатура, версия, длина описания проекта в байтах
+CONTAINER_HEADER = struct.Struct('<8sII')
+
+# Число потоков, в которых кодируются и декодируются картинки слоёв при сохранении и открытии проекта
+CODEC_WORKERS = os.cpu_count() or 4
+
+# Наименьший размер блока (в символах), которым дочитывается файл проекта старого формата
+STREAM_CHUNK = 1 << 20
+
+# Пробельные символы JSON
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+# Кодирование картинки в PNG
+def encodePng(image: QImage) -> bytes:
+    byteArray = QByteArray()
+    buffer = QBuffer(byteArray)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "PNG")
+    buffer.close()
+    return byteArray.data()
+
+
+# Декодирование картинки из PNG (или любого другого формата, который понимает QImage)
+def decodePng(data: bytes) -> QImage:
+    image = QImage()
+    image.loadFromData(data)
+    return image
+
+
+# Кодирование картинки в строку для записи в файл проекта старого формата: PNG, затем base64 (в виде utf-8 строки)
+def encodeImage(image: QImage) -> str:
+    return str(QByteArray(encodePng(image)).toBase64(), 'utf_8')
+
+
+# Декодирование картинки, записанной в файл проекта старого формата функцией encodeImage
+def decodeImage(data: str) -> QImage:
+    return decodePng(QByteArray.fromBase64(bytes(data, 'utf-8')))
+
+
+# Описания картинок в описании слоя layer: словари, в которых картинка задана полем data или blob. У холста это его
+# плитки (в файлах старых версий - сам слой), у слоя-картинки - сам слой, у остальных слоёв картинок нет
+def imageEntries(layer: dict) -> list:
+    if layer['type'] == 'bmp':
+        return layer['tiles'] if 'tiles' in layer else [layer]
+    if layer['type'] == 'img':
+        return [layer]
+    return []
+
+
+# PNG-изображение картинки описания entry (см. imageEntries). blob - функция, возвращающая данные картинки двоичного
+# контейнера по номеру (см. ProjectReader.blob), у проектов старого формата не нужна
+def readBlob(entry: dict, blob=None) -> bytes:
+    if 'blob' in entry:
+        return blob(entry['blob'])
+    return QByteArray.fromBase64(bytes(entry['data'], 'utf-8')).data()
+
+
+# Картинка описания entry (см. readBlob)
+def readImage(entry: dict, blob=None) -> QImage:
+    return decodePng(readBlob(entry, blob))
+
+
+# Чтение и декодирование картинки описания entry слоя layer при открытии проекта в окне. Плитки холстов сразу
+# переводятся в формат TiledBitmap, чтобы попасть в хранилище без копирования. Возвращает tuple(QImage, bytes) -
+# картинку и её PNG-изображение (для BlobCache.remember)
+def loadImage(layer: dict, entry: dict, blob=None) -> tuple:
+    data = readBlob(entry, blob)
+    image = decodePng(data)
+    if layer['type'] == 'bmp':
+        image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+    return image, data
+
+
+# Класс чтения двоичного контейнера. При создании читается только описание проекта, картинки слоёв читаются по одной
+# по запросу
+# Атрибуты:
+# - self.path - str, путь к файлу проекта
+# - self.manifest - dict, описание проекта (протокол см. в Window.saveFile)
+# - self.dataOffset - int, отступ начала данных картинок от начала файла
+class ProjectReader:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as file:
+            magic, version, length = CONTAINER_HEADER.unpack(file.read(CONTAINER_HEADER.size))
+            if magic != CONTAINER_MAGIC:
+                raise ValueError(f'{path} - не двоичный файл проекта')
+            if version > CONTAINER_VERSION:
+                raise ValueError(f'Версия файла проекта {path} ({version}) не поддерживается')
+            self.manifest = json.loads(file.read(length).decode('utf-8'))
+        self.dataOffset = CONTAINER_HEADER.size + length
+
+    # Данные картинки номер index
+    def blob(self, index: int) -> bytes:
+        offset, length = self.manifest['blobs'][index]
+        with open(self.path, 'rb') as file:
+            file.seek(self.dataOffset + offset)
+            return file.read(length)
+
+
+# Проверка, является ли файл path двоичным контейнером (иначе это файл старого формата)
+def isContainer(path: str) -> bool:
+    with open(path, 'rb') as file:
+        return file.read(len(CONTAINER_MAGIC)) == CONTAINER_MAGIC
+
+
+# Класс последовательного чтения JSON из файла по частям. В памяти держится только ещё не разобранная часть файла:
+# значения разбираются стандартным json.JSONDecoder.raw_decode прямо из буфера, а если значение обрывается на конце
+# буфера, файл дочитывается блоком не меньше уже прочитанной части значения (поэтому общее время разбора линейно).
+# Файл открывается как текст utf-8 без преобразования концов строк, а отступ разобранной части от начала файла
+# считается в байтах (см. tell), чтобы по нему можно было потом прочитать часть файла, не разбирая его заново
+# Атрибуты:
+# - self.file - текстовый файл, из которого читается JSON
+# - self.buffer - str, прочитанная, но ещё не отброшенная часть файла
+# - self.position - int, позиция в self.buffer, с которой начинается неразобранная часть
+# - self.mark - int, позиция в self.buffer, до которой посчитан отступ self.offset
+# - self.offset - int, отступ в байтах от начала файла до позиции self.mark
+# - self.eof - bool, файл прочитан до конца
+# - self.decoder - json.JSONDecoder, разборщик значений
+class JsonStream:
+    def __init__(self, file) -> None:
+        self.file = file
+        self.buffer = ''
+        self.position = 0
+        self.mark = 0
+        self.offset = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    # Дочитывание не меньше size символов файла. Разобранная часть буфера отбрасывается
+    def read(self, size: int) -> None:
+        data = self.file.read(max(size, STREAM_CHUNK))
+        self.tell()
+        self.buffer = self.buffer[self.position:] + data
+        self.position = self.mark = 0
+        self.eof = not data
+
+    # Отступ в байтах от начала файла до неразобранной части. Считается от предыдущего вызова, поэтому каждый
+    # символ файла перекодируется в utf-8 для подсчёта не больше одного раза
+    def tell(self) -> int:
+        text = self.buffer[self.mark:self.position]
+        self.offset += len(text) if text.isascii() else len(text.encode('utf-8'))
+        self.mark = self.position
+        return self.offset
+
+    # Следующий после пробелов символ (не разбирается) или '' в конце файла
+    def peek(self) -> str:
+        while True:
+            self.position = JSON_WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer) or self.eof:
+                return self.buffer[self.position:self.position + 1]
+            self.read(STREAM_CHUNK)
+
+    # Пропуск символа char, если он следующий. Возвращает True, если символ пропущен
+    def consume(self, char: str) -> bool:
+        if self.peek() == char:
+            self.position += 1
+            return True
+        return False
+
+    # Пропуск обязательного символа char
+    def expect(self, char: str) -> None:
+        if not self.consume(char):
+            raise ValueError(f'Ожидался символ {char!r}, а не {self.peek()!r}')
+
+    # Разбор следующего значения целиком (строки, числа, объекта, ...)
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # Число на конце буфера могло оборваться, поэтому значение считается разобранным, только если за ним
+                # что-то есть
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.read(len(self.buffer) - self.position)
+
+    # Пропуск следующего значения - строки без кавычек внутри (например, base64) - без её разбора и без чтения
+    # целиком в память. Возвращает tuple(int, int) - отступ содержимого строки от начала файла и его длину в байтах
+    def skipString(self) -> tuple:
+        self.expect('"')
+        start = self.tell()
+        while True:
+            end = self.buffer.find('"', self.position)
+            if end >= 0:
+                break
+            if self.eof:
+                raise ValueError('Строка не закрыта до конца файла')
+            self.position = len(self.buffer)
+            self.read(STREAM_CHUNK)
+        self.position = end
+        length = self.tell() - start
+        self.position += 1
+        return start, length
+
+
+# Разбор описания картинки или слоя старого формата из потока stream. Поле data (картинка в base64) не читается в
+# память: вместо него в список locations записывается его положение в файле (см. JsonStream.skipString), а в описание -
+# поле blob с номером в этом списке. Плитки холстов (поле tiles) разбираются так же
+def readLegacyEntry(stream: JsonStream, locations: list) -> dict:
+    entry = dict()
+    stream.expect('{')
+    while not stream.consume('}'):
+        key = stream.value()
+        stream.expect(':')
+        if key == 'data' and stream.peek() == '"':
+            locations.append(stream.skipString())
+            entry['blob'] = len(locations) - 1
+        elif key == 'tiles' and stream.peek() == '[':
+            stream.expect('[')
+            entry['tiles'] = []
+            while not stream.consume(']'):
+                entry['tiles'].append(readLegacyEntry(stream, locations))
+                stream.consume(',')
+        else:
+            entry[key] = stream.value()
+        stream.consume(',')
+    return entry
+
+
+# PNG-изображение картинки номер index файла проекта старого формата path. locations - положения картинок в base64
+# в файле (см. readLegacyEntry)
+def readLegacyBlob(path: str, locations: list, index: int) -> bytes:
+    offset, length = locations[index]
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        return QByteArray.fromBase64(file.read(length)).data()
+
+
+# Чтение файла проекта старого формата path по частям (см. JsonStream). Картинки слоёв при этом не читаются в память
+# и не декодируются: запоминаются только их положения в файле, и каждая потом читается по запросу, как у двоичного
+# контейнера (см. ProjectReader). Возвращает то же, что и ProjectReader: описание проекта, в котором картинки заданы
+# номерами (поле blob), и функцию чтения PNG-изображений по номеру
+def readLegacyProject(path: str) -> tuple:
+    manifest, locations = dict(), []
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        stream = JsonStream(file)
+        stream.expect('{')
+        while not stream.consume('}'):
+            key = stream.value()
+            stream.expect(':')
+            if key != 'layers':
+                manifest[key] = stream.value()
+                stream.consume(',')
+                continue
+
+            manifest['layers'] = []
+            stream.expect('[')
+            while not stream.consume(']'):
+                manifest['layers'].append(readLegacyEntry(stream, locations))
+                stream.consume(',')
+            stream.consume(',')
+
+    return manifest, partial(readLegacyBlob, path, locations)
+
+
+# Чтение файла проекта path любого формата. Возвращает описание проекта, в котором картинки заданы номерами (поле
+# blob), и функцию чтения PNG-изображений по номеру
+def readProject(path: str) -> tuple:
+    if isContainer(path):
+        reader = ProjectReader(path)
+        return reader.manifest, reader.blob
+    return readLegacyProject(path)
+
+
+# Запись двоичного контейнера в файл path: описание проекта manifest (картинки в нём заданы номерами в списке blobs) и
+# данные картинок blobs. Таблица blobs описания составляется здесь
+def writeProject(path: str, manifest: dict, blobs: list) -> None:
+    table, offset = [], 0
+    for data in blobs:
+        table.append((offset, len(data)))
+        offset += len(data)
+    header = json.dumps(dict(manifest, blobs=table), ensure_ascii=False).encode('utf-8')
+
+    with open(path, 'wb') as file:
+        file.write(CONTAINER_HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, len(header)))
+        file.write(header)
+        for data in blobs:
+            file.write(data)
+
+
+# Описание проекта в старом формате (картинки в base64 внутри описания) по описанию manifest двоичного контейнера и
+# функции чтения картинок blob. Исходное описание не изменяется. Картинки не перекодируются
+def embedBlobs(manifest: dict, blob) -> dict:
+    output = {key: value for key, value in manifest.items() if key not in ('blobs', 'layers')}
+    output['layers'] = []
+    for layer in manifest['layers']:
+        layer = dict(layer)
+        if 'tiles' in layer:
+            layer['tiles'] = [dict(tile) for tile in layer['tiles']]
+        for entry in imageEntries(layer):
+            if 'blob' in entry:
+                entry['data'] = str(QByteArray(blob(entry.pop('blob'))).toBase64(), 'utf_8')
+        output['layers'].append(layer)
+    return output
+
+
+# Описание проекта для двоичного контейнера и список данных картинок по описанию jsonObject старого формата или
+# описанию с номерами картинок и функции их чтения blob (картинки нумеруются заново по порядку). Исходное описание не
+# изменяется. Картинки не перекодируются
+def extractBlobs(jsonObject: dict, blob=None) -> tuple:
+    manifest = {key: value for key, value in jsonObject.items() if key not in ('blobs', 'layers')}
+    manifest['layers'], blobs = [], []
+    for layer in jsonObject['layers']:
+        layer = dict(layer)
+        if 'tiles' in layer:
+            layer['tiles'] = [dict(tile) for tile in layer['tiles']]
+        for entry in imageEntries(layer):
+            if 'data' in entry or 'blob' in entry:
+                blobs.append(readBlob(entry, blob))
+                entry.pop('data', None)
+                entry['blob'] = len(blobs) - 1
+        manifest['layers'].append(layer)
+    return manifest, blobs
+
+
+# Фоновое задание кодирования или декодирования картинок слоёв. Каждая картинка обрабатывается отдельной задачей в пуле
+# потоков (Qt на время кодирования и декодирования отпускает GIL). Результаты складываются в self.results в порядке
+# перечисления задач, независимо от порядка завершения, в потоке, вызывающем self.wait.
+# Задание не зависит от интерфейса: ход выполнения показывает тот, кто вызывает self.wait (см. Window.runJob)
+# Атрибуты:
+# - self.results - list, результаты задач в порядке их перечисления (None - задача ещё не завершена)
+# - self.total - int, общее число задач
+# - self.done - int, число завершённых задач
+# - self.cancelled - threading.Event, признак отмены: ещё не начатые задачи при нём сразу завершаются
+# - self.executor - ThreadPoolExecutor, пул потоков
+# - self.futures - dict(Future, int), незавершённые задачи и их номера
+class CodecJob:
+    def __init__(self, tasks: list, workers=CODEC_WORKERS) -> None:
+        self.results = [None] * len(tasks)
+        self.total = len(tasks)
+        self.done = 0
+        self.cancelled = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = {self.executor.submit(self.run, task): i for i, task in enumerate(tasks)}
+
+    # Выполнение одной задачи в потоке пула (если задание ещё не отменено)
+    def run(self, task):
+        if self.cancelled.is_set():
+            return None
+        return task()
+
+    # Ожидание завершения хотя бы одной задачи не дольше timeout секунд. Результаты завершённых задач записываются в
+    # self.results. Ошибка задачи отменяет задание и выбрасывается дальше. Возвращает True, если все задачи завершены
+    def wait(self, timeout: float) -> bool:
+        if self.futures:
+            finished, _ = wait(self.futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = self.futures.pop(future)
+                try:
+                    self.results[index] = future.result()
+                except Exception:
+                    self.cancel()
+                    raise
+                self.done += 1
+
+        if not self.futures:
+            self.executor.shutdown(wait=False)
+        return not self.futures
+
+    # Отмена задания: ещё не начатые задачи снимаются, выполняющиеся дорабатывают в фоне (их не ждут, чтобы окно не
+    # замирало), их результат отбрасывается
+    def cancel(self) -> None:
+        self.cancelled.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.futures.clear()
+
+
+# Класс кэша PNG-изображений картинок слоёв (плиток холстов и картинок слоёв-картинок) для повторных сохранений
+# проекта. Картинка определяется своим QImage.cacheKey(): Qt меняет его при каждом получении доступа на запись к точкам
+# картинки (QPainter, bits(), fill, ...), а заменённые картинки (отмена действия, смена картинки слоя) - это новые
+# объекты с новыми ключами. Поэтому ключ служит счётчиком поколений картинки, который не нужно увеличивать вручную ни
+# в одном из мест, где меняются точки, и при сохранении кодируются только картинки, изменённые с прошлого сохранения
+# (или открытия) проекта. Остальные свойства слоёв кодирования не требуют и записываются заново каждый раз
+# Атрибуты:
+# - self.blobs - dict(int, bytes), PNG-изображения по ключам картинок. Хранятся только картинки последнего сохранения
+# - - или открытия проекта
+class BlobCache:
+    def __init__(self) -> None:
+        self.blobs = dict()
+
+    # Очистка кэша (при закрытии проекта)
+    def clear(self) -> None:
+        self.blobs = dict()
+
+    # Запоминание PNG-изображений уже закодированных картинок: pairs - list(tuple(QImage, bytes)) (см. loadImage)
+    def remember(self, pairs: list) -> None:
+        self.blobs.update((image.cacheKey(), data) for image, data in pairs)
+
+    # PNG-изображения картинок images в том же порядке. Картинки, которых нет в кэше, кодируются (каждая один раз)
+    # заданием CodecJob, которое выполняет функция run (job -> bool, см. Window.runJob). Картинки, не вошедшие в
+    # images, из кэша удаляются. Возвращает None, если run вернула False (задание отменено или не выполнено), кэш при
+    # этом не меняется. Задачи кодируют копии картинок (QImage разделяет с копией точки до первой записи): после
+    # отмены задачи дорабатывают в фоне, а слои уже можно менять
+    def encode(self, images: list, run) -> list:
+        keys = [image.cacheKey() for image in images]
+        missing = {key: image for key, image in zip(keys, images) if key not in self.blobs}
+        job = CodecJob([partial(encodePng, QImage(image)) for image in missing.values()])
+        if not run(job):
+            return None
+
+        encoded = dict(zip(missing, job.results))
+        self.blobs = {key: self.blobs[key] if key in self.blobs else encoded[key] for key in keys}
+        return [self.blobs[key] for key in keys]
+
+
+# Класс фоновой загрузки картинок слоёв открытого проекта. Слои создаются пустыми (см. buildLayer с images=[]), а их
+# картинки читаются и декодируются в пуле потоков в порядке очереди и записываются в слои (см. installImage) в потоке,
+# вызывающем self.wait, - каждый слой перерисовывается один раз за вызов. Очередь пополняет пул сама: завершившаяся
+# задача отправляет в пул следующую картинку, поэтому скорость загрузки не зависит от того, как часто вызывается
+# self.wait. Картинки слоя, который нужен немедленно, загружаются вне очереди (self.require), а слоя, который стоит
+# загрузить раньше остальных, - переносятся в начало очереди (self.prioritize). Ошибка чтения картинки не прерывает
+# загрузку остальных, картинка пропускается. Интерфейс ожидания такой же, как у CodecJob (см. Window.runJob)
+# Атрибуты:
+# - self.blob - функция чтения картинок двоичного контейнера (см. readImage) или None
+# - self.cache - BlobCache или None, кэш, в котором запоминаются PNG-изображения загруженных картинок
+# - self.queue - list(tuple(LayerItem, dict, dict)), ещё не отправленные в пул картинки: слой, его описание и описание
+# - - картинки (см. imageEntries), в порядке загрузки
+# - self.total - int, общее число картинок
+# - self.done - int, число загруженных (или пропущенных из-за ошибки) картинок
+# - self.failed - int, число картинок, которые не удалось загрузить
+# - self.workers - int, число потоков. В пуле одновременно не больше 2 * self.workers незавершённых задач, чтобы
+# - - очередь можно было переупорядочивать
+# - self.running - int, число незавершённых задач в пуле
+# - self.lock - threading.RLock, блокировка self.queue, self.futures и self.running (их меняют и потоки пула)
+# - self.executor - ThreadPoolExecutor, пул потоков
+# - self.futures - dict(Future, tuple(LayerItem, dict, dict)), картинки, отправленные в пул и ещё не записанные в слои
+class LayerLoader:
+    def __init__(self, items: list, blob=None, cache=None, workers=CODEC_WORKERS) -> None:
+        self.blob = blob
+        self.cache = cache
+        self.queue = list(items)
+        self.total = len(items)
+        self.done = 0
+        self.failed = 0
+        self.workers = workers
+        self.running = 0
+        self.lock = threading.RLock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = dict()
+
+        with self.lock:
+            self.submit()
+
+    # Отправка картинок из начала очереди в пул, пока в нём есть место. Вызывается под self.lock
+    def submit(self) -> None:
+        while self.queue and self.running < 2 * self.workers:
+            self.send(self.queue.pop(0))
+
+    # Отправка в пул картинки item (элемента очереди). Вызывается под self.lock
+    def send(self, item: tuple) -> None:
+        widget, layer, entry = item
+        future = self.executor.submit(loadImage, layer, entry, self.blob)
+        self.futures[future] = item
+        self.running += 1
+        future.add_done_callback(self.advance)
+
+    # Завершение задачи future (вызывается потоком пула или при отмене): на её место отправляется следующая картинка.
+    # Если программа завершается, пул новых задач не принимает, и загрузка прекращается
+    def advance(self, future) -> None:
+        with self.lock:
+            self.running -= 1
+            try:
+                self.submit()
+            except RuntimeError:
+                self.queue = []
+
+    # Запись картинок завершённых задач finished в слои. Каждый изменившийся слой перерисовывается один раз.
+    # Вызывается под self.lock
+    def install(self, finished) -> None:
+        widgets, pairs = [], []
+        for future in finished:
+            widget, layer, entry = self.futures.pop(future)
+            self.done += 1
+            try:
+                image, data = future.result()
+            except Exception:
+                self.failed += 1
+                continue
+
+            installImage(widget, layer, entry, image)
+            pairs.append((image, data))
+            if widget not in widgets:
+                widgets.append(widget)
+
+        if self.cache is not None:
+            self.cache.remember(pairs)
+        for widget in widgets:
+            widget.update()
+
+    # Ожидание загрузки хотя бы одной картинки не дольше timeout секунд (0 - только проверка). Загруженные картинки
+    # записываются в слои. Возвращает True, если загружены все картинки
+    def wait(self, timeout: float) -> bool:
+        with self.lock:
+            futures = list(self.futures)
+        if futures:
+            finished, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            with self.lock:
+                self.install(finished)
+
+        # Задача считается завершённой раньше, чем отправит в пул следующую картинку, поэтому проверяется и очередь
+        with self.lock:
+            finished = not self.futures and not self.queue
+        if finished:
+            self.executor.shutdown(wait=False)
+        return finished
+
+    # Немедленная загрузка всех ещё не загруженных картинок слоя widget (например, перед его редактированием).
+    # Картинки слоя отправляются в пул вне очереди, и вызывающий поток ждёт именно их
+    def require(self, widget) -> None:
+        with self.lock:
+            for item in [item for item in self.queue if item[0] is widget]:
+                self.queue.remove(item)
+                self.send(item)
+            pending = [future for future, item in self.futures.items() if item[0] is widget]
+
+        if pending:
+            wait(pending)
+            with self.lock:
+                self.install(pending)
+
+    # Перенос ещё не отправленных в пул картинок слоя widget в начало очереди
+    def prioritize(self, widget) -> None:
+        with self.lock:
+            items = [item for item in self.queue if item[0] is widget]
+            self.queue = items + [item for item in self.queue if item[0] is not widget]
+
+    # Отмена загрузки: ещё не начатые задачи снимаются, выполняющиеся дорабатывают в фоне (их не ждут, чтобы окно не
+    # замирало), их результат отбрасывается
+    def cancel(self) -> None:
+        with self.lock:
+            self.queue = []
+            self.futures.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Запись декодированной картинки image описания entry (см. imageEntries) в слой widget, созданный по описанию layer
+def installImage(widget, layer: dict, entry: dict, image: QImage) -> None:
+    if layer['type'] == 'bmp':
+        if entry is layer:
+            widget.bitmap = TiledBitmap.fromImage(image)
+        else:
+            widget.bitmap.setTile(entry['x'], entry['y'], image)
+    elif layer['type'] == 'img':
+        widget.image = image
+
+
+# Создание слоя разрешения width x height по его описанию layer из файла проекта. parent - окно, которому слой будет
+# принадлежать (None - слой создаётся без окна и пригоден только для отрисовки, например, при пакетном экспорте).
+# blob - функция чтения картинок двоичного контейнера (см. readImage). images - уже декодированные картинки слоя в
+# порядке imageEntries (пустой список - слой создаётся без картинок, их загружает LayerLoader), None - картинки
+# декодируются здесь же
+def buildLayer(layer: dict, width: int, height: int, parent=None, blob=None, images=None):
+    if layer['type'] == 'grd':
+        widget = GridLayer(width, height)
+        widget.restoreState({'hLines': layer['h'], 'vLines': layer['v']})
+    elif layer['type'] == 'bmp':
+        widget = BitmapLayer(width, height, parent)
+    elif layer['type'] == 'img':
+        widget = ImageLayer('tmp_icon.png', width, height, parent)
+        widget.image = QImage()
+        widget.xOffset = layer['xOffset']
+        widget.yOffset = layer['yOffset']
+        widget.alignment = layer['alignment']
+        widget.leftBorder = tuple(layer['leftBorder'])
+        widget.rightBorder = tuple(layer['rightBorder'])
+        widget.topBorder = tuple(layer['topBorder'])
+        widget.bottomBorder = tuple(layer['bottomBorder'])
+        widget.size = layer['size']
+    elif layer['type'] == 'shp':
+        widget = ShapeLayer(width, height, parent)
+        widget.shape = layer['shape']
+        widget.xOffset = layer['xOffset']
+        widget.yOffset = layer['yOffset']
+        widget.width = layer['width']
+        widget.lineColor = QColor(layer['lineColor'][0], layer['lineColor'][1],
+                                  layer['lineColor'][2], alpha=layer['lineColor'][3])
+        widget.fillColor = QColor(layer['fillColor'][0], layer['fillColor'][1],
+                                  layer['fillColor'][2], alpha=layer['fillColor'][3])
+        widget.firstVBorder = layer['firstVBorder']
+        widget.firstHBorder = layer['firstHBorder']
+        widget.secondVBorder = layer['secondVBorder']
+        widget.secondHBorder = layer['secondHBorder']
+    elif layer['type'] == 'txt':
+        widget = TextLayer(width, height, parent)
+        widget.restoreState({'text': layer['text']})
+        widget.leftBorder = tuple(layer['leftBorder'])
+        widget.rightBorder = tuple(layer['rightBorder'])
+        widget.topBorder = tuple(layer['topBorder'])
+        widget.bottomBorder = tuple(layer['bottomBorder'])
+        widget.updateTextEdit()
+    else:
+        raise ValueError(f"Неизвестный тип слоя: {layer['type']}")
+
+    if images is None:
+        images = [readImage(entry, blob) for entry in imageEntries(layer)]
+    for entry, image in zip(imageEntries(layer), images):
+        installImage(widget, layer, entry, image)
+
+    return widget
+
+
+# Слои проекта jsonObject, которые попадают в экспортируемое изображение, снизу вверх - в том же порядке, в каком их
+# сводит Window.exportFile: по высоте, при равной высоте - в порядке записи в файле. Фон и сетка не экспортируются.
+# blob - функция чтения картинок двоичного контейнера (см. readImage)
+def exportLayers(jsonObject: dict, parent=None, blob=None) -> list:
+    width, height = jsonObject['width'], jsonObject['height']
+    layers = [(layer['z'], i, layer) for i, layer in enumerate(jsonObject['layers'])
+              if layer['type'] in LAYER_TYPES and layer['type'] != 'grd']
+    layers.sort(key=lambda x: x[:2])
+    return [buildLayer(layer, width, height, parent, blob) for _, _, layer in layers]
@@ -0,0 +1,124 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+
+
+# В этом файле описано масштабирование растровых слоёв при изменении разрешения проекта: фильтр Ланцоша и фоновое
+# задание, которое пересчитывает плитки всех растровых слоёв в пуле потоков (см. ResizeJob)
+
+
+# Способы масштабирования холстов:
+# - 'fast' - по ближайшей точке, самый быстрый, но с "лесенкой" на краях
+# - 'smth' - билинейное сглаживание средствами Qt
+# - 'lncz' - фильтр Ланцоша (LANCZOS_SUPPORT лепестков), самый чёткий и самый медленный
+RESIZE_QUALITIES = ('fast', 'smth', 'lncz')
+
+# Число лепестков фильтра Ланцоша (радиус ядра в точках исходного холста при увеличении)
+LANCZOS_SUPPORT = 3
+
+# Число потоков, в которых пересчитываются плитки
+RESIZE_WORKERS = os.cpu_count() or 4
+
+
+# Матрица весов фильтра Ланцоша по одной оси. Для точек start..start + count - 1 нового холста вычисляются веса точек
+# исходного холста длиной limit, масштаб - scale (новый размер / старый). При уменьшении ядро растягивается в
+# 1 / scale раз, чтобы усреднять все попадающие в точку исходные точки. Веса точек за краем холста отбрасываются, а
+# оставшиеся нормируются. Возвращает tuple(np.ndarray (count, last - first), int first, int last) - веса и отрезок
+# [first, last) исходных точек, от которых зависит результат
+def lanczosWeights(start: int, count: int, scale: float, limit: int) -> tuple:
+    factor = min(1.0, scale)
+    support = LANCZOS_SUPPORT / factor
+    centers = (np.arange(start, start + count) + 0.5) / scale - 0.5
+
+    first = max(0, int(np.floor(centers[0] - support)))
+    last = min(limit, int(np.ceil(centers[-1] + support)) + 1)
+    x = (np.arange(first, last)[None, :] - centers[:, None]) * factor
+    weights = np.sinc(x) * np.sinc(x / LANCZOS_SUPPORT) * (np.abs(x) < LANCZOS_SUPPORT)
+
+    sums = weights.sum(axis=1, keepdims=True)
+    weights /= np.where(sums == 0, 1, sums)
+    return weights.astype(np.float32), first, last
+
+
+# Масштабирование фильтром Ланцоша прямоугольника (left, top, width, height) нового холста. readRegion(x, y, w, h)
+# должна возвращать точки исходного холста (np.uint32, ARGB с предумноженной альфой) в этом прямоугольнике. Каналы
+# фильтруются с предумноженной альфой, поэтому цвет прозрачных точек не "просачивается" в соседние. Возвращает
+# np.ndarray (height, width) с типом np.uint32
+def lanczosResample(readRegion, left: int, top: int, width: int, height: int,
+                    xScale: float, yScale: float, sourceWidth: int, sourceHeight: int) -> np.ndarray:
+    xWeights, x1, x2 = lanczosWeights(left, width, xScale, sourceWidth)
+    yWeights, y1, y2 = lanczosWeights(top, height, yScale, sourceHeight)
+
+    region = readRegion(x1, y1, x2 - x1, y2 - y1)
+    channels = region.view(np.uint8).reshape(y2 - y1, x2 - x1, 4).astype(np.float32)
+
+    # Сначала по столбцам, затем по строкам: (h, w', 4) -> (h, 4, w) -> (h, w, 4)
+    result = np.tensordot(np.tensordot(yWeights, channels, axes=(1, 0)), xWeights, axes=(1, 1)).transpose(0, 2, 1)
+
+    # Лепестки ядра отрицательны, поэтому возможны выбросы за допустимый диапазон. Цвет с предумноженной альфой не
+    # может превышать альфу (в памяти точки хранятся как B, G, R, A)
+    result = np.clip(result, 0, 255)
+    result[..., :3] = np.minimum(result[..., :3], result[..., 3:])
+    return np.ascontiguousarray(np.rint(result).astype(np.uint8)).view(np.uint32).reshape(height, width)
+
+
+# Фоновое задание изменения разрешения нескольких растровых хранилищ (TiledBitmap). Каждая плитка каждого нового
+# хранилища пересчитывается отдельной задачей в пуле потоков (см. TiledBitmap.resizeTasks); старые хранилища при этом
+# не изменяются. Готовые плитки складываются в новые хранилища в потоке, вызывающем self.wait, поэтому до завершения
+# всех задач новые хранилища никому не видны, а после отмены просто отбрасываются.
+# Задание не зависит от интерфейса: ход выполнения показывает тот, кто вызывает self.wait (см. Window.resizeFile)
+# Атрибуты:
+# - self.bitmaps - list(TiledBitmap), новые хранилища в том же порядке, что и исходные
+# - self.total - int, общее число задач
+# - self.done - int, число завершённых задач
+# - self.cancelled - threading.Event, признак отмены: ещё не начатые задачи при нём сразу завершаются
+# - self.executor - ThreadPoolExecutor, пул потоков
+# - self.futures - dict(Future, tuple(TiledBitmap, tuple(int, int))), незавершённые задачи и то, куда положить их
+# - - результат (новое хранилище и ключ плитки)
+class ResizeJob:
+    def __init__(self, bitmaps: list, width: int, height: int, stretch: bool, quality: str,
+                 workers=RESIZE_WORKERS) -> None:
+        self.bitmaps = []
+        self.done = 0
+        self.cancelled = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = dict()
+
+        for bitmap in bitmaps:
+            newBitmap, tasks = bitmap.resizeTasks(width, height, stretch, quality)
+            self.bitmaps.append(newBitmap)
+            for key, task in tasks:
+                self.futures[self.executor.submit(self.run, task)] = (newBitmap, key)
+
+        self.total = len(self.futures)
+
+    # Выполнение одной задачи в потоке пула (если задание ещё не отменено)
+    def run(self, task):
+        if self.cancelled.is_set():
+            return None
+        return task()
+
+    # Ожидание завершения хотя бы одной задачи не дольше timeout секунд. Плитки завершённых задач записываются в новые
+    # хранилища. Возвращает True, если все задачи завершены
+    def wait(self, timeout: float) -> bool:
+        if self.futures:
+            finished, _ = wait(self.futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in finished:
+                bitmap, key = self.futures.pop(future)
+                tile = future.result()
+                if tile is not None:
+                    bitmap.tiles[key] = tile
+                self.done += 1
+
+        if not self.futures:
+            self.executor.shutdown(wait=False)
+        return not self.futures
+
+    # Отмена задания: ещё не начатые задачи снимаются, выполняющиеся дорабатывают в фоне (их не ждут, чтобы окно не
+    # замирало; старые плитки они читают из снимка, см. TiledBitmap.resizeTasks), их результат отбрасывается
+    def cancel(self) -> None:
+        self.cancelled.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.futures.clear()
+        self.bitmaps = []
@@ -1,6 +1,7 @@
-from PyQt5.QtWidgets import QWidget
-from PyQt5.QtGui import QPainter, QPalette, QBrush, QColor, QPaintEvent, QMouseEvent
-from PyQt5.QtCore import Qt, QRect, QPoint
+from PyQt5.QtWidgets import QWidget, QStyleOptionGraphicsItem
+from PyQt5.QtGui import QPainter, QBrush, QColor, QMouseEvent
+from PyQt5.QtCore import Qt, QRect, QRectF, QPoint
+from layerItem import LayerItem
 
 
 # Класс фигурного слоя. Сигналов не сообщает
@@ -25,8 +26,8 @@ from PyQt5.QtCore import Qt, QRect, QPoint
 # - - которыми картинка задаётся), False - ЛКМ отпущена.
 # - self.curMousePos - QPoint, точка, задающая первую пару ограничительных линий
 # - self.lastMousePos - QPoint, точка, задающая вторую пару ограничительных линий
-# - self.gridLines - list(list(tuple(int, int))) - список линий сетки. Под индеком 0 - горизонтальные, 1 - вертикальные.
-# - - В каждом подсписке линия сетки задаётся как tuple(indentType, indent), где indentType - тип отступа линии
+# - self.gridIndex - GridIndex или None, индекс линий сетки (см. gridLayer.GridIndex), взятый у сетки при нажатии ЛКМ.
+# - - Линия сетки задаётся как tuple(indentType, indent), где indentType - тип отступа линии
 # - - от верхнего (для горизонтальных) или левого (для вертикальных) края, значения:
 # - - - 0 - абсолютный отступ (задаётся в пикселях переменной indent)
 # - - - 1 - относительный отступ (задаётся в процентах от высоты (для горизонтальных) или ширины (для вертикальных)
@@ -37,15 +38,13 @@ from PyQt5.QtCore import Qt, QRect, QPoint
 # - self.secondHBorder - tuple(int, int), вторая горизонтальная ограничительная линия сетки
 # - self.xOffset - int, отступ по горизонтали в пикселях от точки, где фигура должна лежать идеально по сетке
 # - self.yOffset - int, отступ по вертикали в пикселях от точки, где фигура должна лежать идеально по сетке
-class ShapeLayer(QWidget):
+# - self.stateBeforeDrawing - dict, состояние слоя (см. self.saveState) на момент нажатия ЛКМ. По нему при отпускании
+# - - ЛКМ в историю изменений окна добавляется изменение границ и оффсета фигуры
+class ShapeLayer(LayerItem):
     def __init__(self, width: int, height: int, parent: QWidget) -> None:
-        super().__init__()
+        super().__init__(width, height)
         self.parent = parent
 
-        self.setMinimumSize(width, height)
-        self.setMaximumSize(width, height)
-        self.resolution = width, height
-
         self.tool = 'none'
         self.shape = 'none'
         self.lineColor = QColor(0, 0, 0)
@@ -58,7 +57,7 @@ class ShapeLayer(QWidget):
         self.curMousePos = QPoint(0, 0)
         self.lastMousePos = QPoint(0, 0)
 
-        self.gridLines = []
+        self.gridIndex = None
 
         self.firstVBorder = (1, 0)
         self.secondVBorder = (1, 100)
@@ -68,24 +67,21 @@ class ShapeLayer(QWidget):
         self.xOffset = 0
         self.yOffset = 0
 
-        palette = self.palette()
-        palette.setBrush(QPalette.Window, QBrush(QColor(0, 0, 0, alpha=0), Qt.SolidPattern))
-        self.setPalette(palette)
+        self.stateBeforeDrawing = dict()
 
-    # Функция нахождения ближайших вертикальной и горизонтальной линий сетки к точке. Используется при задании
-    # пользователем ограничительных линий фигуры
+    # Функция нахождения ближайших вертикальной и горизонтальной линий сетки к точке (двоичным поиском по индексу
+    # сетки). Используется при задании пользователем ограничительных линий фигуры
     def findNearestGridlines(self, point: QPoint) -> tuple[tuple[int, int], tuple[int, int]]:
-        x, y = point.x(), point.y()
-        hLine = min(self.gridLines[0], key=lambda i: abs(y - self.gridLineToOffset(0, *i)))
-        vLine = min(self.gridLines[1], key=lambda i: abs(x - self.gridLineToOffset(1, *i)))
-
-        return hLine, vLine
+        return self.gridIndex.nearest(0, point.y()), self.gridIndex.nearest(1, point.x())
 
     # Отрисовка содержимого слоя. Если пользователь "рисует" на слое, помимо самой фигуры отрисовываются также
     # вспомогательные элементы, помогающие пользователю понять, куда "прикрепилась" фигура, а также "тень" фигуры,
-    # рисующаяся не по ближайшим линиям сетки, а точно по нажатиям пользователя
-    def paintEvent(self, event: QPaintEvent) -> None:
-        qp = QPainter(self)
+    # рисующаяся не по ближайшим линиям сетки, а точно по нажатиям пользователя. Если пользователь не "рисует", а фигура
+    # целиком вне окна просмотра, слой не рисуется вовсе
+    def paint(self, qp: QPainter, option: QStyleOptionGraphicsItem, widget=None) -> None:
+        if not self.drawing and self.visibleRect(option).isEmpty():
+            return
+
         pen = qp.pen()
         pen.setWidth(self.width)
         pen.setColor(self.lineColor)
@@ -108,9 +104,8 @@ class ShapeLayer(QWidget):
             qp.drawEllipse(min(x1, x2) + self.xOffset, min(y1, y2) + self.yOffset, abs(x1 - x2), abs(y1 - y2))
 
         if self.drawing and self.shape != 'none' and self.tool == 'grid':
-            qp = QPainter(self)
             qp.setPen(Qt.DashLine)
-            qp.setBrush(qp.background())
+            qp.setBrush(Qt.NoBrush)
 
             if self.shape == 'line':
                 qp.drawLine(self.lastMousePos, self.curMousePos)
@@ -125,12 +120,38 @@ class ShapeLayer(QWidget):
             qp.fillRect(QRect(QPoint(x2, y2) - QPoint(16, 16), QPoint(x2, y2) + QPoint(16, 16)),
                         QBrush(QColor(0, 0, 255, alpha=64)))
 
+    # Содержимое слоя - прямоугольник фигуры, расширенный на толщину обводки. У слоя без фигуры содержимого нет
+    def contentRect(self) -> QRectF:
+        if self.shape == 'none':
+            return QRectF()
+
+        x1 = self.gridLineToOffset(1, *self.firstVBorder)
+        x2 = self.gridLineToOffset(1, *self.secondVBorder)
+        y1 = self.gridLineToOffset(0, *self.firstHBorder)
+        y2 = self.gridLineToOffset(0, *self.secondHBorder)
+        return QRectF(QPoint(x1, y1), QPoint(x2, y2)).normalized() \
+            .translated(self.xOffset, self.yOffset).adjusted(-self.width, -self.width, self.width, self.width)
+
     # Функция преобразования линии сетки в отступ от левого верхнего края (в пикселях), используется при нахождении
     # ограничивающих линий сетки и отрисовке слоя. Подробнее о формате аргументов см. в комментарии
     # к самому классу
     def gridLineToOffset(self, direction: int, indentType: int, indent: int) -> int:
         return int(self.resolution[direction ^ 1] / 100 * indent) if indentType == 1 else indent
 
+    # Состояние слоя, отслеживаемое историей изменений (см. history.py): всё, что определяет внешний вид фигуры
+    def saveState(self) -> dict:
+        return {'shape': self.shape, 'lineColor': QColor(self.lineColor), 'fillColor': QColor(self.fillColor),
+                'width': self.width, 'firstVBorder': self.firstVBorder, 'firstHBorder': self.firstHBorder,
+                'secondVBorder': self.secondVBorder, 'secondHBorder': self.secondHBorder,
+                'xOffset': self.xOffset, 'yOffset': self.yOffset}
+
+    # Восстановление части состояния слоя (при отмене и возврате действий), ключи - как в self.saveState
+    def restoreState(self, state: dict) -> None:
+        for key, value in state.items():
+            setattr(self, key, value)
+
+        self.update()
+
     def updateState(self, lineColor, fillColor, width, tool, shape):
         self.lineColor = lineColor
         self.fillColor = fillColor
@@ -138,11 +159,10 @@ class ShapeLayer(QWidget):
         self.tool = tool
         self.shape = shape
 
-        self.repaint()
+        self.update()
 
-    # Обработчик нажатия кнопки мыши. Если слой неактивен, но находится поверх остальных (имеет наибольший z),
-    # то event будет приходить ему. В таком случае слой через self.parent передает нажатие на нужный слой.
-    # В противном случае включается self.drawing и обновляется self.lastMousePos (при задании и оффсета, и
+    # Обработчик нажатия кнопки мыши. События мыши слою доставляет Window.inputRouter, и только когда слой активен.
+    # Включается self.drawing и обновляется self.lastMousePos (при задании и оффсета, и
     # ограничивающих прямых он используется)
     def mousePressEvent(self, event: QMouseEvent) -> None:
         if self.active:
@@ -152,18 +172,14 @@ class ShapeLayer(QWidget):
             self.drawing = True
             self.lastMousePos = event.pos()
             self.curMousePos = event.pos()
+            self.stateBeforeDrawing = self.saveState()
 
             if self.tool == 'grid':
-                self.gridLines = [self.parent.scene.items()[1].widget().hLines,
-                                  self.parent.scene.items()[1].widget().vLines]
+                self.gridIndex = self.parent.registry.grid().index
 
                 self.firstHBorder, self.firstVBorder = self.findNearestGridlines(self.lastMousePos)
-        elif self.parent.currentLayer != -1:
-            self.parent.scene.items()[self.parent.currentLayer].widget().mousePressEvent(event)
 
-    # Обработчик движения мыши. Если слой неактивен, но находится поверх остальных (имеет наибольший z),
-    # то event будет приходить ему. В таком случае слой через self.parent передает нажатие на нужный слой.
-    # В противном случае проверяется, что мышь уже была нажата ранее и выбран инструмент.
+    # Обработчик движения мыши. Проверяется, что мышь уже была нажата ранее и выбран инструмент.
     # Если инструмент - задание оффсета, то оффсет сразу обновляется для корректной перерисовки слоя, если
     # задаётся прямоугольник линий сетки, то меняется лишь его вторая задающая точка
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
@@ -176,24 +192,18 @@ class ShapeLayer(QWidget):
                 self.curMousePos = event.pos()
                 self.secondHBorder, self.secondVBorder = self.findNearestGridlines(self.curMousePos)
 
-            self.repaint()
-        elif not self.active and self.parent.currentLayer != -1:
-            self.parent.scene.items()[self.parent.currentLayer].widget().mouseMoveEvent(event)
+            self.update()
 
-    # Обработчик отпускания кнопки мыши. Если слой неактивен, но находится поверх остальных (имеет наибольший z),
-    # то event будет приходить ему. В таком случае слой через self.parent передает нажатие на нужный слой.
-    # В противном случае проверяется, идет ли сейчас рисование. Если да, то оно заканчивается
+    # Обработчик отпускания кнопки мыши. Проверяется, идет ли сейчас рисование. Если да, то оно заканчивается, а
+    # изменения границ и оффсета фигуры добавляются в историю изменений окна
     def mouseReleaseEvent(self, event: QMouseEvent) -> None:
         if self.active and self.drawing:
             self.drawing = False
-            self.repaint()
-        elif not self.active and self.parent.currentLayer != -1:
-            self.parent.scene.items()[self.parent.currentLayer].widget().mouseMoveEvent(event)
+            self.parent.history.pushState(self, self.stateBeforeDrawing)
+            self.update()
 
     # Задание нового разрешения. Вызывается родительским классом Window при изменении разрешения проекта
     # параметр stretch ничего не задаёт, так как фигура в любом случае должна подгоняться под обновлённую сетку
     def setResolution(self, width: int, height: int, stretch: bool) -> None:
-        self.setMinimumSize(width, height)
-        self.setMaximumSize(width, height)
-        self.resolution = width, height
-        self.repaint()
+        self.resize(width, height)
+        self.update()
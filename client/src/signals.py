@@ -9,7 +9,8 @@ class Signals(QObject):
 
 
 # Специальные сигналы для классов LayerList и LayerListItem. Выделены в отдельный класс, чтобы
-# главный цикл программы не пытался считывать эти сигналы с эл-ов, которые их по определению иметь не могут
+# главный цикл программы не пытался считывать эти сигналы с эл-ов, которые их по определению иметь не могут.
+# Слои обозначаются идентификаторами в реестре слоёв (см. layerRegistry.py)
 class LayerSignals(QObject):
     # Слой активирован, передаётся индекс слоя
     activated = pyqtSignal(int)
@@ -37,6 +38,13 @@ class GridSignals(QObject):
     # Линия сетки удалена, передаётся направление (0 - горизонтальное, 1 - вертикальное),
     # тип отступа (0 - абсолютный, 1 - относительный), сам отступ (в пикселях / в процентах). Подробности в gridLayer.py
     deleted = pyqtSignal(int, int, int)
+    # Холст разбит на равные колонки или строки, все линии этого направления заменены одним пакетом. Передаются
+    # направление (0 - строки горизонтальными линиями, 1 - колонки вертикальными), число колонок (строк) и промежуток
+    # между ними в пикселях
+    divided = pyqtSignal(int, int, int)
+    # Линии направления удалены одним пакетом. Передаются направление (0 - горизонтальные, 1 - вертикальные) и
+    # диапазон отступов удалённых линий в пикселях, от и до включительно
+    rangeDeleted = pyqtSignal(int, int, int)
 
 
 # Сигналы, описывающие взаимодействие ImageLayer и ImageToolbar
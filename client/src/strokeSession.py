@@ -0,0 +1,167 @@
+import time
+from PyQt5.QtGui import QPainter, QPen, QPolygon
+from PyQt5.QtCore import QObject, QTimer, QPoint, QPointF, QRect, pyqtSlot
+from tiledBitmap import TiledBitmap
+from brushEngine import BRUSH_SPACING, DabStamper, dabCache
+
+
+# Интервал (в мс) между отрисовками накопленных точек мазка. Все движения мыши, пришедшие за один интервал ("кадр"),
+# рисуются одной ломаной
+FRAME_INTERVAL = 16
+
+
+# Класс сеанса рисования одного мазка кистью, ручкой, карандашом или ластиком (от нажатия до отпускания ЛКМ).
+# QPainter для каждой затронутой плитки холста создаётся один раз при первом касании плитки и используется до конца
+# мазка, а не пересоздаётся на каждое движение мыши. Точки движений мыши не рисуются сразу, а копятся в
+# self.pendingPoints и раз в кадр (FRAME_INTERVAL мс) рисуются одной ломаной, поэтому стоимость рисования зависит от
+# частоты кадров, а не от частоты событий мыши (планшеты и мыши с частотой опроса 1000 Гц).
+# Мазок штампуемой кистью (см. brushEngine.py) вместо ломаной рисуется отпечатками, расставленными вдоль неё с равным
+# шагом; все отпечатки кадра ставятся за одну отрисовку.
+# Помимо рисования сеанс измеряет время своей работы (см. self.timings)
+# Атрибуты:
+# - self.bitmap - TiledBitmap, хранилище слоя, на котором идёт рисование
+# - self.pen - QPen, копия пера слоя на момент начала мазка
+# - self.erase - bool, True - мазок стирает (ластик), False - рисует
+# - self.onFlush - функция, которой после каждой отрисовки передаётся QRect изменённой области (BitmapLayer.markDirty)
+# - self.dab - QImage или None, отпечаток штампуемой кисти (из brushEngine.dabCache). None - мазок рисуется пером
+# - self.stamper - DabStamper или None, расстановщик отпечатков штампуемой кисти вдоль мазка
+# - self.painters - dict(tuple(int, int), QPainter), открытые на время мазка QPainter затронутых плиток
+# - self.lastPoint - QPoint, последняя нарисованная точка мазка (с неё начинается следующая ломаная)
+# - self.pendingPoints - list(QPoint), точки, пришедшие после последней отрисовки
+# - self.timer - QTimer, однократный таймер отрисовки накопленных точек, запускается первой точкой кадра
+# - self.startTime - float, время начала мазка (time.perf_counter)
+# - self.firstPendingTime - float, время прихода первой ещё не нарисованной точки
+# - self.eventCount - int, число точек (событий движения мыши), полученных за мазок
+# - self.frameCount - int, число отрисовок за мазок
+# - self.drawTime - float, суммарное время отрисовок в секундах
+# - self.maxFrameTime - float, наибольшее время одной отрисовки в секундах
+# - self.maxLatency - float, наибольшая задержка от прихода точки до её отрисовки в секундах
+class StrokeSession(QObject):
+    def __init__(self, bitmap: TiledBitmap, pen: QPen, erase: bool, start: QPoint, onFlush, brush='none') -> None:
+        super().__init__()
+
+        self.bitmap = bitmap
+        self.pen = QPen(pen)
+        self.erase = erase
+        self.onFlush = onFlush
+        self.painters = dict()
+
+        self.dab = None
+        self.stamper = None
+        if brush in BRUSH_SPACING:
+            self.dab = dabCache.dab(brush, self.pen.width(), self.pen.color())
+            self.stamper = DabStamper(brush, self.pen.width())
+
+        self.lastPoint = QPoint(start)
+        self.pendingPoints = []
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(FRAME_INTERVAL)
+        self.timer.timeout.connect(self.flush)
+
+        self.startTime = time.perf_counter()
+        self.firstPendingTime = 0.0
+        self.eventCount = 0
+        self.frameCount = 0
+        self.drawTime = 0.0
+        self.maxFrameTime = 0.0
+        self.maxLatency = 0.0
+
+    # Добавление очередной точки мазка (вызывается на каждое движение мыши). Точка будет нарисована в ближайшем кадре
+    def addPoint(self, point: QPoint) -> None:
+        if not self.pendingPoints:
+            self.firstPendingTime = time.perf_counter()
+            self.timer.start()
+
+        self.pendingPoints.append(QPoint(point))
+        self.eventCount += 1
+
+    # Отрисовка всех накопленных точек одной ломаной (или отпечатками вдоль неё) от self.lastPoint. Рисование идёт
+    # только на плитках, которые пересекает ломаная; для плиток, впервые затронутых мазком, открываются QPainter.
+    # Слот сигнала self.timer.timeout
+    @pyqtSlot()
+    def flush(self) -> None:
+        self.timer.stop()
+        if not self.pendingPoints:
+            return
+
+        frameStart = time.perf_counter()
+        if self.dab is not None:
+            rect = self.stampDabs(self.stamper.positions([self.lastPoint] + self.pendingPoints))
+        else:
+            polyline = QPolygon([self.lastPoint] + self.pendingPoints)
+            padding = self.pen.width() + 1
+            rect = polyline.boundingRect().adjusted(-padding, -padding, padding, padding)
+
+            for key in self.bitmap.tileKeys(rect):
+                painter = self.painter(*key)
+                if painter is not None:
+                    painter.drawPolyline(polyline)
+
+        self.lastPoint = self.pendingPoints[-1]
+        self.pendingPoints = []
+
+        frameEnd = time.perf_counter()
+        self.frameCount += 1
+        self.drawTime += frameEnd - frameStart
+        self.maxFrameTime = max(self.maxFrameTime, frameEnd - frameStart)
+        self.maxLatency = max(self.maxLatency, frameEnd - self.firstPendingTime)
+
+        self.onFlush(rect)
+
+    # Постановка отпечатков штампуемой кисти с центрами в точках positions (list(QPointF)). Каждый отпечаток рисуется
+    # только на тех плитках, которые он задевает. Возвращает QRect, охватывающий все отпечатки
+    def stampDabs(self, positions: list) -> QRect:
+        rect = QRect()
+        size = self.dab.width()
+        for position in positions:
+            topLeft = QPointF(position.x() - size / 2, position.y() - size / 2)
+            dabRect = QRect(int(topLeft.x()) - 1, int(topLeft.y()) - 1, size + 2, size + 2)
+            for key in self.bitmap.tileKeys(dabRect):
+                self.painter(*key).drawImage(topLeft, self.dab)
+            rect = rect.united(dabRect)
+
+        return rect
+
+    # QPainter плитки (tx, ty), открытый на время мазка. При первом обращении создаётся с пером и режимом наложения
+    # мазка. Для ластика по несозданной плитке возвращается None: стирать на ней нечего
+    def painter(self, tx: int, ty: int):
+        if (tx, ty) not in self.painters:
+            if self.erase and (tx, ty) not in self.bitmap.tiles:
+                return None
+
+            qp = self.bitmap.tilePainter(tx, ty)
+            qp.setPen(self.pen)
+            qp.setRenderHint(QPainter.SmoothPixmapTransform)
+            if self.erase:
+                qp.setCompositionMode(QPainter.CompositionMode_Clear)
+            self.painters[(tx, ty)] = qp
+
+        return self.painters[(tx, ty)]
+
+    # Завершение мазка: отрисовка оставшихся точек и закрытие всех QPainter. Возвращает замеры времени (см. timings).
+    # Если штампуемой кистью просто щёлкнули, не двигая мышь, в точке нажатия ставится один отпечаток
+    def end(self) -> dict:
+        self.flush()
+        if self.stamper is not None and self.stamper.count == 0:
+            self.onFlush(self.stampDabs([QPointF(self.lastPoint)]))
+            self.stamper.count = 1
+
+        for qp in self.painters.values():
+            qp.end()
+        self.painters.clear()
+
+        return self.timings()
+
+    # Замеры времени мазка. Словарь с ключами:
+    # - events - int, число полученных точек
+    # - frames - int, число отрисовок (каждая рисует все точки, пришедшие за кадр)
+    # - duration - float, длительность мазка в секундах
+    # - drawTime - float, суммарное время рисования в секундах
+    # - maxFrameTime - float, наибольшее время одной отрисовки в секундах
+    # - maxLatency - float, наибольшая задержка от прихода точки до её появления на холсте в секундах
+    def timings(self) -> dict:
+        return {'events': self.eventCount, 'frames': self.frameCount,
+                'duration': time.perf_counter() - self.startTime, 'drawTime': self.drawTime,
+                'maxFrameTime': self.maxFrameTime, 'maxLatency': self.maxLatency}
@@ -1,11 +1,20 @@
-from PyQt5.QtWidgets import QWidget, QTextEdit, QFrame
-from PyQt5.QtGui import QColor, QPalette, QBrush, QPainter, QFont, QMouseEvent, QPaintEvent
-from PyQt5.QtCore import QPoint, Qt, QRect, pyqtSlot
+from PyQt5.QtWidgets import QWidget, QTextEdit, QFrame, QGraphicsProxyWidget, QStyleOptionGraphicsItem
+from PyQt5.QtGui import QColor, QBrush, QPainter, QFont, QMouseEvent
+from PyQt5.QtCore import QPoint, Qt, QRect, QRectF, QTimer
+from layerItem import LayerItem
+
+
+# Пауза в наборе текста (в мс), после которой набранное добавляется в историю изменений одним действием
+TEXT_COMMIT_DELAY = 1000
 
 
 # Класс текстового слоя. Сигналов не сообщает
 # Графические элементы:
 # - self.textEdit - QTextEdit, редактируемое поле ввода
+# - self.textProxy - QGraphicsProxyWidget, дочерний элемент слоя на сцене, в который вставлено поле ввода. Виджетом
+# - - на сцене является только поле ввода размером с плашку текста, а не весь слой
+# - self.textCommitTimer - QTimer, однократный таймер, перезапускаемый при каждом изменении текста. Когда пользователь
+# - - перестаёт печатать на TEXT_COMMIT_DELAY мс, изменение текста добавляется в историю изменений окна одним действием
 # Атрибуты:
 # - self.parent - QWidget, родительский виджет главного окна, через который слой получает информацию о сетке и
 # - - обновляет панель инструментов
@@ -32,8 +41,8 @@ from PyQt5.QtCore import QPoint, Qt, QRect, pyqtSlot
 # - self.previousZValue - int. Поскольку self.textEdit никак не реагирует на нажатие, передаваемое ему вручную,
 # - - было решено при каждой активации двигать слой на высоту 1023, а при деактивации - обратно на настоящую высоту.
 # - - Чтобы настоящая высота была легко доступка программе, она хранится как атрибут
-# - self.gridLines - list(list(tuple(int, int))) - список линий сетки. Под индеком 0 - горизонтальные, 1 - вертикальные.
-# - - В каждом подсписке линия сетки задаётся как tuple(indentType, indent), где indentType - тип отступа линии
+# - self.gridIndex - GridIndex или None, индекс линий сетки (см. gridLayer.GridIndex), взятый у сетки при нажатии ЛКМ.
+# - - Линия сетки задаётся как tuple(indentType, indent), где indentType - тип отступа линии
 # - - от верхнего (для горизонтальных) или левого (для вертикальных) края, значения:
 # - - - 0 - абсолютный отступ (задаётся в пикселях переменной indent)
 # - - - 1 - относительный отступ (задаётся в процентах от высоты (для горизонтальных) или ширины (для вертикальных)
@@ -42,19 +51,22 @@ from PyQt5.QtCore import QPoint, Qt, QRect, pyqtSlot
 # - self.rightBorder - tuple(indentType, indent), правая сторона прямоугольника, задаётся описанным выше образом
 # - self.topBorder - tuple(indentType, indent), верхняя сторона прямоугольника, задаётся описанным выше образом
 # - self.bottomBorder - tuple(indentType, indent), нижняя сторона прямоугольника, задаётся описанным выше образом
-class TextLayer(QWidget):
+# - self.committedText - str, текст слоя (в формате HTML) на момент последнего добавления его изменения в историю
+# - self.stateBeforeDrawing - dict, состояние слоя (см. self.saveState) на момент нажатия ЛКМ. По нему при отпускании
+# - - ЛКМ в историю изменений окна добавляется изменение ограничивающего прямоугольника
+class TextLayer(LayerItem):
     def __init__(self, width: int, height: int, parent: QWidget) -> None:
-        super().__init__()
+        super().__init__(width, height)
         self.parent = parent
 
-        self.setMinimumSize(width, height)
-        self.setMaximumSize(width, height)
-        self.resolution = width, height
-
-        self.textEdit = QTextEdit(self)
-        self.textEdit.setGeometry(0, 0, 0, 0)
+        self.textEdit = QTextEdit()
         self.textEdit.setFrameShape(QFrame.NoFrame)
         self.textEdit.setStyleSheet('background: rgba(0,0,0,0%)')
+        self.textProxy = QGraphicsProxyWidget(self)
+        self.textProxy.setWidget(self.textEdit)
+        # Иначе вставка не даст сделать поле ввода меньше его рекомендуемого размера, даже если мала ячейка сетки
+        self.textProxy.setMinimumSize(0, 0)
+        self.textProxy.setGeometry(QRectF(0, 0, 0, 0))
 
         self.color = QColor(0, 0, 0)
         self.font = 'Verdana'
@@ -74,16 +86,20 @@ class TextLayer(QWidget):
         self.curMousePos = QPoint(0, 0)
         self.lastMousePos = QPoint(0, 0)
 
-        self.gridLines = []
+        self.gridIndex = None
 
         self.leftBorder = (1, 0)
         self.rightBorder = (1, 100)
         self.topBorder = (1, 0)
         self.bottomBorder = (1, 100)
 
-        palette = self.palette()
-        palette.setBrush(QPalette.Window, QBrush(QColor(0, 0, 0, alpha=0), Qt.SolidPattern))
-        self.setPalette(palette)
+        self.committedText = self.textEdit.toHtml()
+        self.stateBeforeDrawing = dict()
+        self.textCommitTimer = QTimer(self.textEdit)
+        self.textCommitTimer.setSingleShot(True)
+        self.textCommitTimer.setInterval(TEXT_COMMIT_DELAY)
+        self.textCommitTimer.timeout.connect(self.commitText)
+        self.textEdit.textChanged.connect(self.textCommitTimer.start)
 
     # Функция преобразования линии сетки в отступ от левого верхнего края (в пикселях), используется при нахождении
     # ограничивающего прямоугольника линий сетки и отрисовке слоя. Подробнее о формате аргументов см. в комментарии
@@ -91,33 +107,6 @@ class TextLayer(QWidget):
     def gridLineToOffset(self, direction: int, indentType: int, indent: int) -> int:
         return int(self.resolution[direction ^ 1] / 100 * indent) if indentType == 1 else indent
 
-    # Функция нахождения ограничивающих линий прямоугольника, в котором плашка с текстом лежит. Возвращает индексы линий
-    # в соответствующих подсписках в списке self.gridLines. Используется самим классом при отрисовке
-    def findBoundaryGridLines(self, x1: int, y1: int, x2: int, y2: int):
-        leftGridLine = 0
-        while leftGridLine < len(self.gridLines[1]) and \
-                self.gridLineToOffset(1, *self.gridLines[1][leftGridLine]) <= x1:
-            leftGridLine += 1
-        leftGridLine -= 1
-
-        topGridLine = 0
-        while topGridLine < len(self.gridLines[0]) and \
-                self.gridLineToOffset(0, *self.gridLines[0][topGridLine]) <= y1:
-            topGridLine += 1
-        topGridLine -= 1
-
-        rightGridLine = len(self.gridLines[1]) - 1
-        while rightGridLine > -1 and self.gridLineToOffset(1, *self.gridLines[1][rightGridLine]) >= x2:
-            rightGridLine -= 1
-        rightGridLine += 1
-
-        bottomGridLine = len(self.gridLines[0]) - 1
-        while bottomGridLine > -1 and self.gridLineToOffset(0, *self.gridLines[0][bottomGridLine]) >= y2:
-            bottomGridLine -= 1
-        bottomGridLine += 1
-
-        return leftGridLine, rightGridLine, topGridLine, bottomGridLine
-
     # Функция отрисовки прямоугольника из линий сетки, в котором картинка лежит. Рисуется только когда пользователь
     # рисует (для удобства предпросмотра). Фактически является вынесенной частью функции self.paintEvent
     def drawGridRect(self, painter: QPainter) -> None:
@@ -134,19 +123,16 @@ class TextLayer(QWidget):
         x1, y1, x2, y2 = max(x1, 1), max(y1, 1), min(x2, self.resolution[0] - 1), min(y2, self.resolution[1] - 1)
         qp.drawRect(x1, y1, x2 - x1, y2 - y1)
 
-        leftGridLine, rightGridLine, topGridLine, bottomGridLine = self.findBoundaryGridLines(x1, y1, x2, y2)
-        qp.fillRect(QRect(QPoint(self.gridLineToOffset(1, *self.gridLines[1][leftGridLine]),
-                                 self.gridLineToOffset(0, *self.gridLines[0][topGridLine])),
-                          QPoint(self.gridLineToOffset(1, *self.gridLines[1][rightGridLine]),
-                                 self.gridLineToOffset(0, *self.gridLines[0][bottomGridLine]))),
-                    QBrush(QColor(0, 0, 255, alpha=64))
-                    )
+        leftGridLine, rightGridLine, topGridLine, bottomGridLine = self.gridIndex.cell(x1, y1, x2, y2)
+        offsets = self.gridIndex.offsets
+        qp.fillRect(QRect(QPoint(offsets[1][leftGridLine], offsets[0][topGridLine]),
+                          QPoint(offsets[1][rightGridLine], offsets[0][bottomGridLine])),
+                    QBrush(QColor(0, 0, 255, alpha=64)))
 
     # Функция отрисовки слоя. Поскольку self.textEdit рисуется сам, здесь отрисовываются только вспомогательные элементы
     # а именно прямоугольник, которым ограничена плашка с текстом (если слой активен), прямоугольник,
     # рисуемый пользователем, и назначаемый пользователем новый ограничивающий прямоугольник, если пользователь рисует
-    def paintEvent(self, event: QPaintEvent) -> None:
-        qp = QPainter(self)
+    def paint(self, qp: QPainter, option: QStyleOptionGraphicsItem, widget=None) -> None:
         if self.active:
             x1 = self.gridLineToOffset(1, *self.leftBorder)
             x2 = self.gridLineToOffset(1, *self.rightBorder)
@@ -157,34 +143,43 @@ class TextLayer(QWidget):
 
         self.drawGridRect(qp)
 
+    # Область содержимого слоя: у неактивного слоя рисуется только поле ввода, у активного - ещё и рамки вокруг него
+    def contentRect(self) -> QRectF:
+        if self.active or self.drawing:
+            return self.boundingRect()
+        return self.textProxy.geometry()
+
+    # Отрисовка слоя вне сцены (при экспорте). Поле ввода - отдельный элемент сцены, поэтому рисуется отдельно
+    def render(self, painter: QPainter, rect=None) -> None:
+        super().render(painter, rect)
+        self.textEdit.render(painter, self.textProxy.pos().toPoint())
+
     # Обработчик нажатия кнопки мыши. Если нажатие поступило в обработку, значит, оно было сделано вне self.textEdit,
     # а значит, если слой активен, то пользователь пытается перенаначить прямоугольник, в котором плашка с текстом
-    # лежит. Тогда сохраняется первая точка нажатия пользователя. Если слой неактивен, то нажатие сообщается активному
+    # лежит. Тогда сохраняется первая точка нажатия пользователя. События мыши слою доставляет Window.inputRouter,
+    # и только когда слой активен
     def mousePressEvent(self, event: QMouseEvent) -> None:
         if self.active:
             self.drawing = True
             self.lastMousePos = event.pos()
             self.curMousePos = event.pos()
+            self.commitText()
+            self.stateBeforeDrawing = self.saveState()
 
-            self.gridLines = [self.parent.scene.items()[1].widget().hLines,
-                              self.parent.scene.items()[1].widget().vLines]
-        elif self.parent.currentLayer != -1:
-            self.parent.scene.items()[self.parent.currentLayer].widget().mousePressEvent(event)
+            self.gridIndex = self.parent.registry.grid().index
 
-    # Обработчик движения мыши. Если слой неактивен, то движение сообщается активному слою. Иначе, если пользователь
-    # перезадаёт ограничивающий прямоугольник плашки с текстом, обновляется вторая задающая точка прямоугольника,
-    # который пользователь рисует (из которого потом программа вычислит ограничивающий прямоугольник)
+    # Обработчик движения мыши. Если пользователь перезадаёт ограничивающий прямоугольник плашки с текстом, обновляется
+    # вторая задающая точка прямоугольника, который пользователь рисует (из которого потом программа вычислит
+    # ограничивающий прямоугольник)
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
         if self.active and self.drawing:
             self.curMousePos = event.pos()
 
-            self.repaint()
-        elif not self.active and self.parent.currentLayer != -1:
-            self.parent.scene.items()[self.parent.currentLayer].widget().mouseMoveEvent(event)
+            self.update()
 
-    # Обработчик отпускания кнопки мыши. Если слой неактивен, то отпускание сообщается активному слою. Иначе, если
-    # пользователь рисовал, рисование прекращается, и на основе нарисованного пользователем прямоугольника вычисляется
-    # ограничительный прямоугольник для плашки с текстом. Позиция плашки подгоняется под новый прямоугольник
+    # Обработчик отпускания кнопки мыши. Если пользователь рисовал, рисование прекращается, и на основе нарисованного
+    # пользователем прямоугольника вычисляется ограничительный прямоугольник для плашки с текстом. Позиция плашки
+    # подгоняется под новый прямоугольник, а его изменение добавляется в историю изменений окна
     def mouseReleaseEvent(self, event: QMouseEvent) -> None:
         if self.active and self.drawing:
             self.drawing = False
@@ -196,16 +191,43 @@ class TextLayer(QWidget):
             x1, y1, x2, y2 = max(x1, 1), max(y1, 1), \
                              min(x2, self.resolution[0] - 1), min(y2, self.resolution[1] - 1)
 
-            leftGridLine, rightGridLine, topGridLine, bottomGridLine = self.findBoundaryGridLines(x1, y1, x2, y2)
+            leftGridLine, rightGridLine, topGridLine, bottomGridLine = self.gridIndex.cell(x1, y1, x2, y2)
 
-            self.leftBorder = self.gridLines[1][leftGridLine]
-            self.rightBorder = self.gridLines[1][rightGridLine]
-            self.topBorder = self.gridLines[0][topGridLine]
-            self.bottomBorder = self.gridLines[0][bottomGridLine]
+            self.leftBorder = self.gridIndex.lines[1][leftGridLine]
+            self.rightBorder = self.gridIndex.lines[1][rightGridLine]
+            self.topBorder = self.gridIndex.lines[0][topGridLine]
+            self.bottomBorder = self.gridIndex.lines[0][bottomGridLine]
 
             self.updateTextEdit()
-        elif not self.active and self.parent.currentLayer != -1:
-            self.parent.scene.items()[self.parent.currentLayer].widget().mouseMoveEvent(event)
+            self.parent.history.pushState(self, self.stateBeforeDrawing)
+
+    # Состояние слоя, отслеживаемое историей изменений (см. history.py): текст в формате HTML и ограничивающий
+    # прямоугольник. Форматирование символов хранится в самом HTML
+    def saveState(self) -> dict:
+        return {'text': self.textEdit.toHtml(), 'leftBorder': self.leftBorder, 'rightBorder': self.rightBorder,
+                'topBorder': self.topBorder, 'bottomBorder': self.bottomBorder}
+
+    # Восстановление части состояния слоя (при отмене и возврате действий, а также при открытии проекта), ключи - как в
+    # self.saveState. Восстановленный текст считается уже добавленным в историю
+    def restoreState(self, state: dict) -> None:
+        for key, value in state.items():
+            if key == 'text':
+                self.textEdit.setHtml(value)
+                self.committedText = self.textEdit.toHtml()
+                self.textCommitTimer.stop()
+            else:
+                setattr(self, key, value)
+
+        self.updateTextEdit()
+
+    # Добавление изменений текста, сделанных с прошлого вызова, в историю изменений окна. Слот сигнала
+    # self.textCommitTimer.timeout, также вызывается перед изменением ограничивающего прямоугольника
+    def commitText(self) -> None:
+        self.textCommitTimer.stop()
+        before = self.saveState()
+        before['text'] = self.committedText
+        self.committedText = self.textEdit.toHtml()
+        self.parent.history.pushState(self, before)
 
     # Обновление атрибута self.previousZValue при активации слоя для последующего восстановления z из него при
     # последующей деактивации
@@ -231,7 +253,7 @@ class TextLayer(QWidget):
         self.textEdit.setAlignment(alignment)
 
     # Обновление атрибутов слоя изнутри после перемещения курсора для последующего обновления панели инструментов
-    @pyqtSlot()
+    # (панель обновляется, только если слой выделен: курсор двигается и при восстановлении текста из файла или истории)
     def updateFromNewCursorPosition(self):
         self.color = self.textEdit.textColor()
         self.font = self.textEdit.font().key()
@@ -241,7 +263,8 @@ class TextLayer(QWidget):
         self.underline = self.textEdit.fontUnderline()
         self.alignment = self.textEdit.alignment()
 
-        self.parent.updateTextToolbarState()
+        if self.active:
+            self.parent.updateTextToolbarState()
 
     # Обновление координат self.textEdit после повторного задания пользователем ограничивающего прямоугольника
     def updateTextEdit(self):
@@ -249,15 +272,13 @@ class TextLayer(QWidget):
         x2 = self.gridLineToOffset(1, *self.rightBorder)
         y1 = self.gridLineToOffset(0, *self.topBorder)
         y2 = self.gridLineToOffset(0, *self.bottomBorder)
-        self.textEdit.setGeometry(x1, y1, x2 - x1, y2 - y1)
+        self.textProxy.setGeometry(QRectF(x1, y1, x2 - x1, y2 - y1))
         self.textEdit.show()
-        self.repaint()
+        self.update()
 
     # Задание нового разрешения. Вызывается родительским классом Window при изменении разрешения проекта
     # параметр stretch ничего не задаёт, так как плашка с текстом должна подгоняться под обновлённую сетку
     def setResolution(self, width, height, stretch):
-        self.setMinimumSize(width, height)
-        self.setMaximumSize(width, height)
-        self.resolution = width, height
+        self.resize(width, height)
         self.updateTextEdit()
-        self.repaint()
+        self.update()
@@ -0,0 +1,346 @@
+import zlib
+import numpy as np
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtCore import QRect, QPoint
+from floodFill import similarColors, spanFill
+from imageBuffer import imageArray
+from resampling import LANCZOS_SUPPORT, lanczosResample
+
+
+# Сторона квадратной плитки в точках
+TILE_SIZE = 256
+
+
+# Сжатие плитки для хранения в истории. Возвращает сжатые байты точек плитки или None для несозданной (пустой) плитки
+def compressTile(tile) -> bytes:
+    if tile is None:
+        return None
+    return zlib.compress(tile.constBits().asstring(tile.sizeInBytes()), 1)
+
+
+# Восстановление плитки, сжатой функцией compressTile
+def decompressTile(data: bytes) -> QImage:
+    return QImage(zlib.decompress(data), TILE_SIZE, TILE_SIZE, QImage.Format_ARGB32_Premultiplied).copy()
+
+
+# Класс плиточного хранилища растрового слоя. Вместо одного QImage размером с холст содержимое слоя хранится в
+# квадратных плитках TILE_SIZE x TILE_SIZE (QImage формата Format_ARGB32_Premultiplied), которые создаются только при
+# первой записи в них. Все ещё не тронутые плитки прозрачны и при чтении заменяются одной общей пустой плиткой
+# self.emptyTile, поэтому память, занимаемая слоем, растёт с закрашенной площадью, а не с площадью холста.
+# Плитки, выходящие за правый и нижний края холста, имеют полный размер, но точки за краем холста не рисуются и не
+# учитываются заливкой.
+# Атрибуты:
+# - self.width - int, ширина холста в точках
+# - self.height - int, высота холста в точках
+# - self.tiles - dict(tuple(int, int), QImage), созданные плитки. Ключ - (номер столбца, номер строки) плитки
+# - self.emptyTile - QImage, общая для всех слоёв прозрачная плитка. Используется только для чтения
+# - self.changes - dict(tuple(int, int), bytes) или None, сжатые состояния плиток до начала текущего действия (см.
+# - - self.beginChange). Плитка попадает сюда при первой записи в неё за действие. None - изменения не отслеживаются
+class TiledBitmap:
+    emptyTile = None
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        self.tiles = dict()
+        self.changes = None
+
+        if TiledBitmap.emptyTile is None:
+            TiledBitmap.emptyTile = QImage(TILE_SIZE, TILE_SIZE, QImage.Format_ARGB32_Premultiplied)
+            TiledBitmap.emptyTile.fill(0)
+
+    # Создание хранилища из обычного QImage (например, при открытии старых файлов проекта). Полностью прозрачные
+    # области картинки плиток не создают
+    @staticmethod
+    def fromImage(image: QImage) -> 'TiledBitmap':
+        bitmap = TiledBitmap(image.width(), image.height())
+        image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+        pixels = imageArray(image)
+
+        for key in bitmap.tileKeys(bitmap.rect()):
+            rect = bitmap.tileRect(*key).intersected(bitmap.rect())
+            if not pixels[rect.top():rect.bottom() + 1, rect.left():rect.right() + 1].any():
+                continue
+
+            qp = QPainter(bitmap.writableTile(*key))
+            qp.setCompositionMode(QPainter.CompositionMode_Source)
+            qp.drawImage(rect.topLeft() - bitmap.tileRect(*key).topLeft(), image, rect)
+            qp.end()
+
+        return bitmap
+
+    # Запись картинки image в хранилище так, что её левый верхний угол оказывается в точке (x, y) холста. Используется
+    # при открытии проекта: если картинка - ровно одна плитка, она становится плиткой без копирования
+    def setTile(self, x: int, y: int, image: QImage) -> None:
+        image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+        if x % TILE_SIZE == 0 and y % TILE_SIZE == 0 and image.width() == image.height() == TILE_SIZE:
+            self.tiles[(x // TILE_SIZE, y // TILE_SIZE)] = image
+            return
+
+        def draw(qp: QPainter) -> None:
+            qp.setCompositionMode(QPainter.CompositionMode_Source)
+            qp.drawImage(x, y, image)
+
+        self.paint(QRect(x, y, image.width(), image.height()), draw)
+
+    # Прямоугольник всего холста
+    def rect(self) -> QRect:
+        return QRect(0, 0, self.width, self.height)
+
+    # Прямоугольник плитки с ключом (tx, ty) в координатах холста
+    def tileRect(self, tx: int, ty: int) -> QRect:
+        return QRect(tx * TILE_SIZE, ty * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+
+    # Ключи всех плиток (в т.ч. не созданных), пересекающихся с прямоугольником rect, в пределах холста
+    def tileKeys(self, rect: QRect) -> list:
+        rect = rect.intersected(self.rect())
+        if rect.isEmpty():
+            return []
+
+        return [(tx, ty)
+                for ty in range(rect.top() // TILE_SIZE, rect.bottom() // TILE_SIZE + 1)
+                for tx in range(rect.left() // TILE_SIZE, rect.right() // TILE_SIZE + 1)]
+
+    # Плитка для чтения. Для не созданной плитки возвращается общая пустая плитка, изменять которую нельзя
+    def tile(self, tx: int, ty: int) -> QImage:
+        return self.tiles.get((tx, ty), self.emptyTile)
+
+    # Плитка для записи. Создаётся (прозрачной) при первом обращении. Если идёт отслеживание изменений, перед первой
+    # записью за действие запоминается сжатое состояние плитки
+    def writableTile(self, tx: int, ty: int) -> QImage:
+        if self.changes is not None and (tx, ty) not in self.changes:
+            self.changes[(tx, ty)] = compressTile(self.tiles.get((tx, ty)))
+
+        if (tx, ty) not in self.tiles:
+            tile = QImage(TILE_SIZE, TILE_SIZE, QImage.Format_ARGB32_Premultiplied)
+            tile.fill(0)
+            self.tiles[(tx, ty)] = tile
+
+        return self.tiles[(tx, ty)]
+
+    # Начало действия (мазка кистью, заливки, ...), изменения которого нужно запомнить для отмены
+    def beginChange(self) -> None:
+        self.changes = dict()
+
+    # Окончание действия. Возвращает tuple(dict, dict) - сжатые состояния затронутых плиток до и после действия
+    # (см. history.TileChange) - или None, если действие ничего не изменило. Плитки, в которые писали, но не
+    # изменили (например, ластиком по пустому месту), в результат не попадают
+    def endChange(self):
+        changes, self.changes = self.changes, None
+        if not changes:
+            return None
+
+        before, after = dict(), dict()
+        for key, data in changes.items():
+            newData = compressTile(self.tiles.get(key))
+            if newData != data:
+                before[key], after[key] = data, newData
+
+        return (before, after) if before else None
+
+    # NumPy-представление части плитки, лежащей в пределах холста (без копирования, см. imageBuffer.imageArray).
+    # Для чтения нужно передавать writable=False: доступ на запись меняет QImage.cacheKey() плитки (см.
+    # projectFile.BlobCache)
+    def tileArray(self, tx: int, ty: int, tile: QImage, writable=True) -> np.ndarray:
+        return imageArray(tile, writable)[:min(TILE_SIZE, self.height - ty * TILE_SIZE),
+                                :min(TILE_SIZE, self.width - tx * TILE_SIZE)]
+
+    # Цвет точки (x, y) в формате с предумноженной альфой
+    def pixel(self, x: int, y: int) -> int:
+        return self.tile(x // TILE_SIZE, y // TILE_SIZE).pixel(x % TILE_SIZE, y % TILE_SIZE)
+
+    # Рисование на плитках, пересекающихся с rect. Функция draw вызывается для каждой такой плитки с QPainter, уже
+    # сдвинутым так, что рисовать можно в координатах холста. Если allocate ложно, рисование идёт только по уже
+    # созданным плиткам (так работает ластик: стирать с пустых плиток нечего)
+    def paint(self, rect: QRect, draw, allocate=True) -> None:
+        for tx, ty in self.tileKeys(rect):
+            if not allocate and (tx, ty) not in self.tiles:
+                continue
+
+            qp = self.tilePainter(tx, ty)
+            draw(qp)
+            qp.end()
+
+    # QPainter для рисования на плитке (tx, ty) в координатах холста: сдвинут на положение плитки и ограничен её частью
+    # в пределах холста. Плитка создаётся при необходимости. Закрывать painter (qp.end()) должен вызывающий
+    def tilePainter(self, tx: int, ty: int) -> QPainter:
+        qp = QPainter(self.writableTile(tx, ty))
+        qp.translate(-tx * TILE_SIZE, -ty * TILE_SIZE)
+        qp.setClipRect(self.tileRect(tx, ty).intersected(self.rect()))
+        return qp
+
+    # Отрисовка области rect хранилища на QPainter (координаты painter - координаты холста). Рисуются только созданные
+    # плитки, пересекающиеся с rect, и только их части внутри rect
+    def draw(self, painter: QPainter, rect: QRect) -> None:
+        for key in self.tileKeys(rect):
+            if key not in self.tiles:
+                continue
+
+            target = self.tileRect(*key).intersected(rect)
+            painter.drawImage(target, self.tiles[key], target.translated(-self.tileRect(*key).topLeft()))
+
+    # Строка холста y целиком в виде массива np.uint32 (копия, собранная из плиток)
+    def readRow(self, y: int) -> np.ndarray:
+        row = np.zeros(self.width, dtype=np.uint32)
+        ty = y // TILE_SIZE
+        for tx in range((self.width - 1) // TILE_SIZE + 1):
+            if (tx, ty) in self.tiles:
+                tileRow = self.tileArray(tx, ty, self.tiles[(tx, ty)], writable=False)[y % TILE_SIZE]
+                row[tx * TILE_SIZE:tx * TILE_SIZE + tileRow.size] = tileRow
+
+        return row
+
+    # Запись отрезка [x1, x2] строки y цветом color. Отрезок разбивается по плиткам, плитки создаются по необходимости
+    def writeSpan(self, y: int, x1: int, x2: int, color: int) -> None:
+        ty = y // TILE_SIZE
+        for tx in range(x1 // TILE_SIZE, x2 // TILE_SIZE + 1):
+            left = max(x1, tx * TILE_SIZE) - tx * TILE_SIZE
+            right = min(x2, tx * TILE_SIZE + TILE_SIZE - 1) - tx * TILE_SIZE
+            imageArray(self.writableTile(tx, ty))[y % TILE_SIZE, left:right + 1] = color
+
+    # Заливка связной области с допуском (см. floodFill.spanFill). Строки читаются и записываются по плиткам.
+    # Возвращает ограничивающий прямоугольник залитой области (x1, y1, x2, y2) включительно или None
+    def fill(self, x: int, y: int, color: int, tolerance: int):
+        return spanFill(self.readRow, self.writeSpan, self.width, self.height, x, y, color, tolerance)
+
+    # Замена цвета по всему холсту (несмежная заливка): все точки, близкие с допуском tolerance к цвету точки (x, y),
+    # перекрашиваются в color векторизованно, отдельно для каждой плитки.
+    # Маска считается по плитке, открытой только для чтения: плитки, в которых менять нечего, не записываются (и не
+    # попадают в историю). Пустые плитки создаются, только если прозрачный цвет попадает в допуск, а новый цвет - не
+    # прозрачный: такие плитки заливаются целиком. Возвращает ограничивающий прямоугольник изменённой области
+    # (x1, y1, x2, y2) включительно или None
+    def replaceColor(self, x: int, y: int, color: int, tolerance: int):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+
+        oldColor = self.pixel(x, y)
+        replaceEmpty = color != 0 and bool(similarColors(np.array([0], dtype=np.uint32), oldColor, tolerance)[0])
+        bounds = QRect()
+
+        for key in self.tileKeys(self.rect()):
+            if key not in self.tiles:
+                if replaceEmpty:
+                    self.tileArray(*key, self.writableTile(*key))[...] = color
+                    bounds = bounds.united(self.tileRect(*key).intersected(self.rect()))
+                continue
+
+            pixels = self.tileArray(*key, self.tiles[key], writable=False)
+            mask = similarColors(pixels, oldColor, tolerance) & (pixels != color)
+            rows, columns = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+            if not rows.size:
+                continue
+
+            self.tileArray(*key, self.writableTile(*key))[mask] = color
+            origin = self.tileRect(*key).topLeft()
+            bounds = bounds.united(QRect(origin + QPoint(int(columns[0]), int(rows[0])),
+                                         origin + QPoint(int(columns[-1]), int(rows[-1]))))
+
+        if bounds.isEmpty():
+            return None
+        return bounds.left(), bounds.top(), bounds.right(), bounds.bottom()
+
+    # Копия области (x, y, width, height) холста в виде массива np.uint32 формы (height, width), собранная из плиток.
+    # Плитки читаются без изменения (см. imageBuffer.imageArray), поэтому метод можно вызывать из нескольких потоков
+    def readRegion(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        rect = QRect(x, y, width, height)
+        region = np.zeros((height, width), dtype=np.uint32)
+        for key in self.tileKeys(rect):
+            if key not in self.tiles:
+                continue
+
+            part = self.tileRect(*key).intersected(rect)
+            origin = self.tileRect(*key).topLeft()
+            region[part.top() - y:part.bottom() + 1 - y, part.left() - x:part.right() + 1 - x] = \
+                imageArray(self.tiles[key], writable=False)[part.top() - origin.y():part.bottom() + 1 - origin.y(),
+                                                            part.left() - origin.x():part.right() + 1 - origin.x()]
+
+        return region
+
+    # Снимок хранилища: новое хранилище с неглубокими копиями плиток, данные которых разделяются с плитками хранилища
+    # до первой записи в них. Запись в хранилище снимок не меняет, поэтому из снимка можно читать в других потоках
+    def snapshot(self) -> 'TiledBitmap':
+        bitmap = TiledBitmap(self.width, self.height)
+        bitmap.tiles = {key: QImage(tile) for key, tile in self.tiles.items()}
+        return bitmap
+
+    # Новое хранилище другого размера (см. resizeTasks), построенное в текущем потоке
+    def resized(self, width: int, height: int, stretch: bool, quality='smth') -> 'TiledBitmap':
+        bitmap, tasks = self.resizeTasks(width, height, stretch, quality)
+        for key, task in tasks:
+            tile = task()
+            if tile is not None:
+                bitmap.tiles[key] = tile
+
+        return bitmap
+
+    # Подготовка изменения размера. Возвращает новое пустое хранилище размера width x height и список задач
+    # list(tuple(tuple(int, int), функция)): каждая функция без аргументов строит плитку нового хранилища с данным
+    # ключом и возвращает QImage или None (плитка пуста). Задачи не изменяют ни старое, ни новое хранилище, поэтому
+    # их можно выполнять параллельно в разных потоках (см. resampling.ResizeJob), а результат записывать в
+    # bitmap.tiles по мере готовности. Старые плитки задачи читают из снимка (см. self.snapshot), поэтому хранилище
+    # можно изменять, пока задачи ещё выполняются (например, после отмены ResizeJob, которая их не дожидается).
+    # Если stretch истинно, содержимое растягивается/сжимается под новый размер способом quality (см.
+    # resampling.RESIZE_QUALITIES): каждая новая плитка строится отдельно по тем старым плиткам, которые на неё
+    # отображаются. Иначе холст кадрируется: плитки за пределами нового холста отбрасываются, целиком попадающие в
+    # него переиспользуются без копирования, а у пересекающих новый край копируется и очищается часть за краем
+    # (чтобы старые точки не появились при последующем увеличении холста)
+    def resizeTasks(self, width: int, height: int, stretch: bool, quality='smth') -> tuple:
+        bitmap = TiledBitmap(width, height)
+        tasks = []
+
+        source = self.snapshot()
+
+        if not stretch:
+            for key, tile in source.tiles.items():
+                visible = bitmap.tileRect(*key).intersected(bitmap.rect())
+                if visible == bitmap.tileRect(*key):
+                    bitmap.tiles[key] = self.tiles[key]
+                elif not visible.isEmpty():
+                    tasks.append((key, lambda tile=tile, visible=visible: self.croppedTile(tile, visible.size())))
+
+            return bitmap, tasks
+
+        for key in bitmap.tileKeys(bitmap.rect()):
+            tasks.append((key, lambda key=key: source.scaledTile(bitmap, key, quality)))
+
+        return bitmap, tasks
+
+    # Копия плитки tile, в которой оставлен только левый верхний угол размера size, а остальное очищено
+    @staticmethod
+    def croppedTile(tile: QImage, size) -> QImage:
+        tile = tile.copy()
+        pixels = imageArray(tile)
+        pixels[size.height():, :] = 0
+        pixels[:, size.width():] = 0
+        return tile
+
+    # Плитка key хранилища bitmap (нового размера), построенная масштабированием этого хранилища способом quality.
+    # Возвращает None, если на плитку не отображается ни одна созданная плитка этого хранилища
+    def scaledTile(self, bitmap: 'TiledBitmap', key: tuple, quality: str):
+        xScale, yScale = bitmap.width / self.width, bitmap.height / self.height
+        target = bitmap.tileRect(*key).intersected(bitmap.rect())
+        margin = 1 if quality != 'lncz' else int(LANCZOS_SUPPORT / min(1.0, xScale, yScale)) + 1
+        source = QRect(QPoint(int(target.left() / xScale) - margin, int(target.top() / yScale) - margin),
+                       QPoint(int((target.right() + 1) / xScale) + margin,
+                              int((target.bottom() + 1) / yScale) + margin))
+        if not any(sourceKey in self.tiles for sourceKey in self.tileKeys(source)):
+            return None
+
+        tile = QImage(TILE_SIZE, TILE_SIZE, QImage.Format_ARGB32_Premultiplied)
+        tile.fill(0)
+
+        if quality == 'lncz':
+            imageArray(tile)[:target.height(), :target.width()] = \
+                lanczosResample(self.readRegion, target.left(), target.top(), target.width(), target.height(),
+                                xScale, yScale, self.width, self.height)
+            return tile
+
+        qp = QPainter(tile)
+        qp.translate(-key[0] * TILE_SIZE, -key[1] * TILE_SIZE)
+        qp.setClipRect(target)
+        if quality == 'smth':
+            qp.setRenderHint(QPainter.SmoothPixmapTransform)
+        qp.scale(xScale, yScale)
+        self.draw(qp, source)
+        qp.end()
+        return tile
@@ -0,0 +1,14 @@
+import os
+import sys
+import pytest
+from PyQt5.QtWidgets import QApplication
+
+# Модули клиента импортируются так же, как при запуске из client/src. Окна не показываются
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+
+# Приложение Qt, без которого нельзя создавать виджеты (поле ввода текстового слоя)
+@pytest.fixture(scope='session')
+def application():
+    return QApplication.instance() or QApplication(['tests'])
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from PyQt5.QtGui import QImage, QPainter
+from compositor import LayerSource, composite
+from imageBuffer import imageArray
+from projectFile import buildLayer
+from tiledBitmap import TILE_SIZE
+
+
+WIDTH, HEIGHT = 3 * TILE_SIZE + 50, 2 * TILE_SIZE + 30
+
+
+# Слои проекта снизу вверх: растровый с мазками в разных плитках, полупрозрачная фигура, текст и фигура у края холста
+@pytest.fixture
+def layers(application):
+    bitmap = buildLayer({'type': 'bmp', 'tiles': []}, WIDTH, HEIGHT)
+    for y in range(40, 300):
+        bitmap.bitmap.writeSpan(y, 100 + y, 400 + y, 0xFF20A040)
+
+    shape = {'type': 'shp', 'shape': 'oval', 'xOffset': 0, 'yOffset': 0, 'width': 6,
+             'lineColor': [255, 0, 0, 255], 'fillColor': [0, 0, 255, 128],
+             'firstVBorder': [0, 300], 'secondVBorder': [0, 520], 'firstHBorder': [0, 280], 'secondHBorder': [0, 400]}
+    text = {'type': 'txt', 'text': '<p style="font-size:40px">Сведение</p>',
+            'leftBorder': [0, 20], 'rightBorder': [0, 300], 'topBorder': [0, 30], 'bottomBorder': [0, 140]}
+    corner = dict(shape, shape='rect', fillColor=[255, 255, 0, 255],
+                  firstVBorder=[0, WIDTH - 40], secondVBorder=[0, WIDTH], firstHBorder=[0, HEIGHT - 20],
+                  secondHBorder=[0, HEIGHT])
+    return [bitmap] + [buildLayer(layer, WIDTH, HEIGHT) for layer in (shape, text, corner)]
+
+
+# Сведение последовательной отрисовкой каждого слоя целиком (как до сведения по плиткам). Возвращается копия точек:
+# представление imageArray действительно, только пока жива картинка
+def renderSerial(layers: list) -> np.ndarray:
+    image = QImage(WIDTH, HEIGHT, QImage.Format_ARGB32_Premultiplied)
+    image.fill(0)
+    qp = QPainter(image)
+    for layer in layers:
+        layer.render(qp)
+    qp.end()
+    return imageArray(image, writable=False).view(np.uint8).astype(np.int16)
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_compositeMatchesSerialRender(layers, workers):
+    expected = renderSerial(layers)
+    image = composite(layers, WIDTH, HEIGHT, workers)
+    result = imageArray(image, writable=False).view(np.uint8)
+
+    # Наложение по плиткам округляет иначе, чем QPainter, - не больше чем на единицу в канале
+    assert np.abs(result.astype(np.int16) - expected).max() <= 1
+    assert (result != 0).any()
+
+
+def test_sourceCoversOnlyContentTiles(layers):
+    shape = LayerSource(layers[1], WIDTH, HEIGHT)
+    corner = LayerSource(layers[3], WIDTH, HEIGHT)
+
+    assert (shape.rect.x(), shape.rect.y(), shape.rect.width(), shape.rect.height()) == \
+        (TILE_SIZE, TILE_SIZE, 2 * TILE_SIZE, TILE_SIZE)
+    assert shape.tile(0, 0, TILE_SIZE, TILE_SIZE) is None
+    assert shape.tile(1, 1, TILE_SIZE, TILE_SIZE).shape == (TILE_SIZE, TILE_SIZE, 4)
+    assert corner.pixels.shape == (HEIGHT - 2 * TILE_SIZE, WIDTH - 3 * TILE_SIZE, 4)
+    assert corner.tile(3, 2, WIDTH - 3 * TILE_SIZE, HEIGHT - 2 * TILE_SIZE) is not None
+
+
+def test_emptyLayerHasNoImage(application):
+    empty = buildLayer({'type': 'shp', 'shape': 'none', 'xOffset': 0, 'yOffset': 0, 'width': 1,
+                        'lineColor': [0, 0, 0, 255], 'fillColor': [0, 0, 0, 0], 'firstVBorder': [1, 0],
+                        'secondVBorder': [1, 100], 'firstHBorder': [1, 0], 'secondHBorder': [1, 100]}, WIDTH, HEIGHT)
+    source = LayerSource(empty, WIDTH, HEIGHT)
+
+    assert source.image is None
+    assert source.tile(0, 0, TILE_SIZE, TILE_SIZE) is None
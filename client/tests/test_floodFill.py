@@ -0,0 +1,104 @@
+import numpy as np
+from floodFill import spanFill
+from tiledBitmap import TiledBitmap, TILE_SIZE
+
+
+RED = 0xFFFF0000
+BLUE = 0xFF0000FF
+
+
+# Заливка массива pixels через spanFill (без виджетов и плиток)
+def fillArray(pixels: np.ndarray, x: int, y: int, color: int, tolerance=0):
+    def writeSpan(row: int, x1: int, x2: int, value: int) -> None:
+        pixels[row, x1:x2 + 1] = value
+
+    return spanFill(lambda row: pixels[row].copy(), writeSpan, pixels.shape[1], pixels.shape[0], x, y, color,
+                    tolerance)
+
+
+def test_fillStopsAtWalls():
+    pixels = np.zeros((5, 7), dtype=np.uint32)
+    pixels[:, 3] = BLUE
+
+    assert fillArray(pixels, 0, 0, RED) == (0, 0, 2, 4)
+    assert (pixels[:, :3] == RED).all()
+    assert (pixels[:, 3] == BLUE).all()
+    assert (pixels[:, 4:] == 0).all()
+
+
+def test_fillConnectsBySidesOnly():
+    pixels = np.full((4, 4), BLUE, dtype=np.uint32)
+    pixels[0, 0] = pixels[1, 1] = 0
+
+    assert fillArray(pixels, 0, 0, RED) == (0, 0, 0, 0)
+    assert pixels[1, 1] == 0
+
+
+def test_fillFollowsWindingRegion():
+    # Змейка: область связна только через чередующиеся проходы у левого и правого краёв
+    pixels = np.zeros((7, 6), dtype=np.uint32)
+    pixels[1, :5] = pixels[3, 1:] = pixels[5, :5] = BLUE
+
+    fillArray(pixels, 0, 0, RED)
+    assert ((pixels == RED) | (pixels == BLUE)).all()
+
+
+def test_fillTolerance():
+    pixels = np.array([[0xFF101010, 0xFF141414, 0xFF1A1A1A, 0xFF101010]], dtype=np.uint32)
+
+    assert fillArray(pixels.copy(), 0, 0, RED, tolerance=0) == (0, 0, 0, 0)
+    near = pixels.copy()
+    assert fillArray(near, 0, 0, RED, tolerance=4) == (0, 0, 1, 0)
+    assert list(near[0]) == [RED, RED, 0xFF1A1A1A, 0xFF101010]
+    far = pixels.copy()
+    assert fillArray(far, 0, 0, RED, tolerance=10) == (0, 0, 3, 0)
+
+
+def test_fillSameColorOrOutside():
+    pixels = np.full((3, 3), RED, dtype=np.uint32)
+
+    assert fillArray(pixels, 1, 1, RED) is None
+    assert fillArray(pixels, -1, 0, BLUE) is None
+    assert fillArray(pixels, 0, 3, BLUE) is None
+    assert (pixels == RED).all()
+
+
+def test_fillMatchesPixelByPixelSearch():
+    # Случайные области с шириной строки, не кратной и кратной 8: границы отрезков ищутся по упакованным битам
+    rng = np.random.default_rng(7)
+    for width in (13, 16, 61):
+        pixels = np.where(rng.random((40, width)) < 0.4, BLUE, 0).astype(np.uint32)
+        pixels[0, 0] = 0
+        expected = np.zeros(pixels.shape, dtype=bool)
+        stack = [(0, 0)]
+        while stack:
+            x, y = stack.pop()
+            if 0 <= x < width and 0 <= y < pixels.shape[0] and not expected[y, x] and pixels[y, x] == 0:
+                expected[y, x] = True
+                stack.extend(((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)))
+
+        fillArray(pixels, 0, 0, RED)
+        assert ((pixels == RED) == expected).all()
+
+
+def test_tiledFillCrossesTileBorders():
+    width, height = TILE_SIZE * 2 + 10, TILE_SIZE + 20
+    bitmap = TiledBitmap(width, height)
+    # Вертикальная стена в первой плитке: слева от неё заливка не проходит
+    for y in range(height):
+        bitmap.writeSpan(y, 5, 5, BLUE)
+
+    assert bitmap.fill(width - 1, height - 1, RED, 0) == (6, 0, width - 1, height - 1)
+    assert set(bitmap.tiles) == {(tx, ty) for tx in range(3) for ty in range(2)}
+    assert bitmap.pixel(4, 0) == 0
+    assert bitmap.pixel(6, 0) == RED
+    assert bitmap.pixel(TILE_SIZE, TILE_SIZE) == RED
+    assert (bitmap.readRegion(6, 0, width - 6, height) == RED).all()
+
+
+def test_tiledFillOutsideCanvasAllocatesNothing():
+    bitmap = TiledBitmap(TILE_SIZE + 1, TILE_SIZE + 1)
+
+    assert bitmap.fill(TILE_SIZE + 1, 0, RED, 0) is None
+    assert bitmap.fill(0, -1, RED, 0) is None
+    assert bitmap.tiles == dict()
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+from PyQt5.QtCore import QEvent, QPointF, Qt
+from PyQt5.QtTest import QTest
+from inputRouter import InputRouter
+
+
+# Слой, записывающий доставленные ему события
+class RecordingLayer:
+    def __init__(self) -> None:
+        self.events = []
+
+    def mapFromScene(self, pos: QPointF) -> QPointF:
+        return pos
+
+    def mousePressEvent(self, event) -> None:
+        self.events.append(('press', event.pos().x()))
+
+    def mouseMoveEvent(self, event) -> None:
+        self.events.append(('move', event.pos().x()))
+
+    def mouseReleaseEvent(self, event) -> None:
+        self.events.append(('release', event.pos().x()))
+
+
+# Событие мыши сцены с теми методами, которые читает InputRouter.eventFilter (QGraphicsSceneMouseEvent из PyQt5
+# создать нельзя)
+class SceneEvent:
+    def __init__(self, kind, x) -> None:
+        self.kind = kind
+        self.x = x
+
+    def type(self):
+        return self.kind
+
+    def scenePos(self) -> QPointF:
+        return QPointF(self.x, 10)
+
+    def button(self):
+        return Qt.NoButton if self.kind == QEvent.GraphicsSceneMouseMove else Qt.LeftButton
+
+    def buttons(self):
+        return Qt.NoButton if self.kind == QEvent.GraphicsSceneMouseRelease else Qt.LeftButton
+
+    def modifiers(self):
+        return Qt.NoModifier
+
+
+def test_routerCounters(application):
+    layer = RecordingLayer()
+    router = InputRouter(None)
+    router.parent = SimpleNamespace(activeLayer=lambda: layer)
+
+    assert router.eventFilter(None, SceneEvent(QEvent.GraphicsSceneMousePress, 0))
+    for x in range(1, 6):
+        assert router.eventFilter(None, SceneEvent(QEvent.GraphicsSceneMouseMove, x))
+    QTest.qWait(10)
+
+    assert layer.events == [('press', 0), ('move', 5)]
+    assert router.counters() == {'dispatched': 2, 'dropped': 4}
+
+    router.eventFilter(None, SceneEvent(QEvent.GraphicsSceneMouseMove, 7))
+    router.eventFilter(None, SceneEvent(QEvent.GraphicsSceneMouseMove, 8))
+    router.eventFilter(None, SceneEvent(QEvent.GraphicsSceneMouseRelease, 9))
+
+    assert layer.events[2:] == [('move', 8), ('release', 9)]
+    assert router.counters() == {'dispatched': 4, 'dropped': 5}
+
+    router.eventFilter(None, SceneEvent(QEvent.GraphicsSceneMouseMove, 10))
+    router.reset()
+    assert router.counters() == {'dispatched': 0, 'dropped': 0} and router.pendingMove is None
@@ -0,0 +1,33 @@
+import base64
+import json
+import projectFile
+from projectFile import embedBlobs, readLegacyProject
+
+
+FIRST = b'\x89PNG' + bytes(range(256)) * 3
+SECOND = b'second'
+
+
+def writeLegacyProject(path, chunk, monkeypatch):
+    monkeypatch.setattr(projectFile, 'STREAM_CHUNK', chunk)
+    manifest = {'name': 'Проект', 'layers': [
+        {'type': 'txt', 'html': '<p>Привет, мир \U0001F600</p>\r\n'},
+        {'type': 'img', 'data': base64.b64encode(FIRST).decode(), 'name': 'картинка'},
+        {'type': 'bmp', 'name': 'холст', 'tiles': [
+            {'x': 0, 'y': 0, 'data': base64.b64encode(SECOND).decode()},
+            {'x': 256, 'y': 0, 'data': base64.b64encode(FIRST).decode()}]}]}
+    text = json.dumps(manifest, ensure_ascii=False, indent=1).replace('\n', '\r\n')
+    path.write_text(text, encoding='utf-8', newline='')
+    return manifest
+
+
+def test_legacyBlobOffsets(tmp_path, monkeypatch):
+    for chunk in (7, 1 << 20):
+        path = tmp_path / f'project{chunk}.gri'
+        expected = writeLegacyProject(path, chunk, monkeypatch)
+        manifest, blob = readLegacyProject(str(path))
+
+        assert [layer.get('blob') for layer in manifest['layers']] == [None, 0, None]
+        assert [tile['blob'] for tile in manifest['layers'][2]['tiles']] == [1, 2]
+        assert (blob(0), blob(1), blob(2)) == (FIRST, SECOND, FIRST)
+        assert embedBlobs(manifest, blob) == expected
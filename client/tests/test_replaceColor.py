@@ -0,0 +1,58 @@
+import numpy as np
+from floodFill import similarColors
+from tiledBitmap import TiledBitmap, TILE_SIZE
+
+
+RED = 0xFFFF0000
+GREEN = 0xFF00FF00
+
+
+def test_similarColorsPerChannel():
+    color = 0x80402010
+    pixels = np.array([0x80402010, 0x84402010, 0x80462010, 0x80402610, 0x80402016, 0x7C3C1C0C], dtype=np.uint32)
+
+    assert list(similarColors(pixels, color, 0)) == [True, False, False, False, False, False]
+    assert list(similarColors(pixels, color, 4)) == [True, True, False, False, False, True]
+    assert similarColors(pixels, color, 6).all()
+
+
+def test_similarColorsByteOrder():
+    color = 0x80402010
+    pixels = np.array([0x80402010, 0x80402014, 0x84402010, 0x10204080], dtype=np.uint32)
+    expected = list(similarColors(pixels, color, 4))
+
+    assert expected == [True, True, True, False]
+    for dtype in ('<u4', '>u4'):
+        assert list(similarColors(pixels.astype(dtype), color, 4)) == expected
+
+
+def test_similarColorsNonContiguous():
+    pixels = np.arange(64, dtype=np.uint32).reshape(8, 8) | 0xFF000000
+    view = pixels[1::2, ::3]
+
+    assert (similarColors(view, 0xFF000000 | 20, 3) == similarColors(view.copy(), 0xFF000000 | 20, 3)).all()
+
+
+def test_replaceColorLeavesOtherTilesUntouched():
+    bitmap = TiledBitmap(TILE_SIZE * 3, TILE_SIZE)
+    bitmap.writeSpan(0, 0, 9, RED)
+    bitmap.writeSpan(0, TILE_SIZE * 2, TILE_SIZE * 2, GREEN)
+    greenKey = bitmap.tiles[(2, 0)].cacheKey()
+
+    assert bitmap.replaceColor(3, 0, GREEN, 0) == (0, 0, 9, 0)
+    assert set(bitmap.tiles) == {(0, 0), (2, 0)}
+    assert bitmap.tiles[(2, 0)].cacheKey() == greenKey
+
+
+def test_replaceTransparentWithinTolerance():
+    bitmap = TiledBitmap(TILE_SIZE * 2 + 5, TILE_SIZE)
+    bitmap.writeSpan(0, 0, 0, 0x02000000)
+
+    # Прозрачный цвет в допуске, новый цвет тоже прозрачный: пустые плитки не создаются
+    assert bitmap.replaceColor(0, 0, 0, 4) == (0, 0, 0, 0)
+    assert set(bitmap.tiles) == {(0, 0)}
+
+    # Новый цвет непрозрачный: пустые плитки заливаются в пределах холста
+    assert bitmap.replaceColor(TILE_SIZE, 0, RED, 4) == (0, 0, TILE_SIZE * 2 + 4, TILE_SIZE - 1)
+    assert len(bitmap.tiles) == 3
+    assert (bitmap.readRegion(0, 0, bitmap.width, bitmap.height) == RED).all()
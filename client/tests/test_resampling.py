@@ -0,0 +1,48 @@
+import threading
+import time
+from PyQt5.QtCore import QRect
+from PyQt5.QtGui import QColor
+from resampling import ResizeJob
+from tiledBitmap import TiledBitmap, TILE_SIZE
+
+
+RED = 0xFFFF0000
+
+
+def paintRed(bitmap: TiledBitmap) -> None:
+    bitmap.paint(bitmap.rect(), lambda qp: qp.fillRect(bitmap.rect(), QColor(255, 0, 0)))
+
+
+def test_snapshotKeepsTiles(application):
+    bitmap = TiledBitmap(TILE_SIZE + 10, TILE_SIZE)
+    paintRed(bitmap)
+    snapshot = bitmap.snapshot()
+
+    bitmap.paint(QRect(0, 0, 20, 20), lambda qp: qp.fillRect(0, 0, 20, 20, QColor(0, 0, 255)))
+    assert bitmap.pixel(5, 5) != RED
+    assert (snapshot.readRegion(0, 0, snapshot.width, snapshot.height) == RED).all()
+
+
+def test_cancelDoesNotWaitForRunningTiles(application, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    scaledTile = TiledBitmap.scaledTile
+
+    def slowScaledTile(self, bitmap, key, quality):
+        started.set()
+        release.wait(5)
+        return scaledTile(self, bitmap, key, quality)
+
+    monkeypatch.setattr(TiledBitmap, 'scaledTile', slowScaledTile)
+    bitmap = TiledBitmap(TILE_SIZE * 2, TILE_SIZE * 2)
+    paintRed(bitmap)
+    job = ResizeJob([bitmap], TILE_SIZE * 3, TILE_SIZE * 3, True, 'smth', workers=1)
+    assert started.wait(5)
+
+    start = time.perf_counter()
+    job.cancel()
+    assert time.perf_counter() - start < 1
+    assert job.bitmaps == [] and job.futures == dict()
+
+    # Отменённая задача дорабатывает по снимку, пока само хранилище изменяется
+    bitmap.paint(bitmap.rect(), lambda qp: qp.fillRect(bitmap.rect(), QColor(0, 0, 255)))
+    release.set()
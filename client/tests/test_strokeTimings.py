@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+from PyQt5.QtCore import QEvent, QPointF, Qt
+from PyQt5.QtGui import QColor, QMouseEvent
+from PyQt5.QtTest import QTest
+from bitmapLayer import BitmapLayer
+from strokeSession import FRAME_INTERVAL
+
+
+def mouseEvent(kind, x, y):
+    buttons = Qt.NoButton if kind == QEvent.MouseButtonRelease else Qt.LeftButton
+    return QMouseEvent(kind, QPointF(x, y), Qt.LeftButton, buttons, Qt.NoModifier)
+
+
+def test_strokeTimings(application):
+    pushed = []
+    parent = SimpleNamespace(history=SimpleNamespace(pushTiles=lambda layer, tiles: pushed.append(tiles)))
+    layer = BitmapLayer(1024, 768, parent)
+    layer.active = True
+    layer.updateState(QColor(255, 0, 0), 8, 'brsh', 0, True)
+
+    layer.mousePressEvent(mouseEvent(QEvent.MouseButtonPress, 10, 10))
+    for i in range(5):
+        layer.mouseMoveEvent(mouseEvent(QEvent.MouseMove, 20 + 10 * i, 20))
+    QTest.qWait(FRAME_INTERVAL * 4)
+    for i in range(3):
+        layer.mouseMoveEvent(mouseEvent(QEvent.MouseMove, 300 + 10 * i, 300))
+    layer.mouseReleaseEvent(mouseEvent(QEvent.MouseButtonRelease, 320, 300))
+
+    timings = layer.lastStrokeTimings
+    assert timings['events'] == 8
+    assert timings['frames'] == 2
+    assert timings['drawTime'] > 0 and timings['maxFrameTime'] > 0 and timings['maxLatency'] > 0
+    assert timings['duration'] >= timings['drawTime']
+    assert len(pushed) == 1 and layer.stroke is None